@@ -0,0 +1,148 @@
+"""
+Native async versions of the read-heavy lookup views for ASGI deployments.
+
+DRF's @api_view is synchronous, so these are plain Django async views that
+authenticate the JWT, throttle and serialize on their own while returning
+the same payloads as their counterparts in base.views.
+"""
+import asyncio
+import functools
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from rest_framework import exceptions, status
+from rest_framework_simplejwt.authentication import AUTH_HEADER_TYPES
+from .authentication import CachedJWTAuthentication, aget_cached_user, check_user, token_user_id
+from .caching import (
+    aget_or_compute,
+    not_modified,
+    phone_generation_key,
+    weak_etag,
+    with_etag,
+)
+from .models import User
+from .phones import normalize_phone_number
+from .directory import ranked_names
+from .lookups import (
+    aperson_detail_etag,
+    asaved_by,
+    person_detail_payload,
+    person_detail_query,
+    with_visible_email,
+)
+from .spam import aspam_likelihoods
+from .views import CustomUserRateThrottle
+
+
+async def authenticate(request):
+    """
+    Async equivalent of CachedJWTAuthentication.authenticate: validates the
+    token in-process and resolves the user from the cache or the async ORM.
+    """
+    authentication = CachedJWTAuthentication()
+    header = authentication.get_header(request)
+    if header is None:
+        return None
+    raw_token = authentication.get_raw_token(header)
+    if raw_token is None:
+        return None
+    validated_token = authentication.get_validated_token(raw_token)
+    return check_user(await aget_cached_user(token_user_id(validated_token)), validated_token)
+
+
+async def throttle(request):
+    throttle = CustomUserRateThrottle()
+    allowed = await sync_to_async(throttle.allow_request, thread_sensitive=False)(request, None)
+    if not allowed:
+        raise exceptions.Throttled(throttle.wait())
+
+
+def async_lookup_view(view):
+    """
+    Wrap an async GET view with IsAuthenticated and CustomUserRateThrottle,
+    rendering DRF exceptions the way DRF would.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            if request.method != "GET":
+                raise exceptions.MethodNotAllowed(request.method)
+            request.user = await authenticate(request)
+            if request.user is None:
+                raise exceptions.NotAuthenticated()
+            await throttle(request)
+        except exceptions.APIException as exc:
+            detail = exc.detail if isinstance(exc.detail, (dict, list)) else {"detail": exc.detail}
+            response = JsonResponse(detail, status=exc.status_code, safe=False)
+            if exc.status_code == status.HTTP_401_UNAUTHORIZED:
+                response["WWW-Authenticate"] = f'{AUTH_HEADER_TYPES[0]} realm="api"'
+            if isinstance(exc, exceptions.Throttled) and exc.wait is not None:
+                response["Retry-After"] = str(int(exc.wait))
+            return response
+        return await view(request, *args, **kwargs)
+
+    return wrapper
+
+
+@async_lookup_view
+async def search_by_phone(request):
+    phone_query = request.GET.get("query", "").strip()
+    if not phone_query:
+        return JsonResponse(
+            {"error": "Query parameter is required."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    phone_key = normalize_phone_number(phone_query)
+
+    async def compute(depend):
+        user, likelihoods = await asyncio.gather(
+            User.objects.filter(phone_key=phone_key).afirst(),
+            aspam_likelihoods([phone_key]),
+        )
+
+        if user:
+            # Shared by all callers; with_visible_email drops the email for
+            # callers the user has not saved.
+            return {
+                "user_id": user.pk,
+                "name": user.username,
+                "phone_number": user.phone_number,
+                "spam_likelihood": likelihoods[phone_key],
+                "email": user.email,
+                "is_registered_user": True,
+            }
+
+        # If no registered user found, list the names the number is saved
+        # under, most saved first
+        return [
+            {
+                "name": name,
+                "phone_number": phone_key,
+                "spam_likelihood": likelihoods[phone_key],
+                "email": None,
+                "is_registered_user": False,
+            }
+            async for name in ranked_names(phone_key)
+        ]
+
+    cache_key = f"search_phone_{phone_key}"
+    data, version = await aget_or_compute(cache_key, [phone_generation_key(phone_key)], compute)
+    saved_by_version = None
+    if isinstance(data, dict):
+        # Email visible only if searching user is in user's contacts
+        owner_ids, saved_by_version = await asaved_by(request.user.phone_key)
+        data = with_visible_email(data, owner_ids)
+    etag = weak_etag(cache_key, version, request.user.pk, saved_by_version)
+    return not_modified(request, etag) or with_etag(JsonResponse(data, safe=False), etag)
+
+
+@async_lookup_view
+async def person_detail(request, phone_number):
+    phone_key = normalize_phone_number(phone_number)
+    etag = await aperson_detail_etag(phone_key, request.user)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    row = await person_detail_query(phone_key, request.user).afirst()
+    data = person_detail_payload(phone_number, phone_key, row)
+    return with_etag(JsonResponse(data), etag)
@@ -0,0 +1,181 @@
+"""
+JWT authentication that resolves the user from a cache instead of querying
+base_user on every request.
+
+A user's cached fields live in a short-lived per-process dict and in the
+shared cache. The shared entry is tagged with the user's auth version, a
+generation bumped after every committed save or delete of the user, so a
+password change or deactivation invalidates it for every worker at once.
+The per-process copy may lag by up to AUTH_USER_LOCAL_CACHE_TIMEOUT.
+"""
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from .caching import acurrent_generations, bump_generations_on_commit, current_generations
+from .metrics import record_cache
+from .models import User
+
+# Fields restored on cache hits; the rest are deferred and load on access.
+CACHED_USER_FIELDS = [
+    field.attname
+    for field in User._meta.concrete_fields
+    if field.attname in {
+        "id", "username", "email", "phone_number", "phone_key",
+        "is_active", "is_staff", "is_superuser",
+    }
+]
+
+# Entries kept per process before the dict is cleared.
+LOCAL_CACHE_SIZE = 10000
+
+_local_users = {}
+
+
+def auth_version_key(user_id):
+    return f"gen_auth_{user_id}"
+
+
+def user_cache_key(user_id):
+    return f"auth_user_{user_id}"
+
+
+def invalidate_cached_user(user_id):
+    """
+    Drop the cached user in this process now and everywhere once the
+    surrounding transaction commits.
+    """
+    _local_users.pop(user_id, None)
+    bump_generations_on_commit([auth_version_key(user_id)])
+
+
+def _user_rows(user_id):
+    return User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).values_list(
+        *CACHED_USER_FIELDS, "password"
+    )
+
+
+def _entry(row):
+    # The password hash itself is never cached, only the fingerprint
+    # simplejwt compares against the token's revoke claim.
+    *values, password = row
+    return tuple(values), get_md5_hash_password(password)
+
+
+def _valid_entry(cached, user_id):
+    stored = cached.get(user_cache_key(user_id))
+    if stored is None:
+        return None
+    version, entry = stored
+    return entry if cached.get(auth_version_key(user_id)) == version else None
+
+
+def _store(user_id, version, entry):
+    cache.set(
+        user_cache_key(user_id),
+        (version, entry),
+        timeout=getattr(settings, "AUTH_USER_CACHE_TIMEOUT", 300),
+    )
+
+
+def _remember(user_id, entry):
+    if len(_local_users) >= LOCAL_CACHE_SIZE:
+        _local_users.clear()
+    expires_at = time.monotonic() + getattr(settings, "AUTH_USER_LOCAL_CACHE_TIMEOUT", 5)
+    _local_users[user_id] = (expires_at, entry)
+
+
+def _local_entry(user_id):
+    local = _local_users.get(user_id)
+    if local is not None and local[0] > time.monotonic():
+        return local[1]
+    return None
+
+
+def _build(entry):
+    values, password_fingerprint = entry
+    return User.from_db(DEFAULT_DB_ALIAS, CACHED_USER_FIELDS, values), password_fingerprint
+
+
+def get_cached_user(user_id):
+    """
+    Return (user, password_fingerprint) for `user_id`, or None if there is
+    no such user. The user is a User instance with only CACHED_USER_FIELDS
+    loaded.
+    """
+    entry = _local_entry(user_id)
+    if entry is None:
+        version_key = auth_version_key(user_id)
+        entry = _valid_entry(cache.get_many([version_key, user_cache_key(user_id)]), user_id)
+        record_cache(user_cache_key(user_id), entry is not None)
+        if entry is None:
+            # Read the version before the row so that a save committing in
+            # between leaves what is stored here already invalidated.
+            version = current_generations([version_key])[version_key]
+            row = _user_rows(user_id).first()
+            if row is None:
+                return None
+            entry = _entry(row)
+            _store(user_id, version, entry)
+        _remember(user_id, entry)
+    return _build(entry)
+
+
+async def aget_cached_user(user_id):
+    entry = _local_entry(user_id)
+    if entry is None:
+        version_key = auth_version_key(user_id)
+        entry = _valid_entry(await cache.aget_many([version_key, user_cache_key(user_id)]), user_id)
+        record_cache(user_cache_key(user_id), entry is not None)
+        if entry is None:
+            version = (await acurrent_generations([version_key]))[version_key]
+            row = await _user_rows(user_id).afirst()
+            if row is None:
+                return None
+            entry = _entry(row)
+            await cache.aset(
+                user_cache_key(user_id),
+                (version, entry),
+                timeout=getattr(settings, "AUTH_USER_CACHE_TIMEOUT", 300),
+            )
+        _remember(user_id, entry)
+    return _build(entry)
+
+
+def token_user_id(validated_token):
+    try:
+        return validated_token[api_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken(_("Token contained no recognizable user identification"))
+
+
+def check_user(resolved, validated_token):
+    """
+    Apply JWTAuthentication.get_user's checks to a resolved user.
+    """
+    if resolved is None:
+        raise AuthenticationFailed(_("User not found"), code="user_not_found")
+    user, password_fingerprint = resolved
+    if not user.is_active:
+        raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+    if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+        api_settings.REVOKE_TOKEN_CLAIM
+    ) != password_fingerprint:
+        raise AuthenticationFailed(
+            _("The user's password has been changed."), code="password_changed"
+        )
+    return user
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that makes no database query when the user is cached.
+    """
+
+    def get_user(self, validated_token):
+        return check_user(get_cached_user(token_user_id(validated_token)), validated_token)
@@ -0,0 +1,201 @@
+import threading
+import time
+from bisect import bisect_left
+from django.conf import settings
+from django.db import connections
+from .models import User, ContactName, NameTrigram
+
+
+def _key(name, phone_number):
+    return (name.lower(), name, phone_number)
+
+
+def _insert(keys, key):
+    position = bisect_left(keys, key)
+    if position == len(keys) or keys[position] != key:
+        keys.insert(position, key)
+
+
+def _delete(keys, key):
+    position = bisect_left(keys, key)
+    if position < len(keys) and keys[position] == key:
+        del keys[position]
+
+
+class PrefixIndex:
+    """
+    In-process prefix index over user names and the names contacts are
+    saved under.
+
+    Each source keeps a sorted list of (lowercased name, name, phone number)
+    keys, so a prefix lookup is a binary search followed by a scan of at
+    most `limit` keys. Contact names come from the ContactName directory, so
+    a name saved for a number by many owners is held once. Each source holds
+    at most AUTOCOMPLETE_INDEX_MAX_NAMES keys: the first registered users
+    and the most saved contact names, read through indexes rather than by
+    scanning the tables.
+
+    The index is built by the first search, updated in place by the
+    save/delete signals of this process and rebuilt after
+    AUTOCOMPLETE_INDEX_MAX_AGE seconds to pick up writes made by other
+    workers. Rebuilds run in a background thread, one at a time, while
+    searches keep using the old index; signal updates received meanwhile
+    are replayed onto the new one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._keys = {NameTrigram.USER: [], NameTrigram.CONTACT: []}
+        # User id -> key, to find a renamed or deleted user's key
+        self._users = {}
+        self._built_at = None
+        # Signal updates received while a build reads the tables
+        self._pending = None
+
+    @property
+    def max_age(self):
+        return getattr(settings, "AUTOCOMPLETE_INDEX_MAX_AGE", 300)
+
+    @property
+    def max_names(self):
+        return getattr(settings, "AUTOCOMPLETE_INDEX_MAX_NAMES", 200_000)
+
+    def build(self):
+        with self._build_lock:
+            self._build()
+
+    def _build(self):
+        with self._lock:
+            self._pending = []
+        try:
+            keys, users = self._read()
+        except BaseException:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            self._keys = keys
+            self._users = users
+            self._built_at = time.monotonic()
+            # Every change is idempotent, so replaying one the build already
+            # read is harmless.
+            for change in self._pending:
+                change()
+            self._pending = None
+
+    def _read(self):
+        users = {
+            user_id: _key(username, phone_number)
+            for user_id, username, phone_number in User.objects.order_by("pk")
+            .values_list("pk", "username", "phone_number")[:self.max_names]
+            .iterator(chunk_size=2000)
+        }
+        contact_names = (
+            ContactName.objects.order_by("-saved_count")
+            .values_list("name", "phone_key")[:self.max_names]
+        )
+        keys = {
+            NameTrigram.USER: sorted(users.values()),
+            NameTrigram.CONTACT: sorted(
+                {_key(name, phone_key) for name, phone_key in contact_names.iterator(chunk_size=2000)}
+            ),
+        }
+        return keys, users
+
+    def _rebuild_in_background(self):
+        if not self._build_lock.acquire(blocking=False):
+            return  # Another thread is already rebuilding.
+
+        def run():
+            try:
+                self._build()
+            finally:
+                self._build_lock.release()
+                connections.close_all()
+
+        threading.Thread(target=run, name="autocomplete-index", daemon=True).start()
+
+    def _ensure_built(self):
+        if self._built_at is None:
+            with self._build_lock:
+                # Concurrent first searches wait for a single build.
+                if self._built_at is None:
+                    self._build()
+        elif time.monotonic() - self._built_at > self.max_age:
+            self._rebuild_in_background()
+
+    def _apply(self, change):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(change)
+            if self._built_at is not None:
+                change()
+
+    def add_user(self, user_id, username, phone_number):
+        self._apply(lambda: self._add_user(user_id, username, phone_number))
+
+    def _add_user(self, user_id, username, phone_number):
+        self._discard_user(user_id)
+        key = self._users[user_id] = _key(username, phone_number)
+        _insert(self._keys[NameTrigram.USER], key)
+
+    def remove_user(self, user_id):
+        self._apply(lambda: self._discard_user(user_id))
+
+    def _discard_user(self, user_id):
+        key = self._users.pop(user_id, None)
+        if key is not None:
+            _delete(self._keys[NameTrigram.USER], key)
+
+    def add_contact_name(self, name, phone_key):
+        """
+        Index `name` for `phone_key` after a contact was saved under it.
+        Until the next rebuild the index may exceed its size bound.
+        """
+        key = _key(name, phone_key)
+        self._apply(lambda: _insert(self._keys[NameTrigram.CONTACT], key))
+
+    def remove_contact_name(self, name, phone_key):
+        """
+        Drop `name` for `phone_key` once no contact is saved under it.
+        """
+        key = _key(name, phone_key)
+        self._apply(lambda: _delete(self._keys[NameTrigram.CONTACT], key))
+
+    def _scan(self, source, prefix, limit, seen):
+        keys = self._keys[source]
+        position = bisect_left(keys, (prefix,))
+        matches = []
+        while position < len(keys) and len(matches) < limit:
+            key, name, phone_number = keys[position]
+            if not key.startswith(prefix):
+                break
+            position += 1
+            if (name, phone_number) not in seen:
+                seen.add((name, phone_number))
+                matches.append((name, phone_number))
+        return matches
+
+    def search(self, prefix, limit=10):
+        """
+        Return up to `limit` distinct name/phone number matches whose name
+        starts with `prefix`: registered users first, then contacts, each
+        ordered by name. Contact matches carry the canonical phone key.
+        """
+        self._ensure_built()
+        prefix = prefix.lower()
+        seen = set()
+        with self._lock:
+            users = self._scan(NameTrigram.USER, prefix, limit, seen)
+            contacts = self._scan(NameTrigram.CONTACT, prefix, limit - len(users), seen)
+        return [
+            {"name": name, "phone_number": phone_number, "is_registered_user": True}
+            for name, phone_number in users
+        ] + [
+            {"name": name, "phone_number": phone_number, "is_registered_user": False}
+            for name, phone_number in contacts
+        ]
+
+
+prefix_index = PrefixIndex()
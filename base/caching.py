@@ -0,0 +1,336 @@
+import asyncio
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from .metrics import record_cache
+from .routers import reading_from_primary
+from .search import name_trigrams
+
+# Short queries depend on every name write instead of on their own grams.
+ANY_NAME = "*"
+# Every name search depends on contact imports, which bump this instead of
+# the grams of each imported name.
+IMPORTED_NAMES = "imported"
+
+# Returned by get_versioned on a miss; cached empty results are stored as
+# NEGATIVE so they are told apart from a missing entry.
+MISS = object()
+NEGATIVE = "__negative__"
+
+# Fraction of an entry's lifetime during which one reader refreshes it.
+REFRESH_AHEAD = 0.1
+# A computation normally finishes well within LOCK_WAIT; waiters poll at
+# intervals growing from LOCK_POLL_INTERVAL to LOCK_POLL_MAX_INTERVAL.
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 1
+LOCK_POLL_INTERVAL = 0.005
+LOCK_POLL_MAX_INTERVAL = 0.05
+
+
+def search_cache_timeout():
+    return getattr(settings, "SEARCH_CACHE_TIMEOUT", 300)
+
+
+def generation_timeout():
+    # An expired generation restarts at a new value, which only invalidates
+    # entries early, so it need not outlive them by much; this keeps one
+    # key per number ever looked up from piling up in the cache.
+    return 2 * search_cache_timeout()
+
+
+def key_digest(text):
+    """
+    Cache key part for user-supplied text such as names and queries, which
+    may hold spaces or control characters and be too long for memcached.
+    """
+    return hashlib.md5(text.encode(), usedforsecurity=False).hexdigest()
+
+
+def phone_generation_key(phone_key):
+    return f"gen_phone_{phone_key}"
+
+
+def name_generation_key(gram):
+    return f"gen_name_{key_digest(gram)}"
+
+
+def name_generation_keys(text):
+    """
+    Generation keys a name search for `text` depends on. Any name containing
+    `text` contains all of its trigrams, so bumping the trigrams of a saved
+    name invalidates every search that could now match it.
+    """
+    grams = sorted(name_trigrams(text))
+    if not grams:
+        return [name_generation_key(ANY_NAME)]
+    return [name_generation_key(gram) for gram in grams] + [name_generation_key(IMPORTED_NAMES)]
+
+
+def name_write_generation_keys(name):
+    return [name_generation_key(gram) for gram in sorted(name_trigrams(name))] + [
+        name_generation_key(ANY_NAME)
+    ]
+
+
+def import_generation_keys(phone_keys):
+    """
+    Generation keys to bump after a bulk import saved names for
+    `phone_keys`: a fixed number of name keys rather than every trigram of
+    every imported name.
+    """
+    return [name_generation_key(ANY_NAME), name_generation_key(IMPORTED_NAMES)] + [
+        phone_generation_key(phone_key) for phone_key in phone_keys
+    ]
+
+
+def search_name_cache_key(query):
+    return f"search_name_{key_digest(query.lower())}"
+
+
+def _new_generation():
+    return time.time_ns()
+
+
+def current_generations(keys):
+    """
+    Return {key: generation} for `keys`, starting missing generations at the
+    current time so an evicted or expired counter never repeats an old
+    value. Takes at most three cache round trips whatever the number of
+    keys.
+    """
+    generations = cache.get_many(keys)
+    missing = [key for key in keys if key not in generations]
+    if missing:
+        # Racing starters only overwrite each other's fresh values, which
+        # at worst invalidates an entry early; read back whichever won.
+        cache.set_many(dict.fromkeys(missing, _new_generation()), timeout=generation_timeout())
+        generations.update(cache.get_many(missing))
+    return generations
+
+
+async def acurrent_generations(keys):
+    generations = await cache.aget_many(keys)
+    missing = [key for key in keys if key not in generations]
+    if missing:
+        await cache.aset_many(dict.fromkeys(missing, _new_generation()), timeout=generation_timeout())
+        generations.update(await cache.aget_many(missing))
+    return generations
+
+
+def bump_generations(keys):
+    """
+    Invalidate every entry stored under `keys` in one cache round trip.
+    Any new value invalidates, so a fresh one replaces an increment, which
+    would take a round trip per key.
+    """
+    keys = set(keys)
+    if keys:
+        cache.set_many(dict.fromkeys(keys, _new_generation()), timeout=generation_timeout())
+
+
+def bump_generations_on_commit(keys):
+    """
+    Invalidate after the surrounding transaction commits, so a concurrent
+    reader cannot cache pre-commit data under the new generation.
+    """
+    keys = list(keys)
+    transaction.on_commit(lambda: bump_generations(keys))
+
+
+def get_versioned(cache_key):
+    """
+    Return the cached payload for `cache_key`, or MISS when it is missing or
+    any generation it was stored under has been bumped since. Cached
+    negative results come back as an empty list.
+
+    The version of a payload, as returned by get_or_compute, is
+    the refresh time it was stored with: every computation stores a new one
+    and every reader of the same entry sees the same one.
+    """
+    entry = _read_entry(cache_key)
+    return MISS if entry is None else entry[0]
+
+
+def _entry(payload, generations):
+    timeout = search_cache_timeout()
+    if payload == []:
+        payload = NEGATIVE
+        timeout = getattr(settings, "SEARCH_NEGATIVE_CACHE_TIMEOUT", timeout)
+    refresh_at = time.time() + timeout * (1 - REFRESH_AHEAD)
+    return (generations, payload, refresh_at), timeout
+
+
+def set_versioned(cache_key, payload, generations):
+    entry, timeout = _entry(payload, generations)
+    cache.set(cache_key, entry, timeout=timeout)
+    return entry[2]
+
+
+def _read_entry(cache_key):
+    entry = cache.get(cache_key)
+    if entry is None:
+        return None
+    generations, payload, refresh_at = entry
+    if cache.get_many(list(generations)) != generations:
+        return None
+    return ([] if payload == NEGATIVE else payload), refresh_at
+
+
+async def _aread_entry(cache_key):
+    entry = await cache.aget(cache_key)
+    if entry is None:
+        return None
+    generations, payload, refresh_at = entry
+    if await cache.aget_many(list(generations)) != generations:
+        return None
+    return ([] if payload == NEGATIVE else payload), refresh_at
+
+
+def _acquire(lock_key):
+    return cache.add(lock_key, 1, timeout=LOCK_TIMEOUT)
+
+
+def _wait_for_entry(cache_key, lock_key):
+    """
+    Wait for the request holding `lock_key` to store `cache_key`. Returns
+    (entry, locked): the entry once it appears, or None with locked=True if
+    the lock was released without a usable entry (the computation failed or
+    a write invalidated it) and this request took it over.
+    """
+    deadline = time.monotonic() + LOCK_WAIT
+    interval = LOCK_POLL_INTERVAL
+    while time.monotonic() < deadline:
+        time.sleep(interval)
+        interval = min(interval * 2, LOCK_POLL_MAX_INTERVAL)
+        entry = _read_entry(cache_key)
+        if entry is not None:
+            return entry, False
+        if _acquire(lock_key):
+            return None, True
+    # The lock holder is slow or gone; compute without it.
+    return None, False
+
+
+async def _await_entry(cache_key, lock_key):
+    deadline = time.monotonic() + LOCK_WAIT
+    interval = LOCK_POLL_INTERVAL
+    while time.monotonic() < deadline:
+        await asyncio.sleep(interval)
+        interval = min(interval * 2, LOCK_POLL_MAX_INTERVAL)
+        entry = await _aread_entry(cache_key)
+        if entry is not None:
+            return entry, False
+        if await cache.aadd(lock_key, 1, timeout=LOCK_TIMEOUT):
+            return None, True
+    return None, False
+
+
+def get_or_compute(cache_key, generation_keys, compute):
+    """
+    Serve `cache_key` from the cache, computing it at most once at a time.
+
+    `compute(depend)` builds the payload; it may call `depend(keys)` to add
+    generation keys discovered along the way. Concurrent misses wait for the
+    request holding the lock instead of hitting the database themselves,
+    taking over as soon as it releases the lock without a result, and
+    an entry read during the last REFRESH_AHEAD of its lifetime is refreshed
+    by one request while the others keep serving it. `compute` reads from
+    the primary database even in views routed to a read replica.
+
+    Returns (payload, version); see get_versioned.
+    """
+    lock_key = f"lock_{cache_key}"
+    entry = _read_entry(cache_key)
+    record_cache(cache_key, entry is not None)
+    if entry is not None:
+        if time.time() < entry[1]:
+            return entry
+        locked = _acquire(lock_key)
+        if not locked:
+            return entry
+    else:
+        locked = _acquire(lock_key)
+        if not locked:
+            entry, locked = _wait_for_entry(cache_key, lock_key)
+            if entry is not None:
+                return entry
+
+    try:
+        generations = current_generations(generation_keys)
+        # Never cache what a lagging replica returned; see base.routers.
+        with reading_from_primary():
+            payload = compute(lambda keys: generations.update(current_generations(keys)))
+        version = set_versioned(cache_key, payload, generations)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return payload, version
+
+
+async def aget_or_compute(cache_key, generation_keys, compute):
+    """
+    Async get_or_compute for the ASGI views. `compute(depend)` is a
+    coroutine function and `depend(keys)` must be awaited.
+    """
+    lock_key = f"lock_{cache_key}"
+    entry = await _aread_entry(cache_key)
+    record_cache(cache_key, entry is not None)
+    if entry is not None:
+        if time.time() < entry[1]:
+            return entry
+        locked = await cache.aadd(lock_key, 1, timeout=LOCK_TIMEOUT)
+        if not locked:
+            return entry
+    else:
+        locked = await cache.aadd(lock_key, 1, timeout=LOCK_TIMEOUT)
+        if not locked:
+            entry, locked = await _await_entry(cache_key, lock_key)
+            if entry is not None:
+                return entry
+
+    try:
+        generations = await acurrent_generations(generation_keys)
+
+        async def depend(keys):
+            generations.update(await acurrent_generations(keys))
+
+        with reading_from_primary():
+            payload = await compute(depend)
+        entry, timeout = _entry(payload, generations)
+        await cache.aset(cache_key, entry, timeout=timeout)
+    finally:
+        if locked:
+            await cache.adelete(lock_key)
+    return payload, entry[2]
+
+
+def weak_etag(*parts):
+    """
+    Weak ETag for a response identified by `parts`, e.g. a cache key, the
+    payload version and the viewer.
+    """
+    digest = hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+    return f'W/"{digest}"'
+
+
+def not_modified(request, etag):
+    """
+    Return a 304 response if the request's If-None-Match matches `etag`,
+    otherwise None.
+    """
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        with_etag(response, etag)
+    return response
+
+
+def with_etag(response, etag):
+    # Responses depend on the token's user, so only the client may reuse
+    # them, and only after revalidating.
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ["Authorization"])
+    return response
@@ -0,0 +1,161 @@
+"""
+Row generators for the generate_dataset command.
+
+Everything here is plain Python so the command's worker processes never
+touch Django or the database: they build rows and hand them back to the
+parent process, which loads them. Names, contact numbers and spam numbers
+are drawn from Zipf distributions so a few names and numbers are very
+common, like in real address books and spam traffic.
+"""
+import bisect
+import datetime
+import itertools
+import math
+import random
+
+# Number ranges (+91 then ten digits) for each kind of generated number
+USER_PREFIX = "+919"
+CONTACT_PREFIX = "+918"
+SPAM_PREFIX = "+917"
+NUMBER_SPACE = 10 ** 9
+
+# Names people save spam callers under
+SPAM_CONTACT_NAMES = ["Spam", "Telemarketer", "Loan Offer", "Credit Card", "Fraud", "Do Not Pick"]
+
+# Share of contact entries that point to a registered user, and to a spam number
+REGISTERED_CONTACT_SHARE = 0.3
+SPAM_CONTACT_SHARE = 0.05
+
+# Share of users with an email address
+EMAIL_SHARE = 0.7
+
+# Generated spam reports are spread over this many days before now
+SPAM_REPORT_DAYS = 30
+
+_pools = None
+
+
+def zipf_cum_weights(size, exponent=1.1):
+    return list(itertools.accumulate(1 / (rank + 1) ** exponent for rank in range(size)))
+
+
+def zipf_choice(rng, cum_weights):
+    return bisect.bisect(cum_weights, rng.random() * cum_weights[-1])
+
+
+def scattered_number(prefix, rank):
+    # A bijection on [0, NUMBER_SPACE) so popular numbers are not adjacent.
+    return f"{prefix}{(rank * 7919 + 104729) % NUMBER_SPACE:09d}"
+
+
+def user_number(index):
+    return f"{USER_PREFIX}{index:09d}"
+
+
+def init_worker(pools):
+    """
+    Pool initializer: the name and number pools built once by the parent.
+    """
+    global _pools
+    _pools = pools
+
+
+def build_pools(faker, users, contacts_per_user, spam_reports, pool_size=1000):
+    """
+    Return the shared pools: unique first and last names from `faker`, and
+    the sizes and Zipf weights of the contact and spam number pools.
+    """
+    first_names = sorted({faker.first_name() for _ in range(pool_size * 3)})
+    last_names = sorted({faker.last_name() for _ in range(pool_size * 3)})
+    random.Random(0).shuffle(first_names)
+    random.Random(1).shuffle(last_names)
+    contact_numbers = max(1000, users * contacts_per_user // 4)
+    spam_numbers = max(100, spam_reports // 50)
+    return {
+        "first_names": first_names,
+        "first_weights": zipf_cum_weights(len(first_names)),
+        "last_names": last_names,
+        "last_weights": zipf_cum_weights(len(last_names)),
+        "contact_weights": zipf_cum_weights(contact_numbers, 0.9),
+        "spam_weights": zipf_cum_weights(spam_numbers, 1.2),
+    }
+
+
+def _name(rng):
+    first = _pools["first_names"][zipf_choice(rng, _pools["first_weights"])]
+    last = _pools["last_names"][zipf_choice(rng, _pools["last_weights"])]
+    return first, last
+
+
+def user_rows(task):
+    """
+    Rows for base_user, for user indexes [start, start + count).
+    """
+    start, count, seed, password, joined_at = task
+    rng = random.Random(seed)
+    rows = []
+    for index in range(start, start + count):
+        first, last = _name(rng)
+        username = f"{first}.{last}{index}".lower().replace(" ", "")
+        email = f"{username}@example.com" if rng.random() < EMAIL_SHARE else None
+        rows.append((
+            password, False, username, first, last, False, True, joined_at,
+            user_number(index), user_number(index), email,
+        ))
+    return rows
+
+
+def contact_rows(task):
+    """
+    Rows for base_contact: about `contacts_per_user` contacts, log-normally
+    spread, for each owner id, with no phone number twice per owner.
+    """
+    owner_ids, contacts_per_user, user_start, users, seed = task
+    rng = random.Random(seed)
+    sigma = 0.75
+    mu = math.log(max(contacts_per_user, 1)) - sigma ** 2 / 2
+    rows = []
+    for owner_id in owner_ids:
+        wanted = round(rng.lognormvariate(mu, sigma)) if contacts_per_user else 0
+        seen = set()
+        for _ in range(wanted * 2):
+            if len(seen) >= wanted:
+                break
+            draw = rng.random()
+            if draw < REGISTERED_CONTACT_SHARE:
+                number = user_number(user_start + rng.randrange(users))
+                name = " ".join(_name(rng)) if rng.random() < 0.5 else _name(rng)[0]
+            elif draw < REGISTERED_CONTACT_SHARE + SPAM_CONTACT_SHARE:
+                number = scattered_number(SPAM_PREFIX, zipf_choice(rng, _pools["spam_weights"]))
+                name = rng.choice(SPAM_CONTACT_NAMES)
+            else:
+                number = scattered_number(CONTACT_PREFIX, zipf_choice(rng, _pools["contact_weights"]))
+                name = " ".join(_name(rng)) if rng.random() < 0.7 else _name(rng)[0]
+            if number in seen:
+                continue
+            seen.add(number)
+            rows.append((owner_id, number, number, name))
+    return rows
+
+
+def spam_report_rows(task):
+    """
+    Rows for base_spamreport: `count` reports by reporters drawn uniformly
+    from `reporter_ids` against Zipf-distributed spam numbers, at most one
+    per reporter and number.
+    """
+    reporter_ids, count, now, seed = task
+    rng = random.Random(seed)
+    seen = set()
+    rows = []
+    for _ in range(count * 2):
+        if len(rows) >= count:
+            break
+        reporter_id = rng.choice(reporter_ids)
+        number = scattered_number(SPAM_PREFIX, zipf_choice(rng, _pools["spam_weights"]))
+        if (reporter_id, number) in seen:
+            continue
+        seen.add((reporter_id, number))
+        reported_at = now - datetime.timedelta(seconds=rng.randrange(SPAM_REPORT_DAYS * 86400))
+        rows.append((number, number, reporter_id, reported_at))
+    return rows
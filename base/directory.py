@@ -0,0 +1,70 @@
+"""
+Per-number name directory: the distinct names a phone key is saved under
+across all contact lists, ranked by how many contacts use each name.
+"""
+from collections import Counter
+from django.db import transaction
+from django.db.models import Count, F
+from .models import Contact, ContactName
+from .spam import add_counts
+
+# Names returned per number by phone searches
+NAMES_PER_NUMBER = 50
+
+
+@transaction.atomic
+def update_name_directory(changes):
+    """
+    Apply (phone_key, name, delta) changes, e.g. +1 for a saved contact and
+    -1 for a removed or renamed one. Returns the (phone_key, name) pairs no
+    contact is saved under any more.
+    """
+    totals = Counter()
+    for phone_key, name, delta in changes:
+        totals[(phone_key, name)] += delta
+
+    added = [(phone_key, name, delta) for (phone_key, name), delta in totals.items() if delta > 0]
+    if added:
+        add_counts(ContactName, ["phone_key", "name"], added, count_column="saved_count")
+
+    removed = sorted((key, -delta) for key, delta in totals.items() if delta < 0)
+    for (phone_key, name), delta in removed:
+        # Never below zero, even if the directory missed the contact's save.
+        ContactName.objects.filter(phone_key=phone_key, name=name, saved_count__gte=delta).update(
+            saved_count=F("saved_count") - delta
+        )
+    if not removed:
+        return []
+    emptied = ContactName.objects.filter(
+        phone_key__in={phone_key for (phone_key, _), _ in removed}, saved_count=0
+    )
+    names = list(emptied.values_list("phone_key", "name"))
+    emptied.delete()
+    return names
+
+
+def ranked_names(phone_key):
+    """
+    Names saved for `phone_key`, most saved first.
+    """
+    return (
+        ContactName.objects.filter(phone_key=phone_key)
+        .order_by("-saved_count", "name")
+        .values_list("name", flat=True)[:NAMES_PER_NUMBER]
+    )
+
+
+@transaction.atomic
+def rebuild_name_directory():
+    """
+    Recompute the directory from the Contact table. Returns the number of
+    directory rows written.
+    """
+    ContactName.objects.all().delete()
+    rows = Contact.objects.values("phone_key", "name").annotate(saved_count=Count("id"))
+    entries = [
+        ContactName(phone_key=row["phone_key"], name=row["name"], saved_count=row["saved_count"])
+        for row in rows.iterator(chunk_size=2000)
+    ]
+    ContactName.objects.bulk_create(entries, batch_size=2000)
+    return len(entries)
@@ -0,0 +1,49 @@
+import csv
+import io
+import json
+from django.utils.text import compress_sequence
+
+EXPORT_CHUNK_SIZE = 2000
+CSV_HEADER = ['Name', 'Phone Number']
+
+
+def _batches(rows, size=EXPORT_CHUNK_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def csv_chunks(rows):
+    """
+    Encode (name, phone_number) rows as CSV, one bytes chunk per batch.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    for batch in _batches(rows):
+        writer.writerows(batch)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def ndjson_chunks(rows):
+    """
+    Encode (name, phone_number) rows as newline-delimited JSON objects.
+    """
+    for batch in _batches(rows):
+        yield ''.join(
+            json.dumps({'name': name, 'phone_number': phone_number}) + '\n'
+            for name, phone_number in batch
+        ).encode('utf-8')
+
+
+def gzip_chunks(chunks):
+    return (chunk for chunk in compress_sequence(chunks) if chunk)
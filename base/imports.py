@@ -0,0 +1,133 @@
+import codecs
+import csv
+from django.db import transaction
+from .models import Contact
+from .phones import normalize_phone_number
+from .signals import contacts_imported
+
+IMPORT_CHUNK_SIZE = 1000
+
+NAME_MAX_LENGTH = Contact._meta.get_field('name').max_length
+PHONE_MAX_LENGTH = Contact._meta.get_field('phone_number').max_length
+
+
+class ContactImportError(Exception):
+    """
+    Raised when the upload cannot be decoded or parsed as CSV. `result`
+    holds the counts of the chunks committed before the failure.
+    """
+
+    def __init__(self, message, result):
+        super().__init__(message)
+        self.result = result
+
+
+def iter_csv_rows(file_obj):
+    """
+    Yield the rows of an uploaded CSV file as dicts without reading the
+    whole file into memory. A UTF-8 byte order mark is ignored.
+    """
+    return csv.DictReader(codecs.iterdecode(file_obj, 'utf-8-sig'))
+
+
+def _clean_row(row):
+    name = (row.get('Name') or '').strip()
+    phone_number = (row.get('Phone Number') or '').strip()
+    if not name or not phone_number:
+        return None
+    if len(name) > NAME_MAX_LENGTH or len(phone_number) > PHONE_MAX_LENGTH:
+        return None
+    phone_key = normalize_phone_number(phone_number)
+    if not phone_key:
+        return None
+    return phone_key, name, phone_number
+
+
+@transaction.atomic
+def apply_chunk(owner, rows):
+    """
+    Upsert one chunk of cleaned (phone_key, name, phone_number) rows for
+    `owner`. Later rows win over earlier rows with the same phone key.
+    Returns the chunk's created/updated/skipped counts.
+    """
+    latest = {}
+    for phone_key, name, phone_number in rows:
+        latest[phone_key] = (name, phone_number)
+    skipped = len(rows) - len(latest)
+
+    existing = dict(
+        (phone_key, (name, phone_number))
+        for phone_key, name, phone_number in Contact.objects.filter(
+            owner=owner, phone_key__in=list(latest)
+        ).values_list('phone_key', 'name', 'phone_number')
+    )
+
+    changed = []
+    created = updated = 0
+    for phone_key, entry in latest.items():
+        if phone_key not in existing:
+            created += 1
+        elif existing[phone_key] != entry:
+            updated += 1
+        else:
+            skipped += 1
+            continue
+        changed.append(Contact(owner=owner, phone_key=phone_key, name=entry[0], phone_number=entry[1]))
+
+    if changed:
+        Contact.objects.bulk_create(
+            changed,
+            update_conflicts=True,
+            unique_fields=['owner', 'phone_key'],
+            update_fields=['name', 'phone_number'],
+        )
+        contacts_imported.send(
+            sender=Contact,
+            owner=owner,
+            phone_keys=[contact.phone_key for contact in changed],
+            previous_names={
+                contact.phone_key: existing[contact.phone_key][0]
+                for contact in changed
+                if contact.phone_key in existing
+            },
+        )
+
+    return {'created': created, 'updated': updated, 'skipped': skipped}
+
+
+def import_contacts(owner, rows, chunk_size=IMPORT_CHUNK_SIZE, on_chunk=None):
+    """
+    Import raw CSV row dicts for `owner` in chunked transactions.
+
+    Rows missing a name or phone number, or exceeding the column lengths,
+    count as skipped. `on_chunk`, if given, is called with the running
+    result after every committed chunk. Returns the totals and the
+    per-chunk counts.
+    """
+    result = {'created': 0, 'updated': 0, 'skipped': 0, 'chunks': []}
+
+    def commit(chunk, invalid):
+        counts = apply_chunk(owner, chunk)
+        counts['skipped'] += invalid
+        result['chunks'].append(counts)
+        for key in ('created', 'updated', 'skipped'):
+            result[key] += counts[key]
+        if on_chunk is not None:
+            on_chunk(result)
+
+    chunk, invalid = [], 0
+    try:
+        for row in rows:
+            cleaned = _clean_row(row)
+            if cleaned is None:
+                invalid += 1
+                continue
+            chunk.append(cleaned)
+            if len(chunk) == chunk_size:
+                commit(chunk, invalid)
+                chunk, invalid = [], 0
+    except (UnicodeDecodeError, csv.Error) as exc:
+        raise ContactImportError(str(exc), result) from exc
+    if chunk or invalid:
+        commit(chunk, invalid)
+    return result
@@ -0,0 +1,110 @@
+import datetime
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from .imports import import_contacts, iter_csv_rows, ContactImportError
+from .models import ImportJob
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Return this process's import worker pool, creating it on first use.
+    Jobs still pending when the process exits are not resumed; see
+    fail_stale_jobs.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "IMPORT_JOB_WORKERS", 2),
+                thread_name_prefix="contact-import",
+            )
+    return _executor
+
+
+def shutdown_executor():
+    """
+    Wait for the running imports and cancel the queued ones, which stay
+    pending. The next submitted job starts a new pool.
+    """
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def submit_import_job(owner, uploaded_file):
+    """
+    Persist the upload and queue its import. Returns the ImportJob.
+    """
+    job = ImportJob.objects.create(owner=owner, file=uploaded_file)
+    transaction.on_commit(lambda: get_executor().submit(run_import_job, job.pk))
+    return job
+
+
+def fail_stale_jobs(jobs):
+    """
+    Mark the pending or running jobs among `jobs` that have made no
+    progress for IMPORT_JOB_STALE_SECONDS as failed, so clients stop
+    polling jobs whose worker was restarted. Returns the number marked.
+    """
+    now = timezone.now()
+    cutoff = now - datetime.timedelta(seconds=getattr(settings, "IMPORT_JOB_STALE_SECONDS", 15 * 60))
+    stale = list(jobs.filter(status__in=[ImportJob.PENDING, ImportJob.RUNNING], updated_at__lt=cutoff))
+    for job in stale:
+        job.status = ImportJob.FAILED
+        job.errors = ["The import was interrupted. Upload the file again."]
+        job.finished_at = now
+        job.save(update_fields=["status", "errors", "finished_at", "updated_at"])
+        job.file.delete(save=False)
+    return len(stale)
+
+
+def _save_progress(job, result):
+    job.created_count = result["created"]
+    job.updated_count = result["updated"]
+    job.skipped_count = result["skipped"]
+    job.rows_processed = result["created"] + result["updated"] + result["skipped"]
+    job.save(update_fields=["created_count", "updated_count", "skipped_count", "rows_processed", "updated_at"])
+
+
+def run_import_job(job_id):
+    close_old_connections()
+    try:
+        # A job that was marked failed while it waited is not run.
+        started = ImportJob.objects.filter(pk=job_id, status=ImportJob.PENDING).update(
+            status=ImportJob.RUNNING, started_at=timezone.now(), updated_at=timezone.now()
+        )
+        if not started:
+            return
+        job = ImportJob.objects.select_related("owner").get(pk=job_id)
+        try:
+            with job.file.open("rb") as file_obj:
+                result = import_contacts(
+                    job.owner,
+                    iter_csv_rows(file_obj),
+                    on_chunk=lambda result: _save_progress(job, result),
+                )
+            _save_progress(job, result)
+            job.status = ImportJob.DONE
+        except ContactImportError as e:
+            job.errors = [f"Failed to read CSV file: {e}"]
+            job.status = ImportJob.FAILED
+        except Exception as e:
+            logger.exception("Contact import job %s failed", job_id)
+            job.errors = [str(e)]
+            job.status = ImportJob.FAILED
+        job.finished_at = timezone.now()
+        job.save(update_fields=["status", "errors", "finished_at", "updated_at"])
+        job.file.delete(save=False)
+    finally:
+        close_old_connections()
@@ -0,0 +1,281 @@
+"""
+Streaming leaderboard of the most reported phone numbers.
+
+Each bucket (5 minutes, an hour, a day, or all time) keeps a Space-Saving
+summary: at most SPAM_LEADERBOARD_CAPACITY numbers with an estimated count
+that may overestimate the true count by at most its recorded error. Workers
+count their own committed reports exactly and merge them into the persisted
+summaries once SPAM_LEADERBOARD_FLUSH_SIZE reports are buffered or the
+oldest is SPAM_LEADERBOARD_FLUSH_SECONDS old, whichever comes first; a
+buffer that a now idle worker would otherwise keep is flushed by a timer.
+Reports buffered by a worker that is killed are missing until
+rebuild_spam_leaderboard runs. A windowed leaderboard is the merge of the
+window's buckets and is cached, so top-N queries do not touch the reports
+at all.
+"""
+import datetime
+import heapq
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from .models import SpamCounter, SpamLeaderboardBucket, SpamReport
+
+logger = logging.getLogger(__name__)
+
+ALL_TIME_START = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+# Bucket tiers and their length in seconds; "all" is a single bucket.
+TIERS = {
+    "minutes": 5 * 60,
+    "hour": 60 * 60,
+    "day": 24 * 60 * 60,
+    "all": None,
+}
+
+# Leaderboard windows as (tier, number of most recent buckets)
+WINDOWS = {
+    "hour": ("minutes", 12),
+    "day": ("hour", 24),
+    "week": ("day", 7),
+    "all": ("all", 1),
+}
+
+
+def leaderboard_capacity():
+    return getattr(settings, "SPAM_LEADERBOARD_CAPACITY", 1000)
+
+
+def bucket_start(tier, moment):
+    length = TIERS[tier]
+    if length is None:
+        return ALL_TIME_START
+    seconds = int(moment.timestamp()) // length * length
+    return datetime.datetime.fromtimestamp(seconds, tz=datetime.timezone.utc)
+
+
+class SpaceSaving:
+    """
+    Space-Saving summary of at most `capacity` counters. Merging keeps the
+    guarantee that each estimate exceeds the true count by at most its error
+    (Agarwal et al., "Mergeable Summaries").
+    """
+
+    def __init__(self, capacity, counters=None):
+        self.capacity = capacity
+        self.counters = {key: tuple(value) for key, value in (counters or {}).items()}
+
+    def _floor(self):
+        # A number missing from a full summary may have been counted up to
+        # its smallest estimate before being evicted.
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(count for count, _ in self.counters.values())
+
+    def merge(self, other):
+        """
+        Add another SpaceSaving summary, or an exact Counter of new reports.
+        """
+        if isinstance(other, Counter):
+            # Exact counts: nothing was evicted, so the floor stays 0.
+            other = SpaceSaving(len(other) + 1, {key: (count, 0) for key, count in other.items()})
+        floor, other_floor = self._floor(), other._floor()
+        merged = {}
+        for key in self.counters.keys() | other.counters.keys():
+            count, error = self.counters.get(key, (floor, floor))
+            other_count, other_error = other.counters.get(key, (other_floor, other_floor))
+            merged[key] = (count + other_count, error + other_error)
+        self.counters = dict(
+            heapq.nlargest(self.capacity, merged.items(), key=lambda item: item[1][0])
+        )
+
+    def top(self, n):
+        """
+        Return [(key, estimated_count, error)] for the `n` largest estimates.
+        """
+        ranked = heapq.nlargest(n, self.counters.items(), key=lambda item: item[1][0])
+        return [(key, count, error) for key, (count, error) in ranked]
+
+
+class SpamLeaderboard:
+    """
+    Per-worker buffer of committed reports plus access to the persisted
+    bucket summaries shared by all workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = defaultdict(Counter)
+        self._pending_reports = 0
+        self._flushed_at = time.monotonic()
+        self._timer = None
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, "SPAM_LEADERBOARD_FLUSH_SECONDS", 10)
+
+    @property
+    def flush_size(self):
+        return getattr(settings, "SPAM_LEADERBOARD_FLUSH_SIZE", 1000)
+
+    def record(self, phone_keys, reported_at):
+        """
+        Count reports of `phone_keys` made at `reported_at`. Call after the
+        reports are committed.
+        """
+        phone_keys = list(phone_keys)
+        with self._lock:
+            for tier in TIERS:
+                self._pending[(tier, bucket_start(tier, reported_at))].update(phone_keys)
+            self._pending_reports += len(phone_keys)
+            due = (
+                self._pending_reports >= self.flush_size
+                or time.monotonic() - self._flushed_at > self.flush_interval
+            )
+        if due:
+            self.flush()
+        else:
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        with self._lock:
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(self.flush_interval, self._flush_in_background)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_in_background(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Flushing the spam leaderboard failed")
+        finally:
+            connections.close_all()
+
+    def flush(self):
+        """
+        Merge this worker's buffered counts into the persisted summaries and
+        drop buckets too old for any window.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(Counter)
+            pending_reports, self._pending_reports = self._pending_reports, 0
+            self._flushed_at = time.monotonic()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return
+        try:
+            with transaction.atomic():
+                SpamLeaderboardBucket.objects.bulk_create(
+                    [
+                        SpamLeaderboardBucket(tier=tier, period_start=period_start)
+                        for tier, period_start in pending
+                    ],
+                    ignore_conflicts=True,
+                )
+                for bucket in self._locked_buckets(pending):
+                    summary = SpaceSaving(leaderboard_capacity(), bucket.counters)
+                    summary.merge(pending[(bucket.tier, bucket.period_start)])
+                    bucket.counters = summary.counters
+                    bucket.save(update_fields=["counters", "updated_at"])
+                self._expire()
+        except Exception:
+            with self._lock:
+                for key, counts in pending.items():
+                    self._pending[key].update(counts)
+                self._pending_reports += pending_reports
+            self._schedule_flush()
+            raise
+
+    def _locked_buckets(self, pending):
+        buckets = SpamLeaderboardBucket.objects.select_for_update().filter(
+            tier__in={tier for tier, _ in pending},
+            period_start__in={period_start for _, period_start in pending},
+        )
+        # Locking in a fixed order keeps concurrent flushes from deadlocking.
+        return [
+            bucket
+            for bucket in buckets.order_by("tier", "period_start")
+            if (bucket.tier, bucket.period_start) in pending
+        ]
+
+    def _expire(self):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for tier, count in WINDOWS.values():
+            length = TIERS[tier]
+            if length is not None:
+                SpamLeaderboardBucket.objects.filter(
+                    tier=tier,
+                    period_start__lt=bucket_start(tier, now) - datetime.timedelta(seconds=length * count),
+                ).delete()
+
+    def summary(self, window):
+        """
+        Return the merged SpaceSaving summary of `window`'s buckets.
+        """
+        tier, count = WINDOWS[window]
+        now = datetime.datetime.now(datetime.timezone.utc)
+        oldest = bucket_start(tier, now)
+        if TIERS[tier] is not None:
+            oldest -= datetime.timedelta(seconds=TIERS[tier] * (count - 1))
+        summary = SpaceSaving(leaderboard_capacity())
+        buckets = SpamLeaderboardBucket.objects.filter(tier=tier, period_start__gte=oldest)
+        for counters in buckets.values_list("counters", flat=True):
+            summary.merge(SpaceSaving(leaderboard_capacity(), counters))
+        return summary
+
+    def top(self, window, n):
+        """
+        Return [(phone_key, estimated_count, error)] for the `n` most reported
+        numbers in `window`, from a cached ranking that is at most
+        SPAM_LEADERBOARD_CACHE_SECONDS old.
+        """
+        if self._pending and time.monotonic() - self._flushed_at > self.flush_interval:
+            self.flush()
+        cache_key = f"spam_leaderboard_{window}"
+        ranking = cache.get(cache_key)
+        if ranking is None:
+            ranking = self.summary(window).top(leaderboard_capacity())
+            cache.set(cache_key, ranking, getattr(settings, "SPAM_LEADERBOARD_CACHE_SECONDS", 10))
+        return ranking[:n]
+
+    @transaction.atomic
+    def rebuild(self):
+        """
+        Recompute every bucket from SpamReport for the windowed tiers and
+        from SpamCounter for all time. Returns the number of buckets written.
+        """
+        SpamLeaderboardBucket.objects.all().delete()
+        now = datetime.datetime.now(datetime.timezone.utc)
+        buckets = defaultdict(Counter)
+        since = bucket_start("day", now) - datetime.timedelta(days=WINDOWS["week"][1])
+        reports = SpamReport.objects.filter(timestamp__gte=since).values_list("phone_key", "timestamp")
+        for phone_key, reported_at in reports.iterator(chunk_size=5000):
+            for tier in ("minutes", "hour", "day"):
+                buckets[(tier, bucket_start(tier, reported_at))][phone_key] += 1
+
+        all_time = SpamCounter.objects.exclude(phone_number=SpamCounter.TOTAL_KEY).order_by(
+            "-report_count"
+        )[:leaderboard_capacity()]
+        buckets[("all", ALL_TIME_START)] = Counter(dict(all_time.values_list("phone_number", "report_count")))
+
+        rows = []
+        for (tier, period_start), counts in buckets.items():
+            summary = SpaceSaving(leaderboard_capacity())
+            summary.merge(counts)
+            rows.append(SpamLeaderboardBucket(tier=tier, period_start=period_start, counters=summary.counters))
+        SpamLeaderboardBucket.objects.bulk_create(rows, batch_size=500)
+        self._expire()
+        cache.delete_many([f"spam_leaderboard_{window}" for window in WINDOWS])
+        return len(rows)
+
+
+spam_leaderboard = SpamLeaderboard()
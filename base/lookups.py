@@ -0,0 +1,198 @@
+import time
+from django.db.models import Exists, OuterRef, Subquery
+from .caching import (
+    acurrent_generations,
+    aget_or_compute,
+    current_generations,
+    get_or_compute,
+    phone_generation_key,
+    search_cache_timeout,
+    weak_etag,
+)
+from .directory import ranked_names
+from .models import User, Contact, ContactName, SpamCounter
+from .phones import normalize_phone_number
+from .spam import likelihoods_from_counts, spam_likelihoods
+
+
+# Saved-by sets built in this process, by (phone_key, version), before the
+# dict is cleared.
+LOCAL_SAVED_BY_SETS = 10000
+
+_saved_by_sets = {}
+
+
+def _saved_by_set(phone_key, owner_ids, version):
+    key = (phone_key, version)
+    owners = _saved_by_sets.get(key)
+    if owners is None:
+        if len(_saved_by_sets) >= LOCAL_SAVED_BY_SETS:
+            _saved_by_sets.clear()
+        owners = _saved_by_sets[key] = frozenset(owner_ids)
+    return owners
+
+
+def _saved_by_query(phone_key):
+    return Contact.objects.filter(phone_key=phone_key).values_list("owner_id", flat=True)
+
+
+def saved_by(phone_key):
+    """
+    Reverse contact lookup: return (owner_ids, version), the frozenset of
+    ids of users who have `phone_key` in their contacts and the version of
+    the cached list. A caller with that number may see exactly those users'
+    emails. Any contact saved or removed with the number bumps its
+    generation, which invalidates the list.
+    """
+    owner_ids, version = get_or_compute(
+        f"saved_by_{phone_key}",
+        [phone_generation_key(phone_key)],
+        lambda depend: list(_saved_by_query(phone_key)),
+    )
+    return _saved_by_set(phone_key, owner_ids, version), version
+
+
+async def asaved_by(phone_key):
+    async def compute(depend):
+        return [owner_id async for owner_id in _saved_by_query(phone_key)]
+
+    owner_ids, version = await aget_or_compute(
+        f"saved_by_{phone_key}", [phone_generation_key(phone_key)], compute
+    )
+    return _saved_by_set(phone_key, owner_ids, version), version
+
+
+def with_visible_email(payload, owner_ids):
+    """
+    Finish a cached search_by_phone payload for a caller saved by
+    `owner_ids`: a registered user's email stays only if that user has the
+    caller in their contacts.
+    """
+    if not isinstance(payload, dict):
+        return payload
+    payload = dict(payload)
+    if payload.pop("user_id", None) not in owner_ids:
+        payload["email"] = None
+    return payload
+
+
+def _report_count(phone_key):
+    return Subquery(
+        SpamCounter.objects.filter(phone_number=phone_key).values("report_count")[:1]
+    )
+
+
+def person_detail_query(phone_key, viewer):
+    """
+    One-row queryset with everything person_detail needs for `phone_key` as
+    seen by `viewer`. It is anchored on the viewer's own row, which always
+    exists, so the lookup is a single round trip whether the number belongs
+    to a user, only to contacts, or to nobody.
+    """
+    registered = User.objects.filter(phone_key=phone_key).order_by("pk")
+    return User.objects.filter(pk=viewer.pk).values(
+        registered_name=Subquery(registered.values("username")[:1]),
+        # Email visible only if the viewer is in that user's contacts
+        visible_email=Subquery(
+            registered.filter(
+                Exists(Contact.objects.filter(owner=OuterRef("pk"), phone_key=viewer.phone_key))
+            ).values("email")[:1]
+        ),
+        contact_name=Subquery(ranked_names(phone_key)[:1]),
+        report_count=_report_count(phone_key),
+        total_reports=_report_count(SpamCounter.TOTAL_KEY),
+    )
+
+
+def person_detail_payload(phone_number, phone_key, row):
+    """
+    Build the person_detail response from a person_detail_query row.
+    """
+    counts = {
+        phone_key: row["report_count"] or 0,
+        SpamCounter.TOTAL_KEY: row["total_reports"] or 0,
+    }
+    is_registered_user = row["registered_name"] is not None
+    return {
+        "name": row["registered_name"] if is_registered_user else row["contact_name"],
+        "phone_number": phone_number,
+        "spam_likelihood": likelihoods_from_counts([phone_key], counts)[phone_key],
+        "email": row["visible_email"],
+        "is_registered_user": is_registered_user,
+    }
+
+
+def _person_detail_generation_keys(phone_key, viewer):
+    # Saves and spam reports for the number bump its generation; a contact
+    # saved with the viewer's number, which can reveal an email, bumps the
+    # viewer's.
+    return [phone_generation_key(phone_key), phone_generation_key(viewer.phone_key)]
+
+
+def _person_detail_etag(phone_key, viewer, generations):
+    # Spam likelihoods also drift as other numbers are reported, so the tag
+    # expires as often as cached search results do.
+    period = int(time.time() // search_cache_timeout())
+    return weak_etag("person_detail", phone_key, viewer.pk, sorted(generations.items()), period)
+
+
+def person_detail_etag(phone_key, viewer):
+    """
+    Weak ETag of the person_detail payload for `phone_key` as seen by
+    `viewer`, computed from cache generations without querying the database.
+    """
+    generations = current_generations(_person_detail_generation_keys(phone_key, viewer))
+    return _person_detail_etag(phone_key, viewer, generations)
+
+
+async def aperson_detail_etag(phone_key, viewer):
+    generations = await acurrent_generations(_person_detail_generation_keys(phone_key, viewer))
+    return _person_detail_etag(phone_key, viewer, generations)
+
+
+def resolve_phone_numbers(phone_numbers, viewer):
+    """
+    Build the person_detail payload for every number in `phone_numbers` as
+    seen by `viewer` in at most four queries whatever the number of inputs:
+    registered users, contact names for the other numbers, spam counters,
+    and the viewer's saved-by list when it is not cached. Like every spam
+    lookup, it also pulls new reports when the reported-numbers filter is
+    due for a refresh.
+    """
+    keys = {phone_number: normalize_phone_number(phone_number) for phone_number in phone_numbers}
+    phone_keys = set(keys.values())
+
+    users = {
+        user["phone_key"]: user
+        for user in User.objects.filter(phone_key__in=phone_keys).values(
+            "pk", "phone_key", "username", "email"
+        )
+    }
+
+    # Same fallback as person_detail: the most saved contact name.
+    unregistered = phone_keys - users.keys()
+    contact_names = {}
+    if unregistered:
+        for phone_key, name in (
+            ContactName.objects.filter(phone_key__in=unregistered)
+            .order_by("phone_key", "-saved_count", "name")
+            .values_list("phone_key", "name")
+        ):
+            contact_names.setdefault(phone_key, name)
+
+    # Email visible only if the viewer is in that user's contacts
+    visible_to = saved_by(viewer.phone_key)[0] if users else frozenset()
+
+    likelihoods = spam_likelihoods(phone_keys)
+
+    results = []
+    for phone_number, phone_key in keys.items():
+        user = users.get(phone_key)
+        results.append({
+            "name": user["username"] if user else contact_names.get(phone_key),
+            "phone_number": phone_number,
+            "spam_likelihood": likelihoods[phone_key],
+            "email": user["email"] if user and user["pk"] in visible_to else None,
+            "is_registered_user": user is not None,
+        })
+    return results
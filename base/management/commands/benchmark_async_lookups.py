@@ -0,0 +1,87 @@
+import asyncio
+import random
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from rest_framework_simplejwt.tokens import AccessToken
+from base.models import User, Contact
+from base.views import CustomUserRateThrottle
+
+
+def summarize(label, results, elapsed):
+    latencies = sorted(latency for latency, _ in results)
+    errors = sum(1 for _, status_code in results if status_code != 200)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return (
+        f"{label:<28} {len(latencies) / elapsed:8.1f} req/s   "
+        f"p50 {statistics.median(latencies) * 1000:7.2f} ms   p99 {p99 * 1000:7.2f} ms   "
+        f"non-200 {errors}"
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare requests/sec and p99 latency of the sync (WSGI) and native "
+        "async (ASGI) person_detail and search_by_phone views in-process."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=16)
+
+    def handle(self, *args, **options):
+        phone_numbers = list(
+            User.objects.values_list('phone_number', flat=True)[:500]
+        ) + list(Contact.objects.values_list('phone_number', flat=True)[:500])
+        if not phone_numbers:
+            phone_numbers = [f'+9170{random.randrange(10**8):08d}' for _ in range(100)]
+        paths = [random.choice(phone_numbers) for _ in range(options['requests'])]
+
+        user = User.objects.create_user(
+            username=f'bench-{uuid.uuid4().hex[:8]}',
+            phone_number=f'+9199{random.randrange(10**8):08d}',
+            password=uuid.uuid4().hex,
+        )
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+        try:
+            # Throttling would reject almost every benchmark request.
+            with mock.patch.object(CustomUserRateThrottle, 'allow_request', return_value=True):
+                for label, template in (
+                    ('person_detail', '/api/{async_}detail/{number}/'),
+                    ('search_by_phone', '/api/{async_}search/phone/?query={number}'),
+                ):
+                    urls = [template.format(async_='', number=n.replace('+', '%2B')) for n in paths]
+                    self.stdout.write(summarize(f'{label} (WSGI)', *self.run_sync(urls, headers, options)))
+                    urls = [template.format(async_='async/', number=n.replace('+', '%2B')) for n in paths]
+                    self.stdout.write(summarize(f'{label} (ASGI)', *asyncio.run(self.run_async(urls, headers, options))))
+        finally:
+            user.delete()
+
+    def run_sync(self, urls, headers, options):
+        def fetch(url):
+            started = time.perf_counter()
+            response = Client(raise_request_exception=False).get(url, headers=headers)
+            return time.perf_counter() - started, response.status_code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            results = list(pool.map(fetch, urls))
+        return results, time.perf_counter() - started
+
+    async def run_async(self, urls, headers, options):
+        semaphore = asyncio.Semaphore(options['concurrency'])
+        client = AsyncClient(raise_request_exception=False)
+
+        async def fetch(url):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(url, headers=headers)
+                return time.perf_counter() - started, response.status_code
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(fetch(url) for url in urls))
+        return results, time.perf_counter() - started
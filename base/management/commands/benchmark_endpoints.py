@@ -0,0 +1,393 @@
+import asyncio
+import itertools
+import json
+import logging
+import platform
+import random
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+from base import jobs, metrics
+from base.leaderboard import spam_leaderboard
+from base.models import Contact, ImportJob, SpamReport, User
+from base.spam import rebuild_spam_counters, rebuild_spam_rollups
+from base.throttling import SlidingWindowRateThrottle
+from base.urls import urlpatterns
+
+# Endpoints that run through AsyncClient rather than Client
+ASYNC_ENDPOINTS = {"search_by_phone_async", "person_detail_async"}
+
+# Numbers the benchmark writes (registrations, reports, contacts) use this
+# range so they never collide with generate_dataset's +917/+918/+919 ranges.
+BENCHMARK_PREFIX = "+916"
+
+# Numbers per bulk spam report and batch lookup request
+BATCH_SIZE = 20
+
+# Rows in the uploaded contacts CSV
+IMPORT_ROWS = 100
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def cold_caches(run_id, index):
+    """
+    CACHES with the default cache's backend under a key prefix of its own,
+    so a measurement starts from a cold cache without clearing what a
+    deployment sharing CACHE_URL keeps there (throttle windows, cached
+    users, leaderboard rankings). Every key the endpoints write expires.
+    """
+    default = settings.CACHES["default"]
+    prefix = ":".join(part for part in [default.get("KEY_PREFIX", ""), "benchmark", run_id, str(index)] if part)
+    return {**settings.CACHES, "default": {**default, "KEY_PREFIX": prefix}}
+
+
+def sample_values(queryset, field, count, rng):
+    """
+    Up to `count` values of `field` from rows with random primary keys,
+    without ORDER BY RANDOM() over the whole table.
+    """
+    first = queryset.order_by("pk").values_list("pk", flat=True).first()
+    last = queryset.order_by("-pk").values_list("pk", flat=True).first()
+    if first is None:
+        return []
+    pks = rng.sample(range(first, last + 1), min(count * 2, last - first + 1))
+    return list(queryset.filter(pk__in=pks).values_list(field, flat=True)[:count])
+
+
+class Workload:
+    """
+    Request builders for every endpoint in base/urls.py. Each builder
+    returns (method, path, kwargs) for one request.
+    """
+
+    def __init__(self, rng, viewer, login, password):
+        self.rng = rng
+        self.viewer = viewer
+        self.login = login
+        self.password = password
+        self.refresh = str(RefreshToken.for_user(login))
+        self.numbers = sample_values(User.objects.all(), "phone_number", 500, rng) + sample_values(
+            Contact.objects.all(), "phone_number", 500, rng
+        )
+        names = sample_values(Contact.objects.all(), "name", 500, rng)
+        self.names = [name.split()[0] for name in names if name.strip()] or ["a"]
+        self.job_id = ImportJob.objects.create(
+            owner=viewer, file="imports/benchmark.csv", status=ImportJob.DONE
+        ).id
+        self.import_csv = "Name,Phone Number,Email\n" + "".join(
+            f"Benchmark {index},{BENCHMARK_PREFIX}5{index:08d},\n" for index in range(IMPORT_ROWS)
+        )
+        self._serials = itertools.count(rng.randrange(10 ** 8))
+
+    def fresh_number(self):
+        return f"{BENCHMARK_PREFIX}1{next(self._serials) % 10 ** 8:08d}"
+
+    def number(self):
+        return self.rng.choice(self.numbers)
+
+    def build(self, name):
+        return getattr(self, name)()
+
+    def json(self, data):
+        return {"data": data, "content_type": "application/json"}
+
+    def register_user(self):
+        number = self.fresh_number()
+        return "post", reverse("register_user"), self.json(
+            {"username": f"bench{number[1:]}", "phone_number": number, "password": uuid.uuid4().hex}
+        )
+
+    def token_obtain_pair(self):
+        return "post", reverse("token_obtain_pair"), self.json(
+            {User.USERNAME_FIELD: getattr(self.login, User.USERNAME_FIELD), "password": self.password}
+        )
+
+    def token_refresh(self):
+        return "post", reverse("token_refresh"), self.json({"refresh": self.refresh})
+
+    def add_contact(self):
+        return "post", reverse("add_contact"), self.json(
+            {"name": self.rng.choice(self.names), "phone_number": self.fresh_number()}
+        )
+
+    def mark_spam(self):
+        return "post", reverse("mark_spam"), self.json({"phone_number": self.fresh_number()})
+
+    def mark_spam_bulk(self):
+        return "post", reverse("mark_spam_bulk"), self.json(
+            {"phone_numbers": [self.fresh_number() for _ in range(BATCH_SIZE)]}
+        )
+
+    def search_by_name(self):
+        return "get", reverse("search_by_name"), {"data": {"query": self.rng.choice(self.names)}}
+
+    def search_by_phone(self):
+        return "get", reverse("search_by_phone"), {"data": {"query": self.number()}}
+
+    def search_by_phone_async(self):
+        return "get", reverse("search_by_phone_async"), {"data": {"query": self.number()}}
+
+    def autocomplete(self):
+        return "get", reverse("autocomplete"), {"data": {"query": self.rng.choice(self.names)[:3]}}
+
+    def person_detail_batch(self):
+        return "post", reverse("person_detail_batch"), self.json(
+            {"phone_numbers": [self.number() for _ in range(BATCH_SIZE)]}
+        )
+
+    def person_detail(self):
+        return "get", reverse("person_detail", args=[self.number()]), {}
+
+    def person_detail_async(self):
+        return "get", reverse("person_detail_async", args=[self.number()]), {}
+
+    def export_contacts_csv(self):
+        return "get", reverse("export_contacts_csv"), {}
+
+    def import_contacts_csv(self):
+        upload = SimpleUploadedFile("contacts.csv", self.import_csv.encode(), content_type="text/csv")
+        return "post", reverse("import_contacts_csv"), {"data": {"file": upload}}
+
+    def import_job_status(self):
+        return "get", reverse("import_job_status", args=[self.job_id]), {}
+
+    def analytics_top_spam_numbers(self):
+        window = self.rng.choice(["hour", "day", "week", "all"])
+        return "get", reverse("analytics_top_spam_numbers"), {"data": {"window": window}}
+
+    def analytics_spam_trends(self):
+        bucket = self.rng.choice(["hour", "day", "week", "month"])
+        return "get", reverse("analytics_spam_trends"), {"data": {"bucket": bucket}}
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every endpoint in base/urls.py in-process at fixed "
+        "concurrency levels and report throughput, p50/p95/p99 latency and "
+        "SQL queries per request, optionally saving the results as JSON and "
+        "comparing them with an earlier run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=0, help='Seed this many users with generate_dataset first.')
+        parser.add_argument('--contacts-per-user', type=int, default=50)
+        parser.add_argument('--spam-reports', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint and concurrency level.')
+        parser.add_argument('--concurrency', default='1,8,32', help='Comma-separated concurrency levels.')
+        parser.add_argument('--endpoints', default='', help='Comma-separated URL names (default: all).')
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+        parser.add_argument('--compare', help='JSON file of an earlier run to compare against.')
+
+    def handle(self, *args, **options):
+        names = [pattern.name for pattern in urlpatterns]
+        if options['endpoints']:
+            selected = options['endpoints'].split(',')
+            unknown = set(selected) - set(names)
+            if unknown:
+                raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}. Choose from {', '.join(names)}.")
+            names = selected
+        levels = [int(level) for level in options['concurrency'].split(',')]
+        baseline = self.load_baseline(options['compare']) if options['compare'] else {}
+
+        if options['users']:
+            call_command(
+                'generate_dataset', users=options['users'], contacts_per_user=options['contacts_per_user'],
+                spam_reports=options['spam_reports'], seed=options['seed'], stdout=self.stdout,
+            )
+        viewer_id = Contact.objects.values_list('owner_id', flat=True).first()
+        if viewer_id is None:
+            raise CommandError("No contacts to benchmark against; seed a dataset with --users.")
+
+        rng = random.Random(options['seed'])
+        run_id = uuid.uuid4().hex[:8]
+        started_at = timezone.now()
+        password = uuid.uuid4().hex
+        login = User.objects.create_user(
+            username=f'bench-{run_id}',
+            phone_number=f'{BENCHMARK_PREFIX}0{rng.randrange(10 ** 8):08d}',
+            password=password,
+        )
+        workload = Workload(rng, User.objects.get(pk=viewer_id), login, password)
+        headers = {'Authorization': f'Bearer {RefreshToken.for_user(workload.viewer).access_token}'}
+
+        results = []
+        # Rejected requests are counted below rather than logged one by one.
+        logging.disable(logging.ERROR)
+        try:
+            # A huge rate keeps the throttles' cache work in the measurement
+            # without rejecting benchmark traffic. Sampling is left to the
+            # benchmark so MetricsMiddleware does not nest its own.
+            with mock.patch.object(SlidingWindowRateThrottle, 'get_rate', return_value='1000000000/second'), \
+                    override_settings(ENDPOINT_THROTTLE_RATES={}, METRICS_SAMPLE_RATE=0):
+                for index, (name, level) in enumerate(itertools.product(names, levels)):
+                    requests = [workload.build(name) for _ in range(options['requests'])]
+                    with override_settings(CACHES=cold_caches(run_id, index)):
+                        if name in ASYNC_ENDPOINTS:
+                            samples, elapsed = asyncio.run(self.run_async(requests, headers, level))
+                        else:
+                            samples, elapsed = self.run_sync(requests, headers, level)
+                    result = self.summarize(name, level, samples, elapsed)
+                    results.append(result)
+                    self.stdout.write(self.format(result, baseline.get((name, level))))
+        finally:
+            logging.disable(logging.NOTSET)
+            self.remove_benchmark_rows(workload.viewer, started_at)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(self.report(results, options), f, indent=2)
+            self.stdout.write(f"results written to {options['output']}")
+
+    def remove_benchmark_rows(self, viewer, started_at):
+        """
+        Delete the users, contacts and spam reports the run wrote in the
+        BENCHMARK_PREFIX range and its import jobs, then recompute the spam
+        tables the deleted reports were counted in.
+        """
+        jobs.shutdown_executor()
+        spam_leaderboard.flush()
+        import_jobs = ImportJob.objects.filter(owner=viewer, created_at__gte=started_at)
+        for job in import_jobs:
+            job.file.delete(save=False)
+        reports = SpamReport.objects.filter(phone_key__startswith=BENCHMARK_PREFIX)
+        with transaction.atomic():
+            import_jobs.delete()
+            removed_reports, _ = reports.delete()
+            Contact.objects.filter(phone_key__startswith=BENCHMARK_PREFIX).delete()
+            User.objects.filter(phone_number__startswith=BENCHMARK_PREFIX).delete()
+        if removed_reports:
+            rebuild_spam_counters()
+            rebuild_spam_rollups()
+            spam_leaderboard.rebuild()
+        self.stdout.write(f"benchmark rows removed ({removed_reports} spam reports)")
+
+    @staticmethod
+    def fetch(client, request, headers):
+        method, path, kwargs = request
+        token = metrics.start_request()
+        started = time.perf_counter()
+        try:
+            response = getattr(client, method)(path, headers=headers, **kwargs)
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+        finally:
+            queries = metrics.finish_request(token).queries
+        return time.perf_counter() - started, response.status_code, queries
+
+    def run_sync(self, requests, headers, concurrency):
+        pending = iter(requests)
+        lock = threading.Lock()
+
+        def worker(_):
+            client = Client(raise_request_exception=False)
+            samples = []
+            try:
+                while True:
+                    with lock:
+                        request = next(pending, None)
+                    if request is None:
+                        return samples
+                    samples.append(self.fetch(client, request, headers))
+            finally:
+                # Each thread has its own connections; the test client keeps
+                # them open between requests.
+                connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            samples = [sample for batch in pool.map(worker, range(concurrency)) for sample in batch]
+        return samples, time.perf_counter() - started
+
+    async def run_async(self, requests, headers, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+        client = AsyncClient(raise_request_exception=False)
+
+        async def fetch(request):
+            method, path, kwargs = request
+            async with semaphore:
+                token = metrics.start_request()
+                started = time.perf_counter()
+                try:
+                    response = await getattr(client, method)(path, headers=headers, **kwargs)
+                finally:
+                    queries = metrics.finish_request(token).queries
+                return time.perf_counter() - started, response.status_code, queries
+
+        started = time.perf_counter()
+        samples = await asyncio.gather(*(fetch(request) for request in requests))
+        return samples, time.perf_counter() - started
+
+    @staticmethod
+    def summarize(name, concurrency, samples, elapsed):
+        latencies = sorted(latency for latency, _, _ in samples)
+        statuses = {}
+        for _, status_code, _ in samples:
+            statuses[str(status_code)] = statuses.get(str(status_code), 0) + 1
+        return {
+            'endpoint': name,
+            'concurrency': concurrency,
+            'requests': len(samples),
+            'errors': sum(1 for _, status_code, _ in samples if status_code >= 400),
+            'statuses': statuses,
+            'throughput': round(len(samples) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'queries_per_request': round(statistics.mean(queries for _, _, queries in samples), 2),
+        }
+
+    @staticmethod
+    def format(result, previous=None):
+        line = (
+            f"{result['endpoint']:<28} c={result['concurrency']:<3} "
+            f"{result['throughput']:9.1f} req/s   p50 {result['p50_ms']:8.2f} ms   "
+            f"p95 {result['p95_ms']:8.2f} ms   p99 {result['p99_ms']:8.2f} ms   "
+            f"queries {result['queries_per_request']:5.1f}   errors {result['errors']}"
+        )
+        if previous and previous['throughput'] and previous['p95_ms']:
+            line += (
+                f"   (req/s {result['throughput'] / previous['throughput'] - 1:+.0%}, "
+                f"p95 {result['p95_ms'] / previous['p95_ms'] - 1:+.0%})"
+            )
+        return line
+
+    @staticmethod
+    def load_baseline(path):
+        try:
+            with open(path) as f:
+                previous = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read {path}: {e}")
+        return {(result['endpoint'], result['concurrency']): result for result in previous['results']}
+
+    @staticmethod
+    def report(results, options):
+        return {
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'dataset': {
+                'users': User.objects.count(),
+                'contacts': Contact.objects.count(),
+            },
+            'requests': options['requests'],
+            'results': results,
+        }
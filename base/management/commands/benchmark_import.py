@@ -0,0 +1,58 @@
+import random
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from base.imports import import_contacts, IMPORT_CHUNK_SIZE
+from base.models import User, Contact
+from base.phones import normalize_phone_number
+
+
+def legacy_import(owner, rows):
+    """
+    The previous import loop: one update_or_create per row, no transaction.
+    """
+    for row in rows:
+        name = row.get('Name')
+        phone_number = row.get('Phone Number')
+        if not name or not phone_number:
+            continue
+        Contact.objects.update_or_create(
+            owner=owner,
+            phone_key=normalize_phone_number(phone_number),
+            defaults={'name': name, 'phone_number': phone_number},
+        )
+
+
+class Command(BaseCommand):
+    help = "Compare rows/second of the bulk contact import against the per-row import."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+        parser.add_argument('--skip-legacy', action='store_true')
+
+    def handle(self, *args, **options):
+        rows = [
+            {'Name': f'Contact {i}', 'Phone Number': f'+9170{random.randrange(10**8):08d}'}
+            for i in range(options['rows'])
+        ]
+        runs = [('bulk', lambda owner: import_contacts(owner, rows, options['chunk_size']))]
+        if not options['skip_legacy']:
+            runs.insert(0, ('per-row', lambda owner: legacy_import(owner, rows)))
+
+        for label, run in runs:
+            owner = User.objects.create_user(
+                username=f'bench-{uuid.uuid4().hex[:8]}',
+                phone_number=f'+9199{random.randrange(10**8):08d}',
+                password=uuid.uuid4().hex,
+            )
+            try:
+                started = time.perf_counter()
+                run(owner)
+                elapsed = time.perf_counter() - started
+            finally:
+                owner.delete()
+            self.stdout.write(
+                f"{label:>8}: {len(rows)} rows in {elapsed:.2f}s "
+                f"({len(rows) / elapsed:,.0f} rows/s)"
+            )
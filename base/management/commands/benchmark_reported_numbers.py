@@ -0,0 +1,42 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from base.reported import BloomFilter
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the reported-numbers Bloom filter from synthetic phone keys and "
+        "report build time, memory footprint, lookup latency and false positives."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--numbers', type=int, default=10_000_000)
+        parser.add_argument('--probes', type=int, default=200_000)
+        parser.add_argument('--error-rate', type=float, default=0.01)
+
+    def handle(self, *args, **options):
+        count = options['numbers']
+        # Reported numbers use even subscriber numbers and probes odd ones, so
+        # every probe that hits is a false positive.
+        reported = (f'+91{7000000000 + 2 * i}' for i in range(count))
+        probes = [f'+91{7000000000 + 2 * random.randrange(count) + 1}' for _ in range(options['probes'])]
+
+        bloom = BloomFilter(count, options['error_rate'])
+        started = time.perf_counter()
+        for phone_key in reported:
+            bloom.add(phone_key)
+        build_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        false_positives = sum(1 for phone_key in probes if phone_key in bloom)
+        lookup_seconds = time.perf_counter() - started
+
+        self.stdout.write(f"numbers:              {count:,}")
+        self.stdout.write(f"bits / hashes:        {bloom.num_bits:,} / {bloom.num_hashes}")
+        self.stdout.write(f"memory:               {bloom.memory_bytes / 2**20:.1f} MiB "
+                          f"(a sorted uint64 array would take {count * 8 / 2**20:.1f} MiB)")
+        self.stdout.write(f"build:                {build_seconds:.1f} s")
+        self.stdout.write(f"lookup:               {lookup_seconds / len(probes) * 1e6:.2f} us")
+        self.stdout.write(f"false positive rate:  {false_positives / len(probes):.4%} measured, "
+                          f"{bloom.false_positive_rate:.4%} expected")
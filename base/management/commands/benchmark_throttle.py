@@ -0,0 +1,49 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from django.core.management.base import BaseCommand
+from rest_framework.throttling import UserRateThrottle
+from base.models import User
+from base.throttling import SlidingWindowRateThrottle
+
+
+class Command(BaseCommand):
+    help = (
+        "Hit one user's throttle from concurrent threads with DRF's "
+        "timestamp-list throttle and the sliding-window counter throttle, and "
+        "report checks/sec and how many requests got past the limit."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=1000, help='Requests allowed per minute.')
+        parser.add_argument('--requests', type=int, default=20000)
+        parser.add_argument('--concurrency', type=int, default=16)
+
+    def handle(self, *args, **options):
+        rate = f"{options['limit']}/minute"
+        for label, base in (
+            ('UserRateThrottle', UserRateThrottle),
+            ('SlidingWindowRateThrottle', SlidingWindowRateThrottle),
+        ):
+            throttle_class = type(label, (base,), {'rate': rate, 'scope': f'benchmark-{uuid.uuid4().hex}'})
+            # An unsaved user is enough: throttles only read its pk.
+            request = SimpleNamespace(user=User(pk=1), resolver_match=None, META={})
+
+            def check(_):
+                started = time.perf_counter()
+                allowed = throttle_class().allow_request(request, None)
+                return time.perf_counter() - started, allowed
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(options['concurrency']) as pool:
+                results = list(pool.map(check, range(options['requests'])))
+            elapsed = time.perf_counter() - started
+
+            latencies = sorted(latency for latency, _ in results)
+            allowed = sum(1 for _, ok in results if ok)
+            self.stdout.write(
+                f"{label:<26} {len(results) / elapsed:9.0f} checks/s   "
+                f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:8.1f} us   "
+                f"allowed {allowed} of limit {options['limit']}"
+            )
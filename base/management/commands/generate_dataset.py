@@ -0,0 +1,181 @@
+import csv
+import io
+import multiprocessing
+import os
+import time
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from faker import Faker
+from base import datasets
+from base.directory import rebuild_name_directory
+from base.leaderboard import spam_leaderboard
+from base.models import User, Contact, SpamReport
+from base.search import rebuild_name_index, uses_native_trigram_index
+from base.spam import rebuild_spam_counters, rebuild_spam_rollups
+
+USER_COLUMNS = [
+    "password", "is_superuser", "username", "first_name", "last_name", "is_staff",
+    "is_active", "date_joined", "phone_number", "phone_key", "email",
+]
+CONTACT_COLUMNS = ["owner_id", "phone_number", "phone_key", "name"]
+SPAM_REPORT_COLUMNS = ["phone_number", "phone_key", "reporter_id", "timestamp"]
+
+# Rows generated per worker task
+TASK_ROWS = 50_000
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic dataset of users, contacts and spam reports with "
+        "skewed name and number distributions. Rows are generated in worker "
+        "processes and loaded with COPY on PostgreSQL or batched executemany "
+        "elsewhere; derived tables are rebuilt and the cache is cleared."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--contacts-per-user', type=int, default=50)
+        parser.add_argument('--spam-reports', type=int, default=10000)
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--password', default='password123', help='Password of every generated user.')
+        parser.add_argument('--batch-size', type=int, default=10_000, help='Rows per executemany batch.')
+
+    def handle(self, *args, **options):
+        users = options['users']
+        if users < 1:
+            raise CommandError("--users must be at least 1.")
+
+        # Generated users get consecutive numbers after the ones already used.
+        start = User.objects.filter(phone_number__startswith=datasets.USER_PREFIX).count()
+        if User.objects.filter(
+            phone_number__gte=datasets.user_number(start),
+            phone_number__lte=datasets.user_number(start + users - 1),
+        ).exists():
+            raise CommandError(
+                f"Existing users already use numbers in {datasets.user_number(start)}.."
+                f"{datasets.user_number(start + users - 1)}; generate into an empty database."
+            )
+
+        faker = Faker('en_IN')
+        faker.seed_instance(options['seed'])
+        pools = datasets.build_pools(faker, users, options['contacts_per_user'], options['spam_reports'])
+        context = multiprocessing.get_context('fork' if hasattr(os, 'fork') else 'spawn')
+        with context.Pool(
+            max(1, options['workers']), initializer=datasets.init_worker, initargs=(pools,)
+        ) as pool:
+            self.load_users(pool, start, options)
+            owner_ids = list(
+                User.objects.filter(
+                    phone_number__gte=datasets.user_number(start),
+                    phone_number__lte=datasets.user_number(start + users - 1),
+                ).order_by('phone_number').values_list('id', flat=True)
+            )
+            self.load_contacts(pool, owner_ids, start, options)
+            self.load_spam_reports(pool, owner_ids, options)
+
+        started = time.perf_counter()
+        rebuild_spam_counters()
+        rebuild_spam_rollups()
+        spam_leaderboard.rebuild()
+        rebuild_name_directory()
+        if not uses_native_trigram_index():
+            rebuild_name_index()
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                for model in (User, Contact, SpamReport):
+                    cursor.execute(f"ANALYZE {connection.ops.quote_name(model._meta.db_table)}")
+        cache.clear()
+        self.stdout.write(f"derived tables rebuilt in {time.perf_counter() - started:.1f} s")
+
+    def load_users(self, pool, start, options):
+        password = make_password(options['password'])
+        joined_at = timezone.now()
+        tasks = [
+            (index, min(TASK_ROWS, start + options['users'] - index), options['seed'] + index, password, joined_at)
+            for index in range(start, start + options['users'], TASK_ROWS)
+        ]
+        self.load(User, USER_COLUMNS, pool.imap_unordered(datasets.user_rows, tasks), options)
+
+    def load_contacts(self, pool, owner_ids, start, options):
+        per_task = max(1, TASK_ROWS // max(options['contacts_per_user'], 1))
+        tasks = [
+            (
+                owner_ids[offset:offset + per_task], options['contacts_per_user'],
+                start, options['users'], options['seed'] + 1_000_000 + offset,
+            )
+            for offset in range(0, len(owner_ids), per_task)
+        ]
+        self.load(Contact, CONTACT_COLUMNS, pool.imap_unordered(datasets.contact_rows, tasks), options)
+
+    def load_spam_reports(self, pool, owner_ids, options):
+        # Each task owns a disjoint set of reporters, so (reporter, number)
+        # pairs cannot repeat across tasks.
+        task_count = max(1, -(-options['spam_reports'] // TASK_ROWS))
+        now = timezone.now()
+        tasks = [
+            (
+                owner_ids[task::task_count],
+                options['spam_reports'] // task_count + (task < options['spam_reports'] % task_count),
+                now, options['seed'] + 2_000_000 + task,
+            )
+            for task in range(task_count)
+            if owner_ids[task::task_count]
+        ]
+        self.load(SpamReport, SPAM_REPORT_COLUMNS, pool.imap_unordered(datasets.spam_report_rows, tasks), options)
+
+    def load(self, model, columns, chunks, options):
+        started = time.perf_counter()
+        total = 0
+        with transaction.atomic():
+            for rows in chunks:
+                if connection.vendor == 'postgresql':
+                    self.copy(model, columns, rows)
+                else:
+                    self.insert(model, columns, rows, options['batch_size'])
+                total += len(rows)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{model._meta.db_table:<16} {total:>11,} rows in {elapsed:7.1f} s "
+            f"({total / elapsed if elapsed else 0:,.0f} rows/s)"
+        )
+
+    def copy(self, model, columns, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            # COPY's CSV format reads an unquoted empty field as NULL.
+            writer.writerow(['' if value is None else value for value in row])
+        buffer.seek(0)
+        qn = connection.ops.quote_name
+        sql = (
+            f"COPY {qn(model._meta.db_table)} ({', '.join(qn(column) for column in columns)}) "
+            f"FROM STDIN WITH (FORMAT csv)"
+        )
+        with connection.cursor() as cursor:
+            raw = cursor.cursor
+            if hasattr(raw, 'copy_expert'):  # psycopg2
+                raw.copy_expert(sql, buffer)
+            else:  # psycopg 3
+                with raw.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+
+    def insert(self, model, columns, rows, batch_size):
+        qn = connection.ops.quote_name
+        sql = (
+            f"INSERT INTO {qn(model._meta.db_table)} ({', '.join(qn(column) for column in columns)}) "
+            f"VALUES ({', '.join(['%s'] * len(columns))})"
+        )
+        adapt = connection.ops.adapt_datetimefield_value
+        with connection.cursor() as cursor:
+            for offset in range(0, len(rows), batch_size):
+                cursor.executemany(
+                    sql,
+                    [
+                        [adapt(value) if hasattr(value, 'tzinfo') else value for value in row]
+                        for row in rows[offset:offset + batch_size]
+                    ],
+                )
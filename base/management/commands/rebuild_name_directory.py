@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from base.directory import rebuild_name_directory
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-number name directory from the Contact table."
+
+    def handle(self, *args, **options):
+        rows = rebuild_name_directory()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {rows} directory entries."))
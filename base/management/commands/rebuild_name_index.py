@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from base.search import rebuild_name_index, uses_native_trigram_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the trigram name index from the User and Contact tables."
+
+    def handle(self, *args, **options):
+        if uses_native_trigram_index():
+            self.stdout.write("PostgreSQL uses the pg_trgm indexes; nothing to rebuild.")
+            return
+        indexed = rebuild_name_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} names."))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from base.spam import rebuild_spam_counters, rebuild_spam_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-number spam counters and the trend rollups from the SpamReport table."
+
+    def handle(self, *args, **options):
+        total_reports = rebuild_spam_counters()
+        self.stdout.write(
+            self.style.SUCCESS(f"Spam counters rebuilt from {total_reports} reports.")
+        )
+        rollup_rows = rebuild_spam_rollups()
+        self.stdout.write(
+            self.style.SUCCESS(f"Spam trend rollups rebuilt ({rollup_rows} rows).")
+        )
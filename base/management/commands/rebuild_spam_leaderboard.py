@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from base.leaderboard import spam_leaderboard
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the top spam numbers leaderboard: the last week's buckets "
+        "from SpamReport and the all-time bucket from the spam counters."
+    )
+
+    def handle(self, *args, **options):
+        buckets = spam_leaderboard.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Spam leaderboard rebuilt ({buckets} buckets)."))
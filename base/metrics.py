@@ -0,0 +1,171 @@
+"""
+In-process request metrics rendered in the Prometheus text format.
+
+MetricsMiddleware samples METRICS_SAMPLE_RATE of requests. While a sampled
+request runs, the hooks below record its SQL queries, cache lookups and
+throttle checks; outside a sampled request every hook returns after one
+context variable read. Each worker process keeps and exposes its own
+numbers, so scrape every worker (or aggregate by instance) to see them all.
+"""
+import contextvars
+import math
+import threading
+import time
+from collections import defaultdict
+from django.conf import settings
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Upper bounds of the per-request SQL query count histogram buckets
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+HELP = {
+    "trustcall_requests_total": ("counter", "Sampled requests by route, method and status."),
+    "trustcall_request_duration_seconds": ("histogram", "Sampled request latency by route."),
+    "trustcall_db_queries": ("histogram", "SQL queries per sampled request by route."),
+    "trustcall_db_query_duration_seconds_total": ("counter", "Time spent in SQL queries by route."),
+    "trustcall_cache_requests_total": ("counter", "Cache lookups by key family and result."),
+    "trustcall_throttle_checks_total": ("counter", "Throttle checks by scope and result."),
+    "trustcall_throttle_duration_seconds_total": ("counter", "Time spent in throttle checks by scope."),
+}
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_histograms = {}
+
+# The RequestMetrics of the sampled request being served, if any. Context
+# variables follow the request into sync_to_async threads.
+_current = contextvars.ContextVar("trustcall_request_metrics", default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+
+
+def sample_rate():
+    return getattr(settings, "METRICS_SAMPLE_RATE", 0.0)
+
+
+def start_request():
+    return _current.set(RequestMetrics())
+
+
+def finish_request(token):
+    metrics = _current.get()
+    _current.reset(token)
+    return metrics
+
+
+def inc(name, labels, amount=1):
+    with _lock:
+        _counters[(name, labels)] += amount
+
+
+def observe(name, labels, value, buckets=LATENCY_BUCKETS):
+    with _lock:
+        histogram = _histograms.get((name, labels))
+        if histogram is None:
+            histogram = _histograms[(name, labels)] = [buckets, [0] * len(buckets), 0.0, 0]
+        for index, bound in enumerate(buckets):
+            if value <= bound:
+                histogram[1][index] += 1
+        histogram[2] += value
+        histogram[3] += 1
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    connection.execute_wrapper hook, installed on every connection.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.query_seconds += time.perf_counter() - started
+
+
+def record_cache(cache_key, hit):
+    if _current.get() is None:
+        return
+    # "search_name_<digest>" -> "search_name"
+    family = "_".join(cache_key.split("_")[:2])
+    inc("trustcall_cache_requests_total", (("family", family), ("result", "hit" if hit else "miss")))
+
+
+def record_throttle(scope, allowed, seconds):
+    if _current.get() is None:
+        return
+    inc("trustcall_throttle_checks_total", (("scope", scope), ("result", "allowed" if allowed else "rejected")))
+    inc("trustcall_throttle_duration_seconds_total", (("scope", scope),), seconds)
+
+
+def record_request(route, method, status_code, seconds, metrics):
+    inc("trustcall_requests_total", (("route", route), ("method", method), ("status", str(status_code))))
+    observe("trustcall_request_duration_seconds", (("route", route),), seconds)
+    observe("trustcall_db_queries", (("route", route),), metrics.queries, QUERY_COUNT_BUCKETS)
+    inc("trustcall_db_query_duration_seconds_total", (("route", route),), metrics.query_seconds)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _format_value(value):
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """
+    Return all metrics in the Prometheus text exposition format.
+    """
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: (h[0], list(h[1]), h[2], h[3]) for key, h in _histograms.items()}
+
+    by_name = defaultdict(list)
+    for (name, labels), value in counters.items():
+        by_name[name].append((labels, value))
+    for (name, labels), histogram in histograms.items():
+        by_name[name].append((labels, histogram))
+
+    lines = [
+        "# HELP trustcall_metrics_sample_rate Fraction of requests recorded.",
+        "# TYPE trustcall_metrics_sample_rate gauge",
+        f"trustcall_metrics_sample_rate {_format_value(float(sample_rate()))}",
+    ]
+    for name in sorted(by_name):
+        kind, help_text = HELP[name]
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        for labels, value in sorted(by_name[name], key=lambda item: item[0]):
+            if kind != "histogram":
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                continue
+            buckets, counts, total, count = value
+            for bound, bucket_count in zip(buckets, counts):
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', _format_value(bound))])} {bucket_count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
@@ -0,0 +1,143 @@
+import random
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_string
+from . import metrics
+from .routers import pin_to_primary
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class MetricsMiddleware:
+    """
+    Record latency, SQL queries and status of METRICS_SAMPLE_RATE of
+    requests per route for the /metrics endpoint.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self._sampled():
+            return self.get_response(request)
+        token, started = metrics.start_request(), time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            request_metrics = metrics.finish_request(token)
+        self._record(request, response, time.perf_counter() - started, request_metrics)
+        return response
+
+    async def __acall__(self, request):
+        if not self._sampled():
+            return await self.get_response(request)
+        token, started = metrics.start_request(), time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_metrics = metrics.finish_request(token)
+        self._record(request, response, time.perf_counter() - started, request_metrics)
+        return response
+
+    @staticmethod
+    def _sampled():
+        rate = metrics.sample_rate()
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    @staticmethod
+    def _record(request, response, seconds, request_metrics):
+        # The URL pattern, not the path, keeps label cardinality bounded.
+        match = request.resolver_match
+        route = (match.url_name or match.route) if match else "unmatched"
+        metrics.record_request(route, request.method, response.status_code, seconds, request_metrics)
+
+
+def accepted_encodings(request):
+    """
+    Content codings in the request's Accept-Encoding, without those sent
+    with q=0.
+    """
+    encodings = set()
+    for part in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        coding, *params = [item.strip() for item in part.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding and quality > 0:
+            encodings.add(coding.lower())
+    return encodings
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress responses of at least COMPRESSION_MIN_LENGTH bytes with Brotli
+    when the client accepts it and the brotli package is installed, or with
+    gzip otherwise. Streaming responses are left alone; contact exports
+    offer their own compress=gzip.
+    """
+
+    def process_response(self, request, response):
+        if (
+            response.streaming
+            or response.has_header("Content-Encoding")
+            or len(response.content) < getattr(settings, "COMPRESSION_MIN_LENGTH", 1024)
+        ):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encodings = accepted_encodings(request)
+        if brotli is not None and "br" in encodings:
+            encoding, compressed = "br", brotli.compress(response.content, quality=5)
+        elif "gzip" in encodings:
+            encoding, compressed = "gzip", compress_string(response.content)
+        else:
+            return response
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response["Content-Length"] = str(len(compressed))
+        # The bytes changed, so a strong ETag no longer holds.
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = f"W/{etag}"
+        response["Content-Encoding"] = encoding
+        return response
+
+
+class ReadYourWritesMiddleware(MiddlewareMixin):
+    """
+    Pin a user who made a successful write to the primary database for
+    READ_REPLICA_PIN_SECONDS, so replica lag never hides their own changes
+    from the read endpoints.
+    """
+
+    def process_response(self, request, response):
+        if (
+            getattr(settings, "READ_REPLICA_DATABASES", [])
+            and request.method not in ("GET", "HEAD", "OPTIONS")
+            and response.status_code < 400
+        ):
+            # DRF copies the token-authenticated user onto the Django request.
+            user = getattr(request, "user", None)
+            if user is not None and user.is_authenticated:
+                pin_to_primary(user.pk)
+        return response
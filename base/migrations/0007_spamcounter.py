@@ -0,0 +1,39 @@
+# Generated by Django 5.1.2 on 2026-10-17 20:56
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_counters(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    SpamReport = apps.get_model('base', 'SpamReport')
+    SpamCounter = apps.get_model('base', 'SpamCounter')
+    counters = [
+        SpamCounter(phone_number=row['phone_number'], report_count=row['report_count'])
+        for row in SpamReport.objects.using(db_alias)
+        .values('phone_number')
+        .annotate(report_count=Count('id'))
+    ]
+    counters.append(
+        SpamCounter(phone_number='__total__', report_count=sum(c.report_count for c in counters))
+    )
+    SpamCounter.objects.using(db_alias).bulk_create(counters, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0006_delete_globalphonebook_delete_spamrecord_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpamCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phone_number', models.CharField(max_length=15, unique=True)),
+                ('report_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.1.2 on 2026-10-17 20:57
+
+from django.db import migrations, models
+
+PG_TRIGRAM_INDEXES = [
+    ('base_user_username_trgm', 'base_user', 'username'),
+    ('base_contact_name_trgm', 'base_contact', 'name'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for index_name, table, column in PG_TRIGRAM_INDEXES:
+            schema_editor.execute(
+                f'CREATE INDEX IF NOT EXISTS {index_name} ON {table} '
+                f'USING gin (UPPER({column}::text) gin_trgm_ops)'
+            )
+        return
+
+    User = apps.get_model('base', 'User')
+    Contact = apps.get_model('base', 'Contact')
+    NameTrigram = apps.get_model('base', 'NameTrigram')
+    postings = []
+    for source, rows in (
+        ('user', User.objects.values_list('pk', 'username')),
+        ('contact', Contact.objects.values_list('pk', 'name')),
+    ):
+        for object_id, name in rows.iterator(chunk_size=2000):
+            name = name.lower()
+            for trigram in {name[i:i + 3] for i in range(len(name) - 2)}:
+                postings.append(NameTrigram(trigram=trigram, source=source, object_id=object_id))
+    NameTrigram.objects.bulk_create(postings, batch_size=2000)
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for index_name, _, _ in PG_TRIGRAM_INDEXES:
+            schema_editor.execute(f'DROP INDEX IF EXISTS {index_name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0007_spamcounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NameTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('source', models.CharField(choices=[('user', 'User'), ('contact', 'Contact')], max_length=7)),
+                ('object_id', models.BigIntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['source', 'object_id'], name='base_nametr_source_10c505_idx')],
+                'unique_together': {('trigram', 'source', 'object_id')},
+            },
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,115 @@
+# Generated by Django 5.1.2 on 2026-10-17 21:10
+
+import re
+
+import phonenumbers
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def canonical_phone_number(phone_number, region):
+    phone_number = (phone_number or '').strip()
+    if not phone_number:
+        return ''
+    try:
+        parsed = phonenumbers.parse(phone_number, region)
+    except phonenumbers.NumberParseException:
+        parsed = None
+    if parsed is not None and phonenumbers.is_possible_number(parsed):
+        return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
+    return re.sub(r'[^\d+]', '', phone_number)[:16]
+
+
+def backfill_phone_keys(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    region = getattr(settings, 'PHONE_NUMBER_DEFAULT_REGION', 'IN')
+    for model_name in ('User', 'Contact', 'SpamReport'):
+        model = apps.get_model('base', model_name)
+        batch = []
+        for row in model.objects.using(db_alias).only('pk', 'phone_number').iterator(chunk_size=2000):
+            row.phone_key = canonical_phone_number(row.phone_number, region)
+            batch.append(row)
+            if len(batch) == 2000:
+                model.objects.using(db_alias).bulk_update(batch, ['phone_key'])
+                batch = []
+        model.objects.using(db_alias).bulk_update(batch, ['phone_key'])
+
+    # Reports of the same number in different formats collapse onto one key;
+    # keep each reporter's earliest report before the key becomes unique.
+    SpamReport = apps.get_model('base', 'SpamReport')
+    duplicates = (
+        SpamReport.objects.using(db_alias).values('reporter', 'phone_key')
+        .annotate(first_id=Min('id'), reports=Count('id'))
+        .filter(reports__gt=1)
+    )
+    for row in duplicates.iterator():
+        SpamReport.objects.using(db_alias).filter(
+            reporter=row['reporter'], phone_key=row['phone_key']
+        ).exclude(id=row['first_id']).delete()
+
+    SpamCounter = apps.get_model('base', 'SpamCounter')
+    SpamCounter.objects.using(db_alias).all().delete()
+    counters = [
+        SpamCounter(phone_number=row['phone_key'], report_count=row['report_count'])
+        for row in SpamReport.objects.using(db_alias)
+        .values('phone_key')
+        .annotate(report_count=Count('id'))
+    ]
+    counters.append(
+        SpamCounter(phone_number='__total__', report_count=sum(c.report_count for c in counters))
+    )
+    SpamCounter.objects.using(db_alias).bulk_create(counters, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0008_nametrigram'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='phone_key',
+            field=models.CharField(default='', editable=False, max_length=16),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='contact',
+            name='phone_key',
+            field=models.CharField(default='', editable=False, max_length=16),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='spamreport',
+            name='phone_key',
+            field=models.CharField(default='', editable=False, max_length=16),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='spamcounter',
+            name='phone_number',
+            field=models.CharField(max_length=16, unique=True),
+        ),
+        migrations.RunPython(backfill_phone_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='user',
+            name='phone_key',
+            field=models.CharField(db_index=True, editable=False, max_length=16),
+        ),
+        migrations.AlterField(
+            model_name='contact',
+            name='phone_key',
+            field=models.CharField(db_index=True, editable=False, max_length=16),
+        ),
+        migrations.AlterField(
+            model_name='spamreport',
+            name='phone_key',
+            field=models.CharField(db_index=True, editable=False, max_length=16),
+        ),
+        migrations.AlterUniqueTogether(
+            name='spamreport',
+            unique_together={('reporter', 'phone_key')},
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.2 on 2026-10-17 21:25
+
+from django.db import migrations
+from django.db.models import Count, Max
+
+
+def remove_duplicate_contacts(apps, schema_editor):
+    # Keep the most recently saved contact for each (owner, phone_key) pair.
+    Contact = apps.get_model('base', 'Contact')
+    NameTrigram = apps.get_model('base', 'NameTrigram')
+    db_alias = schema_editor.connection.alias
+    duplicates = (
+        Contact.objects.using(db_alias).values('owner', 'phone_key')
+        .annotate(last_id=Max('id'), copies=Count('id'))
+        .filter(copies__gt=1)
+    )
+    for row in duplicates.iterator():
+        stale = Contact.objects.using(db_alias).filter(
+            owner=row['owner'], phone_key=row['phone_key']
+        ).exclude(id=row['last_id'])
+        stale_ids = list(stale.values_list('id', flat=True))
+        NameTrigram.objects.using(db_alias).filter(source='contact', object_id__in=stale_ids).delete()
+        stale.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0009_phone_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_contacts, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='contact',
+            unique_together={('owner', 'phone_key')},
+        ),
+    ]
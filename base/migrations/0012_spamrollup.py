@@ -0,0 +1,61 @@
+# Generated by Django 5.1.2 on 2026-10-17 21:19
+
+import datetime
+
+from django.db import migrations, models
+from django.db.models import Count, Value
+from django.db.models.functions import Substr, TruncDay, TruncHour
+
+
+def populate_rollups(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    SpamReport = apps.get_model('base', 'SpamReport')
+    SpamRollup = apps.get_model('base', 'SpamRollup')
+    utc = datetime.timezone.utc
+    buckets = [
+        ('hour', TruncHour('timestamp', tzinfo=utc), Value('')),
+        ('day', TruncDay('timestamp', tzinfo=utc), Value('')),
+        ('day', TruncDay('timestamp', tzinfo=utc), Substr('phone_key', 1, 5)),
+    ]
+    for granularity, period, prefix in buckets:
+        rows = (
+            SpamReport.objects.using(db_alias).annotate(period_start=period, key_prefix=prefix)
+            .values('period_start', 'key_prefix')
+            .annotate(report_count=Count('id'))
+        )
+        SpamRollup.objects.using(db_alias).bulk_create(
+            [
+                SpamRollup(
+                    granularity=granularity,
+                    period_start=row['period_start'],
+                    prefix=row['key_prefix'],
+                    report_count=row['report_count'],
+                )
+                for row in rows.iterator(chunk_size=2000)
+            ],
+            batch_size=2000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0011_importjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpamRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('period_start', models.DateTimeField()),
+                ('prefix', models.CharField(blank=True, default='', max_length=5)),
+                ('report_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('granularity', 'prefix', 'period_start')},
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.1.2 on 2026-10-17 21:21
+
+import datetime
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+
+ALL_TIME_START = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+# Windowed tiers: bucket length in seconds and buckets per window
+TIERS = {
+    'minutes': (5 * 60, 12),
+    'hour': (60 * 60, 24),
+    'day': (24 * 60 * 60, 7),
+}
+
+
+def populate_leaderboard(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    SpamCounter = apps.get_model('base', 'SpamCounter')
+    SpamReport = apps.get_model('base', 'SpamReport')
+    SpamLeaderboardBucket = apps.get_model('base', 'SpamLeaderboardBucket')
+    capacity = getattr(settings, 'SPAM_LEADERBOARD_CAPACITY', 1000)
+    now = int(datetime.datetime.now(datetime.timezone.utc).timestamp())
+
+    buckets = defaultdict(Counter)
+    oldest = {tier: (now // length - count + 1) * length for tier, (length, count) in TIERS.items()}
+    since = datetime.datetime.fromtimestamp(min(oldest.values()), tz=datetime.timezone.utc)
+    reports = (
+        SpamReport.objects.using(db_alias)
+        .filter(timestamp__gte=since)
+        .values_list('phone_key', 'timestamp')
+    )
+    for phone_key, reported_at in reports.iterator(chunk_size=5000):
+        seconds = int(reported_at.timestamp())
+        for tier, (length, _) in TIERS.items():
+            start = seconds // length * length
+            if start >= oldest[tier]:
+                buckets[(tier, datetime.datetime.fromtimestamp(start, tz=datetime.timezone.utc))][phone_key] += 1
+
+    all_time = (
+        SpamCounter.objects.using(db_alias)
+        .exclude(phone_number='__total__')
+        .order_by('-report_count')[:capacity]
+    )
+    buckets[('all', ALL_TIME_START)] = Counter(dict(all_time.values_list('phone_number', 'report_count')))
+
+    # Exact counts, so every Space-Saving error is 0.
+    SpamLeaderboardBucket.objects.using(db_alias).bulk_create(
+        [
+            SpamLeaderboardBucket(
+                tier=tier,
+                period_start=period_start,
+                counters={key: [count, 0] for key, count in counts.most_common(capacity)},
+            )
+            for (tier, period_start), counts in buckets.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0012_spamrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpamLeaderboardBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tier', models.CharField(max_length=7)),
+                ('period_start', models.DateTimeField()),
+                ('counters', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('tier', 'period_start')},
+            },
+        ),
+        migrations.RunPython(populate_leaderboard, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.2 on 2026-10-17 21:24
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_directory(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    Contact = apps.get_model('base', 'Contact')
+    ContactName = apps.get_model('base', 'ContactName')
+    rows = Contact.objects.using(db_alias).values('phone_key', 'name').annotate(saved_count=Count('id'))
+    ContactName.objects.using(db_alias).bulk_create(
+        [
+            ContactName(phone_key=row['phone_key'], name=row['name'], saved_count=row['saved_count'])
+            for row in rows.iterator(chunk_size=2000)
+        ],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0013_spamleaderboardbucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContactName',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phone_key', models.CharField(max_length=16)),
+                ('name', models.CharField(max_length=100)),
+                ('saved_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('phone_key', 'name')},
+            },
+        ),
+        migrations.RunPython(populate_directory, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.2 on 2026-10-18 10:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0015_importjob_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contactname',
+            index=models.Index(fields=['-saved_count'], name='base_contactname_saved_idx'),
+        ),
+    ]
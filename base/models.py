@@ -1,6 +1,8 @@
+import uuid
 from django.db import models
 from django.contrib.auth.models import AbstractUser
-import phonenumbers
+from django.utils import timezone
+from .phones import normalize_phone_number
 
 
 class User(AbstractUser):
@@ -8,11 +10,16 @@ class User(AbstractUser):
     Custom User model with a phone number field and email address.
     """
     phone_number = models.CharField(max_length=15, unique=True, db_index=True)
+    phone_key = models.CharField(max_length=16, db_index=True, editable=False)
     email = models.EmailField(null=True, blank=True)
 
     USERNAME_FIELD = 'phone_number'
     REQUIRED_FIELDS = ['username']
 
+    def save(self, *args, **kwargs):
+        self.phone_key = normalize_phone_number(self.phone_number)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.username
 
@@ -23,13 +30,40 @@ class Contact(models.Model):
     """
     owner  = models.ForeignKey(User, on_delete=models.CASCADE, related_name="contacts")
     phone_number = models.CharField(max_length=15,db_index=True)
+    phone_key = models.CharField(max_length=16, db_index=True, editable=False)
     name = models.CharField(max_length=100)
 
+    class Meta:
+        unique_together = ('owner', 'phone_key')
+
+    def save(self, *args, **kwargs):
+        self.phone_key = normalize_phone_number(self.phone_number)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.name} ({self.phone_number})"
 
 
+class ContactName(models.Model):
+    """
+    Directory of the distinct names contacts are saved under for each
+    canonical phone key, with how many contacts use each name. Kept up to
+    date with every contact write so phone searches read it instead of
+    scanning every owner's copy of the contact.
+    """
+    phone_key = models.CharField(max_length=16)
+    name = models.CharField(max_length=100)
+    saved_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('phone_key', 'name')
+        # Autocomplete reads the most saved names.
+        indexes = [models.Index(fields=['-saved_count'], name='base_contactname_saved_idx')]
+
+    def __str__(self):
+        return f"{self.phone_key} {self.name!r}: {self.saved_count}"
+
+
 
 
 class SpamReport(models.Model):
@@ -37,14 +71,143 @@ class SpamReport(models.Model):
     Model for tracking spam reports by users for specific phone numbers.
     """
     phone_number = models.CharField(max_length=15)
+    phone_key = models.CharField(max_length=16, db_index=True, editable=False)
     reporter = models.ForeignKey(User, on_delete=models.CASCADE)
     timestamp = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        unique_together = ('reporter', 'phone_number')
+        unique_together = ('reporter', 'phone_key')
         indexes = [
             models.Index(fields=['reporter', 'phone_number']),
         ]
 
+    def save(self, *args, **kwargs):
+        self.phone_key = normalize_phone_number(self.phone_number)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"User {self.username} reported {self.phone_number} as spam"
+
+
+class SpamCounter(models.Model):
+    """
+    Materialized spam report count per canonical phone key. The row keyed
+    by TOTAL_KEY holds the number of reports across all phone numbers.
+    """
+    TOTAL_KEY = "__total__"
+
+    phone_number = models.CharField(max_length=16, unique=True)
+    report_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.phone_number}: {self.report_count}"
+
+
+class SpamRollup(models.Model):
+    """
+    Spam report counts per time bucket, kept up to date with each report so
+    trend queries read a few rows per period instead of every report. Rows
+    with an empty prefix count all numbers; daily rows are also kept per
+    phone key prefix (its first PREFIX_LENGTH characters).
+    """
+    HOUR = "hour"
+    DAY = "day"
+    GRANULARITY_CHOICES = [(HOUR, "Hour"), (DAY, "Day")]
+    PREFIX_LENGTH = 5
+
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES)
+    period_start = models.DateTimeField()
+    prefix = models.CharField(max_length=PREFIX_LENGTH, blank=True, default="")
+    report_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('granularity', 'prefix', 'period_start')
+
+    def __str__(self):
+        return f"{self.granularity} {self.period_start:%Y-%m-%d %H:%M} {self.prefix or '*'}: {self.report_count}"
+
+
+class SpamLeaderboardBucket(models.Model):
+    """
+    Persisted Space-Saving summary of the most reported numbers in one time
+    bucket, merged into by every worker's batched reports. See
+    base.leaderboard.
+    """
+    tier = models.CharField(max_length=7)
+    period_start = models.DateTimeField()
+    # {phone_key: [estimated_count, max_overestimate]}
+    counters = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('tier', 'period_start')
+
+    def __str__(self):
+        return f"{self.tier} {self.period_start:%Y-%m-%d %H:%M}: {len(self.counters)} numbers"
+
+
+class NameTrigram(models.Model):
+    """
+    Posting list entry of the trigram index over user and contact names,
+    used on databases without a native trigram index.
+    """
+    USER = "user"
+    CONTACT = "contact"
+    SOURCE_CHOICES = [(USER, "User"), (CONTACT, "Contact")]
+
+    trigram = models.CharField(max_length=3)
+    source = models.CharField(max_length=7, choices=SOURCE_CHOICES)
+    object_id = models.BigIntegerField()
+
+    class Meta:
+        unique_together = ('trigram', 'source', 'object_id')
+        indexes = [
+            models.Index(fields=['source', 'object_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.trigram!r} -> {self.source} {self.object_id}"
+
+
+class ImportJob(models.Model):
+    """
+    Contact CSV import running in the background worker pool.
+    """
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="import_jobs")
+    file = models.FileField(upload_to="imports/")
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default=PENDING)
+    rows_processed = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    updated_count = models.PositiveIntegerField(default=0)
+    skipped_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Saved with every status change and progress update
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def throughput(self):
+        """
+        Rows processed per second since the job started.
+        """
+        if self.started_at is None:
+            return 0
+        elapsed = ((self.finished_at or timezone.now()) - self.started_at).total_seconds()
+        return round(self.rows_processed / elapsed, 1) if elapsed > 0 else 0
+
+    def __str__(self):
+        return f"Import {self.id} ({self.status})"
@@ -0,0 +1,38 @@
+import re
+from functools import lru_cache
+from django.conf import settings
+import phonenumbers
+
+NON_DIALABLE = re.compile(r"[^\d+]")
+
+
+@lru_cache(maxsize=65536)
+def _canonical_phone_number(phone_number, region):
+    try:
+        parsed = phonenumbers.parse(phone_number, region)
+    except phonenumbers.NumberParseException:
+        parsed = None
+    if parsed is not None and phonenumbers.is_possible_number(parsed):
+        return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
+    # Keep unparsable input searchable under a formatting-insensitive key.
+    return NON_DIALABLE.sub("", phone_number)[:16]
+
+
+def normalize_phone_number(phone_number):
+    """
+    Return the canonical E.164 key for a phone number as entered by a
+    client, e.g. "+91 98765 43210" -> "+919876543210". Numbers without a
+    country code are read in PHONE_NUMBER_DEFAULT_REGION.
+    """
+    if not phone_number:
+        return ""
+    region = getattr(settings, "PHONE_NUMBER_DEFAULT_REGION", "IN")
+    return _canonical_phone_number(str(phone_number).strip(), region)
+
+
+def is_dialable(phone_key):
+    """
+    Whether a key returned by normalize_phone_number holds a number at all;
+    input such as "+" or "call me" normalizes to a key without digits.
+    """
+    return any(char.isdigit() for char in phone_key)
@@ -0,0 +1,219 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+from bisect import insort
+from django.conf import settings
+from django.db import connections
+from django.db.models import Max
+from .models import SpamReport, SpamCounter
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings, sized for `capacity` items at the
+    given false-positive rate. Uses double hashing of one blake2b digest.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+        self.num_bits = max(8, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    @property
+    def false_positive_rate(self):
+        """
+        Expected false-positive rate at the current number of items.
+        """
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    @property
+    def memory_bytes(self):
+        return len(self.bits)
+
+
+def _add_new(bloom, phone_key):
+    # Refreshes reread recent reports, which must not count twice towards
+    # the capacity that triggers a rebuild.
+    if phone_key not in bloom:
+        bloom.add(phone_key)
+
+
+class ReportedNumbers:
+    """
+    Per-worker set of phone keys that have ever been reported as spam.
+
+    The filter is updated immediately by this worker's own reports and
+    pulls other workers' reports every REPORTED_NUMBERS_REFRESH_SECONDS from
+    SpamReport ids above a watermark. Ids are assigned before commit, so a
+    report can commit after a higher id was already read; each refresh
+    therefore rereads the ids of the last REPORTED_NUMBERS_REFRESH_OVERLAP
+    seconds. Reports whose transaction took longer than that are picked up
+    by the full rebuild from SpamCounter every
+    REPORTED_NUMBERS_REBUILD_SECONDS, which also runs when the filter fills
+    past its capacity. Full builds run in a background thread; until the
+    first one finishes every number counts as possibly reported.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._filter = None
+        # (time.monotonic(), watermark) after each build and refresh, oldest
+        # first, back to the first one older than the overlap window
+        self._watermarks = []
+        self._refreshed_at = 0
+        self._built_at = None
+        # Reports added while a full build reads the tables
+        self._pending = None
+
+    @property
+    def refresh_interval(self):
+        return getattr(settings, "REPORTED_NUMBERS_REFRESH_SECONDS", 5)
+
+    @property
+    def refresh_overlap(self):
+        return getattr(settings, "REPORTED_NUMBERS_REFRESH_OVERLAP", 60)
+
+    @property
+    def rebuild_interval(self):
+        return getattr(settings, "REPORTED_NUMBERS_REBUILD_SECONDS", 60 * 60)
+
+    @property
+    def error_rate(self):
+        return getattr(settings, "REPORTED_NUMBERS_ERROR_RATE", 0.01)
+
+    def rebuild(self):
+        """
+        Build a new filter from SpamCounter and swap it in.
+        """
+        with self._lock:
+            self._pending = []
+        try:
+            started = time.monotonic()
+            watermark = SpamReport.objects.aggregate(last_id=Max("id"))["last_id"] or 0
+            phone_keys = SpamCounter.objects.exclude(
+                phone_number=SpamCounter.TOTAL_KEY
+            ).values_list("phone_number", flat=True)
+            # Leave room to grow before the false-positive rate degrades.
+            bloom = BloomFilter(max(phone_keys.count() * 2, 100_000), self.error_rate)
+            for phone_key in phone_keys.iterator(chunk_size=5000):
+                bloom.add(phone_key)
+        except BaseException:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            for phone_key in self._pending:
+                _add_new(bloom, phone_key)
+            self._pending = None
+            self._filter = bloom
+            # Earlier watermarks still bound the reports that may commit late.
+            insort(self._watermarks, (started, watermark))
+            self._built_at = self._refreshed_at = started
+
+    def _rebuild_in_background(self):
+        if not self._build_lock.acquire(blocking=False):
+            return  # Another thread is already rebuilding.
+
+        def run():
+            try:
+                self.rebuild()
+            except Exception:
+                logger.exception("Rebuilding the reported numbers filter failed")
+            finally:
+                self._build_lock.release()
+                connections.close_all()
+
+        threading.Thread(target=run, name="reported-numbers", daemon=True).start()
+
+    def refresh(self):
+        """
+        Add the reports made since the last refresh, and start a full
+        rebuild in the background when one is due.
+        """
+        if self._filter is None or (
+            time.monotonic() - self._built_at > self.rebuild_interval
+            or self._filter.count > self._filter.capacity
+        ):
+            self._rebuild_in_background()
+        if self._filter is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            cutoff = now - self.refresh_overlap
+            while len(self._watermarks) > 1 and self._watermarks[1][0] <= cutoff:
+                self._watermarks.pop(0)
+            since = self._watermarks[0][1]
+            watermark = max(mark for _, mark in self._watermarks)
+            # Requests arriving meanwhile see the refresh as done rather than
+            # running it again; if the query fails, the next one rereads
+            # from the same watermark.
+            self._refreshed_at = now
+        # The query runs without the lock, so reports added by other
+        # request threads never wait for the database.
+        phone_keys = []
+        new_reports = SpamReport.objects.filter(id__gt=since).values_list("id", "phone_key")
+        for report_id, phone_key in new_reports.iterator(chunk_size=5000):
+            phone_keys.append(phone_key)
+            watermark = max(watermark, report_id)
+        with self._lock:
+            # A rebuild may have swapped the filter in the meantime; adding
+            # to the new one is harmless.
+            for phone_key in phone_keys:
+                _add_new(self._filter, phone_key)
+            insort(self._watermarks, (now, watermark))
+
+    def is_due(self):
+        return time.monotonic() - self._refreshed_at > self.refresh_interval
+
+    def add(self, phone_key):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(phone_key)
+            if self._filter is not None:
+                _add_new(self._filter, phone_key)
+
+    def might_be_reported(self, phone_key):
+        """
+        False only if `phone_key` has never been reported; callers must
+        refresh() first when is_due().
+        """
+        bloom = self._filter
+        return bloom is None or phone_key in bloom
+
+    def stats(self):
+        bloom = self._filter
+        if bloom is None:
+            return {"numbers": 0, "memory_bytes": 0, "false_positive_rate": 0.0}
+        return {
+            "numbers": bloom.count,
+            "capacity": bloom.capacity,
+            "hashes": bloom.num_hashes,
+            "memory_bytes": bloom.memory_bytes,
+            "false_positive_rate": bloom.false_positive_rate,
+        }
+
+
+reported_numbers = ReportedNumbers()
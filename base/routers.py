@@ -0,0 +1,124 @@
+"""
+Read-replica routing for the heavy read endpoints.
+
+Views decorated with @use_read_replica run their reads against a random
+healthy alias in READ_REPLICA_DATABASES; everything else, and every write,
+uses the default database. Replicas lag behind the primary, so a user who
+has just written is pinned to the primary for READ_REPLICA_PIN_SECONDS
+(see ReadYourWritesMiddleware) and reads back what they wrote.
+
+Results cached under write generations (base.caching.get_or_compute) are
+always computed from the primary: a result read from a lagging replica
+would be stored under a generation newer than its data and outlive both
+the invalidation and the pinning.
+"""
+import contextvars
+import functools
+import random
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+# The replica alias reads go to in the current request, if any
+_read_alias = contextvars.ContextVar("trustcall_read_alias", default=None)
+
+# Replica alias -> time.monotonic() until which it is skipped after failing
+_unhealthy = {}
+
+
+def pin_key(user_id):
+    return f"db_pin_{user_id}"
+
+
+def pin_to_primary(user_id):
+    cache.set(pin_key(user_id), 1, timeout=getattr(settings, "READ_REPLICA_PIN_SECONDS", 5))
+
+
+def is_pinned(user_id):
+    return cache.get(pin_key(user_id)) is not None
+
+
+def healthy_replicas():
+    now = time.monotonic()
+    return [
+        alias
+        for alias in getattr(settings, "READ_REPLICA_DATABASES", [])
+        if _unhealthy.get(alias, 0) <= now
+    ]
+
+
+def mark_unhealthy(alias):
+    _unhealthy[alias] = time.monotonic() + getattr(settings, "READ_REPLICA_RETRY_SECONDS", 30)
+
+
+@contextmanager
+def reading_from(alias):
+    token = _read_alias.set(alias)
+    try:
+        yield alias
+    finally:
+        _read_alias.reset(token)
+
+
+def reading_from_primary():
+    return reading_from(None)
+
+
+def use_read_replica(view):
+    """
+    Run a read-only view's queries on a read replica, falling back to the
+    primary when none is healthy, the user is pinned, or the replica fails
+    to answer. Goes under @api_view and friends, so the user is known.
+
+    Querysets that are evaluated after the view returns, e.g. streamed
+    responses, must be bound with .using(router.db_for_read(model)).
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        replicas = healthy_replicas()
+        user_id = getattr(request.user, "pk", None)
+        if not replicas or (user_id is not None and is_pinned(user_id)):
+            return view(request, *args, **kwargs)
+        alias = random.choice(replicas)
+        try:
+            with reading_from(alias):
+                return view(request, *args, **kwargs)
+        except OperationalError:
+            # Retrying is safe: the view only reads.
+            mark_unhealthy(alias)
+            return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+class ReadReplicaRouter:
+    """
+    Send reads to the replica chosen for the current request, if any, and
+    everything else to the default database. Reads inside a transaction on
+    the default database, e.g. select_for_update(), stay on it, and
+    migrations only run there.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema and data from the primary.
+        if db in getattr(settings, "READ_REPLICA_DATABASES", []):
+            return False
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        aliases = {DEFAULT_DB_ALIAS, *getattr(settings, "READ_REPLICA_DATABASES", [])}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
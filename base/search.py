@@ -0,0 +1,99 @@
+from django.db import connection, transaction
+from django.db.models import Count
+from .models import NameTrigram, User, Contact
+
+TRIGRAM_SIZE = 3
+
+
+def uses_native_trigram_index():
+    """
+    PostgreSQL serves icontains lookups from the pg_trgm GIN indexes, so the
+    NameTrigram side table is only maintained on other backends.
+    """
+    return connection.vendor == "postgresql"
+
+
+def name_trigrams(text):
+    text = text.lower()
+    return {text[i:i + TRIGRAM_SIZE] for i in range(len(text) - TRIGRAM_SIZE + 1)}
+
+
+@transaction.atomic
+def index_names(source, entries):
+    """
+    Replace the postings of `entries`, an iterable of (object_id, name) pairs.
+    """
+    entries = list(entries)
+    if not entries or uses_native_trigram_index():
+        return
+    NameTrigram.objects.filter(
+        source=source, object_id__in=[object_id for object_id, _ in entries]
+    ).delete()
+    _create_postings(source, entries)
+
+
+def _create_postings(source, entries):
+    NameTrigram.objects.bulk_create(
+        [
+            NameTrigram(trigram=trigram, source=source, object_id=object_id)
+            for object_id, name in entries
+            for trigram in name_trigrams(name)
+        ],
+        batch_size=2000,
+        ignore_conflicts=True,
+    )
+
+
+def unindex_names(source, object_ids):
+    if uses_native_trigram_index():
+        return
+    NameTrigram.objects.filter(source=source, object_id__in=list(object_ids)).delete()
+
+
+def filter_by_name(queryset, field, source, query):
+    """
+    Restrict `queryset` to rows whose `field` contains `query`, ignoring case.
+
+    Outside PostgreSQL the candidate ids come from intersecting the posting
+    lists of every trigram of the query; the icontains check then discards
+    rows that contain all trigrams but not the whole substring.
+    """
+    contains = {f"{field}__icontains": query}
+    grams = name_trigrams(query)
+    if uses_native_trigram_index() or not grams:
+        return queryset.filter(**contains)
+
+    candidates = (
+        NameTrigram.objects.filter(source=source, trigram__in=grams)
+        .values("object_id")
+        .annotate(matched=Count("trigram"))
+        .filter(matched=len(grams))
+        .values("object_id")
+    )
+    return queryset.filter(pk__in=candidates, **contains)
+
+
+@transaction.atomic
+def rebuild_name_index():
+    """
+    Recompute the NameTrigram table from all users and contacts.
+    Returns the number of names indexed.
+    """
+    if uses_native_trigram_index():
+        return 0
+    NameTrigram.objects.all().delete()
+    indexed = 0
+    for source, queryset, field in (
+        (NameTrigram.USER, User.objects.all(), "username"),
+        (NameTrigram.CONTACT, Contact.objects.all(), "name"),
+    ):
+        batch = []
+        for entry in queryset.values_list("pk", field).iterator(chunk_size=2000):
+            batch.append(entry)
+            if len(batch) == 2000:
+                _create_postings(source, batch)
+                indexed += len(batch)
+                batch = []
+        _create_postings(source, batch)
+        indexed += len(batch)
+    return indexed
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import User, Contact, SpamReport
+from .phones import normalize_phone_number
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -12,6 +13,11 @@ class UserSerializer(serializers.ModelSerializer):
         user = User.objects.create_user(**validated_data)
         return user
 
+    def validate_phone_number(self, value):
+        if User.objects.filter(phone_key=normalize_phone_number(value)).exists():
+            raise serializers.ValidationError("A user with this phone number already exists.")
+        return value
+
 
 class ContactSerializer(serializers.ModelSerializer):
     class Meta:
@@ -27,7 +33,8 @@ class ContactSerializer(serializers.ModelSerializer):
         request = self.context.get("request")
         phone_number = data.get('phone_number')
         # Check if the contact already exists for the authenticated user.
-        if Contact.objects.filter(owner=request.user, phone_number=phone_number).exists():
+        phone_key = normalize_phone_number(phone_number)
+        if Contact.objects.filter(owner=request.user, phone_key=phone_key).exists():
             raise serializers.ValidationError("A contact with this phone number already exists.")
         return data
 
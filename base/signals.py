@@ -0,0 +1,105 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver, Signal
+from .models import User, Contact, NameTrigram
+from .search import index_names, unindex_names
+from .directory import update_name_directory
+from .autocomplete import prefix_index
+from .authentication import invalidate_cached_user
+from .metrics import record_query
+from .caching import (
+    bump_generations_on_commit,
+    import_generation_keys,
+    name_write_generation_keys,
+    phone_generation_key,
+)
+
+# Sent after a bulk contact import, which bypasses post_save. Receives the
+# owner, the phone keys of the contacts that were created or updated, and
+# the names the updated ones had before as previous_names {phone_key: name}.
+contacts_imported = Signal()
+
+
+def update_contact_names(changes):
+    # Apply (phone_key, name, delta) changes to the directory and to the
+    # names autocomplete offers.
+    for phone_key, name, delta in changes:
+        if delta > 0:
+            prefix_index.add_contact_name(name, phone_key)
+    for phone_key, name in update_name_directory(changes):
+        prefix_index.remove_contact_name(name, phone_key)
+
+
+def invalidate_searches(name, phone_key):
+    # The phone generation also covers who has the number saved, i.e. the
+    # emails a caller with that number may see.
+    bump_generations_on_commit(name_write_generation_keys(name) + [phone_generation_key(phone_key)])
+
+
+@receiver(post_save, sender=User)
+def index_user_name(sender, instance, **kwargs):
+    index_names(NameTrigram.USER, [(instance.pk, instance.username)])
+    prefix_index.add_user(instance.pk, instance.username, instance.phone_number)
+    invalidate_searches(instance.username, instance.phone_key)
+    # Covers password changes and deactivation.
+    invalidate_cached_user(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def unindex_user_name(sender, instance, **kwargs):
+    unindex_names(NameTrigram.USER, [instance.pk])
+    prefix_index.remove_user(instance.pk)
+    invalidate_searches(instance.username, instance.phone_key)
+    invalidate_cached_user(instance.pk)
+
+
+@receiver(pre_save, sender=Contact)
+def remember_saved_contact_name(sender, instance, **kwargs):
+    # The directory entry the contact leaves behind if its name changes.
+    instance._saved_name = None
+    if instance.pk is not None:
+        instance._saved_name = (
+            Contact.objects.filter(pk=instance.pk).values_list("phone_key", "name").first()
+        )
+
+
+@receiver(post_save, sender=Contact)
+def index_contact_name(sender, instance, **kwargs):
+    changes = [(instance.phone_key, instance.name, 1)]
+    saved_name = getattr(instance, "_saved_name", None)
+    if saved_name is not None:
+        changes.append((*saved_name, -1))
+        # Searches of the number the contact had before change as well.
+        invalidate_searches(saved_name[1], saved_name[0])
+    update_contact_names(changes)
+    index_names(NameTrigram.CONTACT, [(instance.pk, instance.name)])
+    invalidate_searches(instance.name, instance.phone_key)
+
+
+@receiver(post_delete, sender=Contact)
+def unindex_contact_name(sender, instance, **kwargs):
+    update_contact_names([(instance.phone_key, instance.name, -1)])
+    unindex_names(NameTrigram.CONTACT, [instance.pk])
+    invalidate_searches(instance.name, instance.phone_key)
+
+
+@receiver(contacts_imported)
+def index_imported_contact_names(sender, owner, phone_keys, previous_names=None, **kwargs):
+    contacts = list(
+        Contact.objects.filter(owner=owner, phone_key__in=phone_keys).values_list(
+            "pk", "name", "phone_key"
+        )
+    )
+    update_contact_names(
+        [(phone_key, name, 1) for _, name, phone_key in contacts]
+        + [(phone_key, name, -1) for phone_key, name in (previous_names or {}).items()]
+    )
+    index_names(NameTrigram.CONTACT, [(pk, name) for pk, name, _ in contacts])
+    bump_generations_on_commit(import_generation_keys({phone_key for _, _, phone_key in contacts}))
+
+
+@receiver(connection_created)
+def install_query_metrics(sender, connection, **kwargs):
+    # Counts queries of sampled requests only; see base.metrics.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
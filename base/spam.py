@@ -0,0 +1,218 @@
+import datetime
+from collections import Counter
+from asgiref.sync import sync_to_async
+from django.db import connection, transaction
+from django.db.models import Count, Value
+from django.db.models.functions import Substr, TruncDay, TruncHour
+from django.utils import timezone
+from .models import SpamReport, SpamCounter, SpamRollup
+from .phones import is_dialable, normalize_phone_number
+from .reported import reported_numbers
+from .leaderboard import spam_leaderboard
+
+
+def add_counts(model, key_columns, rows, count_column="report_count"):
+    """
+    Add each row's trailing count to `count_column` of the `model` row with
+    the same key columns, inserting missing rows, in one statement. Rows are
+    written in key order so concurrent writers lock them in the same order
+    and cannot deadlock.
+    """
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    count = qn(count_column)
+    columns = ", ".join(qn(column) for column in [*key_columns, count_column])
+    placeholders = ", ".join(["(" + ", ".join(["%s"] * (len(key_columns) + 1)) + ")"] * len(rows))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} ({columns}) VALUES {placeholders} "
+            f"ON CONFLICT ({', '.join(qn(column) for column in key_columns)}) DO UPDATE "
+            f"SET {count} = {table}.{count} + EXCLUDED.{count}",
+            [value for row in sorted(rows) for value in row],
+        )
+
+
+def increment_spam_counters(phone_keys):
+    """
+    Add one report per key in `phone_keys` to its counter and to the global
+    total with a single upsert. Must run in the same transaction as the
+    SpamReport insert.
+    """
+    phone_keys = sorted(set(phone_keys))
+    if not phone_keys:
+        return
+    add_counts(
+        SpamCounter,
+        ["phone_number"],
+        [(key, 1) for key in phone_keys] + [(SpamCounter.TOTAL_KEY, len(phone_keys))],
+    )
+    transaction.on_commit(lambda: [reported_numbers.add(key) for key in phone_keys])
+
+
+def increment_spam_rollups(phone_keys, reported_at):
+    """
+    Add the reports of `phone_keys` made at `reported_at` to the hourly and
+    daily totals and to the daily total of each key's prefix.
+    """
+    if not phone_keys:
+        return
+    hour = reported_at.astimezone(datetime.timezone.utc).replace(minute=0, second=0, microsecond=0)
+    day = hour.replace(hour=0)
+    per_prefix = Counter(key[:SpamRollup.PREFIX_LENGTH] for key in phone_keys)
+    adapt = connection.ops.adapt_datetimefield_value
+    add_counts(
+        SpamRollup,
+        ["granularity", "prefix", "period_start"],
+        [
+            (SpamRollup.HOUR, "", adapt(hour), len(phone_keys)),
+            (SpamRollup.DAY, "", adapt(day), len(phone_keys)),
+        ] + [
+            (SpamRollup.DAY, prefix, adapt(day), count)
+            for prefix, count in per_prefix.items()
+        ],
+    )
+
+
+@transaction.atomic
+def report_spam(reporter, phone_numbers):
+    """
+    Record a spam report from `reporter` for each of `phone_numbers` with one
+    conflict-ignoring insert and update the counters. Returns the set of
+    phone keys that were newly reported; the rest were already reported by
+    this user.
+    """
+    reports = {}
+    for phone_number in phone_numbers:
+        phone_key = normalize_phone_number(phone_number)
+        # Input without digits has no number to report.
+        if is_dialable(phone_key):
+            reports.setdefault(phone_key, phone_number)
+    if not reports:
+        return set()
+
+    qn = connection.ops.quote_name
+    table = qn(SpamReport._meta.db_table)
+    rows = ", ".join(["(%s, %s, %s, %s)"] * len(reports))
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (phone_number, phone_key, reporter_id, {qn('timestamp')}) "
+            f"VALUES {rows} ON CONFLICT (reporter_id, phone_key) DO NOTHING "
+            f"RETURNING phone_key",
+            [
+                value
+                for phone_key, phone_number in reports.items()
+                for value in (
+                    phone_number, phone_key, reporter.pk,
+                    connection.ops.adapt_datetimefield_value(now),
+                )
+            ],
+        )
+        created = {phone_key for (phone_key,) in cursor.fetchall()}
+    increment_spam_counters(created)
+    increment_spam_rollups(created, now)
+    if created:
+        # robust: a failed leaderboard flush keeps its counts for the next
+        # flush instead of failing a request whose reports are committed.
+        transaction.on_commit(lambda: spam_leaderboard.record(created, now), robust=True)
+    return created
+
+
+def _counters(phone_keys):
+    return SpamCounter.objects.filter(
+        phone_number__in=[*phone_keys, SpamCounter.TOTAL_KEY]
+    ).values_list("phone_number", "report_count")
+
+
+def _possibly_reported(phone_keys):
+    return {key for key in phone_keys if reported_numbers.might_be_reported(key)}
+
+
+def spam_likelihoods(phone_keys):
+    """
+    Return a {phone_key: likelihood} dict for the given canonical phone keys
+    using a single read of the counter table. Keys the reported-numbers
+    filter rules out score 0 without touching the database.
+    """
+    phone_keys = set(phone_keys)
+    if reported_numbers.is_due():
+        reported_numbers.refresh()
+    candidates = _possibly_reported(phone_keys)
+    counts = dict(_counters(candidates)) if candidates else {}
+    return likelihoods_from_counts(phone_keys, counts)
+
+
+async def aspam_likelihoods(phone_keys):
+    phone_keys = set(phone_keys)
+    if reported_numbers.is_due():
+        await sync_to_async(reported_numbers.refresh)()
+    candidates = _possibly_reported(phone_keys)
+    counts = {key: count async for key, count in _counters(candidates)} if candidates else {}
+    return likelihoods_from_counts(phone_keys, counts)
+
+
+def likelihoods_from_counts(phone_keys, counts):
+    """
+    Return {phone_key: likelihood} given a {key: report_count} dict that
+    includes SpamCounter.TOTAL_KEY; missing keys count as unreported.
+    """
+    total_reports = counts.get(SpamCounter.TOTAL_KEY, 0)
+    if total_reports == 0:
+        return {phone_key: 0.0 for phone_key in phone_keys}
+
+    return {
+        phone_key: min(100, round(counts.get(phone_key, 0) / total_reports * 100, 2))
+        for phone_key in phone_keys
+    }
+
+
+@transaction.atomic
+def rebuild_spam_counters():
+    """
+    Recompute every counter from SpamReport. Returns the total report count.
+    """
+    SpamCounter.objects.all().delete()
+    per_number = SpamReport.objects.values("phone_key").annotate(
+        report_count=Count("id")
+    )
+    counters = [
+        SpamCounter(phone_number=row["phone_key"], report_count=row["report_count"])
+        for row in per_number.iterator(chunk_size=2000)
+    ]
+    total_reports = sum(counter.report_count for counter in counters)
+    counters.append(SpamCounter(phone_number=SpamCounter.TOTAL_KEY, report_count=total_reports))
+    SpamCounter.objects.bulk_create(counters, batch_size=2000)
+    return total_reports
+
+
+@transaction.atomic
+def rebuild_spam_rollups():
+    """
+    Recompute every trend rollup from SpamReport. Returns the number of
+    rollup rows written.
+    """
+    SpamRollup.objects.all().delete()
+    utc = datetime.timezone.utc
+    buckets = [
+        (SpamRollup.HOUR, TruncHour("timestamp", tzinfo=utc), Value("")),
+        (SpamRollup.DAY, TruncDay("timestamp", tzinfo=utc), Value("")),
+        (SpamRollup.DAY, TruncDay("timestamp", tzinfo=utc), Substr("phone_key", 1, SpamRollup.PREFIX_LENGTH)),
+    ]
+    rollups = []
+    for granularity, period, prefix in buckets:
+        rows = (
+            SpamReport.objects.annotate(period_start=period, key_prefix=prefix)
+            .values("period_start", "key_prefix")
+            .annotate(report_count=Count("id"))
+        )
+        rollups += [
+            SpamRollup(
+                granularity=granularity,
+                period_start=row["period_start"],
+                prefix=row["key_prefix"],
+                report_count=row["report_count"],
+            )
+            for row in rows.iterator(chunk_size=2000)
+        ]
+    SpamRollup.objects.bulk_create(rollups, batch_size=2000)
+    return len(rollups)
@@ -1,3 +1,1297 @@
-from django.test import TestCase
+import csv
+import datetime
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from unittest import mock, skipUnless
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connections, router
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.urls import resolve, reverse
+from asgiref.sync import sync_to_async
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from . import authentication, jobs, metrics, middleware, routers
+from .autocomplete import prefix_index
+from .caching import LOCK_WAIT, get_or_compute
+from .exports import EXPORT_CHUNK_SIZE
+from .imports import import_contacts
+from .leaderboard import SpaceSaving, SpamLeaderboard, spam_leaderboard
+from .middleware import CompressionMiddleware
+from .models import User, Contact, ContactName, ImportJob, NameTrigram, SpamLeaderboardBucket, SpamReport, SpamRollup
+from .reported import BloomFilter, ReportedNumbers, reported_numbers
+from .spam import rebuild_spam_rollups, report_spam
+from .views import PERSON_DETAIL_BATCH_LIMIT, TOP_SPAM_NUMBERS_LIMIT
 
-# Create your tests here.
+
+def bypass_reported_numbers(test):
+    """
+    Treat every number as possibly reported for the rest of `test`, without
+    the background builds of the process-wide filter, which would read the
+    test database from another thread, or a filter another test built.
+    """
+    for patcher in [
+        mock.patch.object(reported_numbers, "is_due", return_value=False),
+        mock.patch.object(reported_numbers, "_filter", None),
+    ]:
+        patcher.start()
+        test.addCleanup(patcher.stop)
+
+
+class PersonDetailQueryCountTests(TestCase):
+    """
+    person_detail is the highest-QPS endpoint; it must stay a single
+    database round trip whatever the number resolves to.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user(username="viewer", phone_number="+919800000001")
+        cls.owner = User.objects.create_user(
+            username="owner", phone_number="+919800000002", email="owner@example.com"
+        )
+        Contact.objects.create(owner=cls.owner, name="Viewer", phone_number="+919800000001")
+        Contact.objects.create(owner=cls.owner, name="Unregistered", phone_number="+919800000003")
+        report_spam(cls.viewer, ["+919800000003", "+919800000004"])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def get_detail(self, phone_number):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("person_detail", args=[phone_number]))
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_registered_user_with_visible_email(self):
+        self.assertEqual(self.get_detail("+919800000002"), {
+            "name": "owner",
+            "phone_number": "+919800000002",
+            "spam_likelihood": 0.0,
+            "email": "owner@example.com",
+            "is_registered_user": True,
+        })
+
+    def test_email_hidden_when_viewer_not_in_contacts(self):
+        self.client.force_authenticate(self.owner)
+        self.assertIsNone(self.get_detail("+919800000001")["email"])
+
+    def test_unregistered_number_falls_back_to_contact_name(self):
+        self.assertEqual(self.get_detail("09800000003"), {
+            "name": "Unregistered",
+            "phone_number": "09800000003",
+            "spam_likelihood": 50.0,
+            "email": None,
+            "is_registered_user": False,
+        })
+
+    def test_unknown_number(self):
+        data = self.get_detail("+919800000009")
+        self.assertIsNone(data["name"])
+        self.assertFalse(data["is_registered_user"])
+        self.assertEqual(data["spam_likelihood"], 0.0)
+
+
+class PersonDetailBatchTests(TestCase):
+    """
+    The batch caller-ID lookup takes a fixed number of queries whatever the
+    number of phone numbers.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user(username="viewer", phone_number="+919800000001")
+        cls.owner = User.objects.create_user(
+            username="owner", phone_number="+919800000002", email="owner@example.com"
+        )
+        Contact.objects.create(owner=cls.owner, name="Viewer", phone_number="+919800000001")
+        Contact.objects.create(owner=cls.owner, name="Unregistered", phone_number="+919800000003")
+        report_spam(cls.viewer, ["+919800000003", "+919800000004"])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+        # Keep the periodic pull of new spam reports out of the counts.
+        bypass_reported_numbers(self)
+
+    def lookup(self, phone_numbers):
+        return self.client.post(reverse("person_detail_batch"), {"phone_numbers": phone_numbers}, format="json")
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        known = ["+919800000002", "09800000003", "+919800000004"]
+        for phone_numbers in [known, known + [f"+9198000{index:05d}" for index in range(100, 297)]]:
+            cache.clear()
+            # Users, contact names, spam counters and the viewer's saved-by list
+            with self.assertNumQueries(4):
+                response = self.lookup(phone_numbers)
+            self.assertEqual(len(response.data), len(phone_numbers))
+            with self.assertNumQueries(3):
+                self.lookup(phone_numbers)
+        self.assertEqual(response.data[:3], [
+            {
+                "name": "owner",
+                "phone_number": "+919800000002",
+                "spam_likelihood": 0.0,
+                "email": "owner@example.com",
+                "is_registered_user": True,
+            },
+            {
+                "name": "Unregistered",
+                "phone_number": "09800000003",
+                "spam_likelihood": 50.0,
+                "email": None,
+                "is_registered_user": False,
+            },
+            {
+                "name": None,
+                "phone_number": "+919800000004",
+                "spam_likelihood": 50.0,
+                "email": None,
+                "is_registered_user": False,
+            },
+        ])
+
+    def test_batch_is_not_a_phone_number(self):
+        self.assertEqual(resolve(reverse("person_detail_batch")).url_name, "person_detail_batch")
+        self.assertEqual(self.client.get(reverse("person_detail_batch")).status_code, 405)
+
+    def test_limit(self):
+        phone_numbers = [f"+9198{index:08d}" for index in range(PERSON_DETAIL_BATCH_LIMIT + 1)]
+        self.assertEqual(self.lookup(phone_numbers).status_code, 400)
+        self.assertEqual(self.lookup([]).status_code, 400)
+
+
+class ContactNameDirectoryTests(TestCase):
+    """
+    The per-number name directory behind search_by_phone follows contact
+    writes and imports.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user(username="viewer", phone_number="+919800000001")
+        cls.owners = [
+            User.objects.create_user(username=f"owner{index}", phone_number=f"+91980000001{index}")
+            for index in range(3)
+        ]
+
+    def setUp(self):
+        # Cached searches would outlive the rolled-back rows of other tests.
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def search(self, phone_number):
+        response = self.client.get(reverse("search_by_phone"), {"query": phone_number})
+        self.assertEqual(response.status_code, 200)
+        return [entry["name"] for entry in response.data]
+
+    def test_names_ranked_by_saved_count(self):
+        for owner, name in zip(self.owners, ["Pizza", "Pizza Place", "Pizza"]):
+            Contact.objects.create(owner=owner, name=name, phone_number="+919800000050")
+        self.assertEqual(self.search("09800000050"), ["Pizza", "Pizza Place"])
+
+    def test_rename_and_delete(self):
+        first = Contact.objects.create(owner=self.owners[0], name="Plumber", phone_number="+919800000051")
+        Contact.objects.create(owner=self.owners[1], name="Plumber", phone_number="+919800000051")
+        first.name = "Bad Plumber"
+        first.save()
+        self.assertEqual(ContactName.objects.get(phone_key="+919800000051", name="Plumber").saved_count, 1)
+        first.delete()
+        self.assertEqual(self.search("+919800000051"), ["Plumber"])
+
+    def test_import_replaces_previous_name(self):
+        Contact.objects.create(owner=self.owners[0], name="Dentist", phone_number="+919800000052")
+        import_contacts(self.owners[0], [{"Name": "Dr Rao", "Phone Number": "+919800000052"}])
+        self.assertEqual(
+            list(ContactName.objects.filter(phone_key="+919800000052").values_list("name", "saved_count")),
+            [("Dr Rao", 1)],
+        )
+
+
+class SearchInvalidationTests(TestCase):
+    """
+    Cached name and phone searches are invalidated as soon as a user,
+    contact or spam report write commits, despite SEARCH_CACHE_TIMEOUT.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user(username="viewer", phone_number="+919800000001")
+        cls.owner = User.objects.create_user(username="owner", phone_number="+919800000002")
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def search_names(self, query):
+        response = self.client.get(reverse("search_by_name"), {"query": query})
+        self.assertEqual(response.status_code, 200)
+        return sorted(entry["name"] for entry in response.data)
+
+    def search_phone(self, phone_number):
+        response = self.client.get(reverse("search_by_phone"), {"query": phone_number})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_contact_write(self):
+        self.assertEqual(self.search_names("plumber"), [])
+        self.assertEqual(self.search_phone("+919800000060"), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            contact = Contact.objects.create(owner=self.owner, name="Plumber Raj", phone_number="+919800000060")
+        self.assertEqual(self.search_names("plumber"), ["Plumber Raj"])
+        self.assertEqual([entry["name"] for entry in self.search_phone("+919800000060")], ["Plumber Raj"])
+        with self.captureOnCommitCallbacks(execute=True):
+            contact.delete()
+        self.assertEqual(self.search_names("plumber"), [])
+        self.assertEqual(self.search_phone("+919800000060"), [])
+
+    def test_user_write(self):
+        self.assertEqual(self.search_names("owner"), ["owner"])
+        self.assertEqual(self.search_phone("+919800000002")["name"], "owner")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.owner.username = "renamed"
+            self.owner.save()
+        self.assertEqual(self.search_names("owner"), [])
+        self.assertEqual(self.search_names("renamed"), ["renamed"])
+        self.assertEqual(self.search_phone("+919800000002")["name"], "renamed")
+
+    def test_import(self):
+        self.assertEqual(self.search_names("plumber"), [])
+        self.assertEqual(self.search_names("pl"), [])
+        rows = [{"Name": f"Plumber {index}", "Phone Number": f"+9198000001{index:02d}"} for index in range(20)]
+        with mock.patch.object(cache, "set_many", wraps=cache.set_many) as set_many:
+            with self.captureOnCommitCallbacks(execute=True):
+                import_contacts(self.owner, rows)
+        # One bump for the whole import, not one per trigram or number.
+        self.assertEqual(set_many.call_count, 1)
+        self.assertEqual(len(self.search_names("plumber")), 20)
+        self.assertEqual(len(self.search_names("pl")), 20)
+
+    def test_mark_spam(self):
+        Contact.objects.create(owner=self.owner, name="Telemarketer", phone_number="+919800000061")
+        self.assertEqual(self.search_phone("+919800000061")[0]["spam_likelihood"], 0.0)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("mark_spam"), {"phone_number": "09800000061"})
+        spam_leaderboard.flush()
+        self.assertEqual(response.status_code, 201)
+        self.assertGreater(self.search_phone("+919800000061")[0]["spam_likelihood"], 0.0)
+
+class GetOrComputeTests(TestCase):
+    """
+    Cached empty results are served like any other, and concurrent misses
+    for one key share a single computation.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_negative_result_served_from_cache(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username="viewer", phone_number="+919800000001"))
+        url = reverse("search_by_phone")
+        self.assertEqual(client.get(url, {"query": "+919800000070"}).data, [])
+        with self.assertNumQueries(0):
+            self.assertEqual(client.get(url, {"query": "+919800000070"}).data, [])
+
+    def compute_concurrently(self, compute, requests=8):
+        results, errors = [], []
+
+        def request():
+            try:
+                results.append(get_or_compute("test_key", ["gen_test"], compute)[0])
+            except RuntimeError as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=request) for _ in range(requests)]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, errors, time.monotonic() - started
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+
+        def compute(depend):
+            calls.append(1)
+            time.sleep(0.1)
+            return ["payload"]
+
+        results, errors, _ = self.compute_concurrently(compute)
+        self.assertEqual((len(calls), errors), (1, []))
+        self.assertEqual(results, [["payload"]] * 8)
+
+    def test_waiter_takes_over_failed_computation(self):
+        calls = []
+
+        def compute(depend):
+            calls.append(1)
+            time.sleep(0.05)
+            if len(calls) == 1:
+                raise RuntimeError("database went away")
+            return ["payload"]
+
+        results, errors, elapsed = self.compute_concurrently(compute)
+        self.assertEqual((len(calls), len(errors)), (2, 1))
+        self.assertEqual(results, [["payload"]] * 7)
+        self.assertLess(elapsed, LOCK_WAIT)
+
+class SpamLeaderboardTests(TestCase):
+    """
+    Workers' buffered reports merge into the shared Space-Saving buckets
+    that the top spam numbers endpoint ranks.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_space_saving_merge_bounds_error(self):
+        summary = SpaceSaving(2, {"a": (5, 0), "b": (3, 0)})
+        summary.merge(Counter({"c": 4}))
+        # "c" may have been counted and evicted before, so it starts from the
+        # smallest count with that as its error; "b" is evicted.
+        self.assertEqual(summary.top(2), [("c", 7, 3), ("a", 5, 0)])
+
+    def test_flushes_merge_into_buckets(self):
+        leaderboard = SpamLeaderboard()
+        now = timezone.now()
+        leaderboard.record(["+919800000001", "+919800000002"], now)
+        leaderboard.flush()
+        leaderboard.record(["+919800000002"], now)
+        leaderboard.flush()
+        self.assertEqual(SpamLeaderboardBucket.objects.count(), 4)
+        for window in ("hour", "day", "week", "all"):
+            self.assertEqual(
+                leaderboard.summary(window).top(2),
+                [("+919800000002", 2, 0), ("+919800000001", 1, 0)],
+            )
+
+    @override_settings(SPAM_LEADERBOARD_FLUSH_SIZE=3)
+    def test_flushes_once_enough_reports_are_buffered(self):
+        leaderboard = SpamLeaderboard()
+        leaderboard.record(["+919800000001", "+919800000002"], timezone.now())
+        self.assertEqual(leaderboard.summary("all").top(5), [])
+        leaderboard.record(["+919800000003"], timezone.now())
+        self.assertEqual(len(leaderboard.summary("hour").top(5)), 3)
+
+    @override_settings(SPAM_LEADERBOARD_FLUSH_SECONDS=0.01)
+    def test_idle_worker_flushes_on_a_timer(self):
+        leaderboard = SpamLeaderboard()
+        flushed = threading.Event()
+        with mock.patch.object(leaderboard, "flush", flushed.set):
+            leaderboard.record(["+919800000001"], timezone.now())
+            self.assertTrue(flushed.wait(5))
+
+    def test_limit_is_clamped(self):
+        leaderboard = SpamLeaderboard()
+        leaderboard.record([f"+9198000{index:05d}" for index in range(TOP_SPAM_NUMBERS_LIMIT + 5)], timezone.now())
+        leaderboard.flush()
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username="analyst", phone_number="+919800000001"))
+        url = reverse("analytics_top_spam_numbers")
+        for limit, expected in [("0", 1), ("3", 3), ("1000", TOP_SPAM_NUMBERS_LIMIT), ("many", 10)]:
+            response = client.get(url, {"limit": limit})
+            self.assertEqual(len(response.data), expected, limit)
+        self.assertEqual(client.get(url, {"window": "year"}).status_code, 400)
+
+class MarkSpamTests(TestCase):
+    """
+    Spam reports reject input that is not a phone number instead of filing
+    it under an empty key.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reporter = User.objects.create_user(username="reporter", phone_number="+919800000001")
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.reporter)
+
+    def mark_spam(self, phone_number):
+        return self.client.post(reverse("mark_spam"), {"phone_number": phone_number}, format="json")
+
+    def test_reports_once(self):
+        self.assertEqual(self.mark_spam("098000 00090").status_code, 201)
+        self.assertEqual(self.mark_spam("+919800000090").status_code, 400)
+        self.assertEqual(SpamReport.objects.get().phone_key, "+919800000090")
+
+    def test_rejects_invalid_numbers(self):
+        for phone_number in [5551234, ["+919800000090"], "call me", "   ", "+", "++"]:
+            self.assertEqual(self.mark_spam(phone_number).status_code, 400, phone_number)
+        response = self.client.post(
+            reverse("mark_spam_bulk"), {"phone_numbers": ["+919800000090", "n/a"]}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            reverse("mark_spam_bulk"), {"phone_numbers": ["+919800000090", "+"]}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(report_spam(self.reporter, ["+", "++"]), set())
+        self.assertFalse(SpamReport.objects.exists())
+
+@skipUnless(os.environ.get("CACHE_URL"), "throttle limits are only enforced through the shared cache")
+@override_settings(ENDPOINT_THROTTLE_RATES={"search_by_name": "3/minute"})
+class ThrottleTests(TestCase):
+    """
+    The sliding-window throttle rejects requests past the rate per user and
+    tells clients when to retry. Runs against the shared cache in CACHE_URL.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(username=f"user{index}", phone_number=f"+91980000000{index}")
+            for index in range(2)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.get(reverse("search_by_name"), {"query": "nobody"})
+
+    def test_limit_and_retry_after(self):
+        self.assertEqual([self.search(self.users[0]).status_code for _ in range(3)], [200] * 3)
+        response = self.search(self.users[0])
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(1 <= int(response["Retry-After"]) <= 60)
+        # Other users have their own counter.
+        self.assertEqual(self.search(self.users[1]).status_code, 200)
+
+class ReportedNumbersTests(TestCase):
+    """
+    The reported-numbers filter never rules out a reported number, even one
+    whose report committed after a report with a higher id was read.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reporter = User.objects.create_user(username="reporter", phone_number="+919800000001")
+        report_spam(cls.reporter, ["+919800000080"])
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000, error_rate=0.01)
+        reported = [f"+91980000{index:04d}" for index in range(0, 2000, 2)]
+        for phone_key in reported:
+            bloom.add(phone_key)
+        self.assertTrue(all(phone_key in bloom for phone_key in reported))
+        false_positives = sum(f"+91980000{index:04d}" in bloom for index in range(1, 2000, 2))
+        self.assertLess(false_positives, 50)
+
+    def test_everything_possibly_reported_before_first_build(self):
+        self.assertTrue(ReportedNumbers().might_be_reported("+919800000099"))
+
+    def test_refresh_rereads_reports_that_commit_out_of_order(self):
+        reported = ReportedNumbers()
+        reported.rebuild()
+        self.assertTrue(reported.might_be_reported("+919800000080"))
+        self.assertFalse(reported.might_be_reported("+919800000081"))
+
+        last_id = SpamReport.objects.latest("id").id
+        SpamReport.objects.create(id=last_id + 10, reporter=self.reporter, phone_number="+919800000081")
+        reported.refresh()
+        # Took its id before the report above but committed after the refresh.
+        SpamReport.objects.create(id=last_id + 5, reporter=self.reporter, phone_number="+919800000082")
+        reported.refresh()
+        self.assertTrue(reported.might_be_reported("+919800000081"))
+        self.assertTrue(reported.might_be_reported("+919800000082"))
+        # Rereading the overlap does not count numbers twice.
+        self.assertEqual(reported.stats()["numbers"], 3)
+
+    def test_refresh_queries_without_the_lock(self):
+        reported = ReportedNumbers()
+        reported.rebuild()
+        SpamReport.objects.create(reporter=self.reporter, phone_number="+919800000081")
+        lock_held = []
+
+        def check_lock(execute, sql, params, many, context):
+            lock_held.append(reported._lock.locked())
+            return execute(sql, params, many, context)
+
+        with connections["default"].execute_wrapper(check_lock):
+            reported.refresh()
+        self.assertEqual(lock_held, [False])
+        self.assertTrue(reported.might_be_reported("+919800000081"))
+        self.assertFalse(reported.is_due())
+
+class EmailVisibilityTests(TestCase):
+    """
+    search_by_phone results are cached for all callers, but a registered
+    user's email is only shown to callers that user has saved.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(
+            username="owner", phone_number="+919800000002", email="owner@example.com"
+        )
+        cls.friend = User.objects.create_user(username="friend", phone_number="+919800000001")
+        cls.stranger = User.objects.create_user(username="stranger", phone_number="+919800000003")
+
+    def setUp(self):
+        cache.clear()
+
+    def search_email(self, caller):
+        client = APIClient()
+        client.force_authenticate(caller)
+        response = client.get(reverse("search_by_phone"), {"query": "+919800000002"})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("user_id", response.data)
+        return response.data["email"]
+
+    def test_email_follows_callers_and_contact_writes(self):
+        self.assertIsNone(self.search_email(self.friend))
+        with self.captureOnCommitCallbacks(execute=True):
+            contact = Contact.objects.create(owner=self.owner, name="Friend", phone_number="+919800000001")
+        self.assertEqual(self.search_email(self.friend), "owner@example.com")
+        self.assertIsNone(self.search_email(self.stranger))
+        with self.captureOnCommitCallbacks(execute=True):
+            contact.delete()
+        self.assertIsNone(self.search_email(self.friend))
+
+
+class AutocompleteTests(TestCase):
+    """
+    The in-process prefix index answers typeahead queries, follows this
+    process's writes and rebuilds in the background once stale.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user(username="alice", phone_number="+919800000001")
+        Contact.objects.create(owner=cls.viewer, name="Alfred", phone_number="+919800000002")
+        Contact.objects.create(owner=cls.viewer, name="Bob", phone_number="+919800000003")
+
+    def setUp(self):
+        # The index outlives the rolled-back rows of other tests.
+        prefix_index.build()
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def autocomplete(self, query):
+        response = self.client.get(reverse("autocomplete"), {"query": query})
+        self.assertEqual(response.status_code, 200)
+        return [(entry["name"], entry["is_registered_user"]) for entry in response.data]
+
+    def test_users_first_then_contacts(self):
+        self.assertEqual(self.autocomplete("AL"), [("alice", True), ("Alfred", False)])
+        self.assertEqual(self.autocomplete("bo"), [("Bob", False)])
+
+    def test_names_held_once_and_bounded(self):
+        owners = [
+            User.objects.create_user(username=f"owner{index}", phone_number=f"+91980000001{index}")
+            for index in range(3)
+        ]
+        for owner in owners:
+            Contact.objects.create(owner=owner, name="Bob", phone_number="+919800000003")
+        Contact.objects.create(owner=owners[0], name="Bobby", phone_number="+919800000006")
+        prefix_index.build()
+        self.assertEqual(len(prefix_index._keys[NameTrigram.CONTACT]), 3)
+        self.assertEqual(self.autocomplete("bo"), [("Bob", False), ("Bobby", False)])
+        with self.settings(AUTOCOMPLETE_INDEX_MAX_NAMES=1):
+            prefix_index.build()
+        # Only the most saved contact name, and the first user
+        self.assertEqual(self.autocomplete("bo"), [("Bob", False)])
+        self.assertEqual(self.autocomplete("owner"), [])
+        self.assertEqual(self.autocomplete("al"), [("alice", True)])
+
+    def test_follows_saves_and_deletes(self):
+        contact = Contact.objects.create(owner=self.viewer, name="Alma", phone_number="+919800000004")
+        self.assertIn(("Alma", False), self.autocomplete("alm"))
+        contact.name = "Zara"
+        contact.save()
+        self.assertEqual(self.autocomplete("alm"), [])
+        self.assertEqual(self.autocomplete("za"), [("Zara", False)])
+        contact.delete()
+        self.assertEqual(self.autocomplete("za"), [])
+
+    def test_stale_index_served_while_rebuilding(self):
+        release, reads = threading.Event(), []
+
+        def slow_read():
+            reads.append(1)
+            release.wait(5)
+            # As if another worker had deleted every name.
+            return {source: [] for source in (NameTrigram.USER, NameTrigram.CONTACT)}, {}
+
+        time.sleep(0.001)
+        with self.settings(AUTOCOMPLETE_INDEX_MAX_AGE=0), mock.patch.object(prefix_index, "_read", slow_read):
+            self.assertEqual(self.autocomplete("bo"), [("Bob", False)])
+            self.assertEqual(self.autocomplete("bo"), [("Bob", False)])
+            # Saved while the rebuild reads, so replayed onto its result.
+            Contact.objects.create(owner=self.viewer, name="Bonnie", phone_number="+919800000005")
+            release.set()
+            with prefix_index._build_lock:
+                pass
+        self.assertEqual(len(reads), 1)
+        self.assertEqual([entry["name"] for entry in prefix_index.search("bo")], ["Bonnie"])
+
+
+class CachedAuthenticationTests(TestCase):
+    """
+    JWT users are resolved from the cache without queries, and saving or
+    deleting a user invalidates the shared entry for every worker.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="caller", phone_number="+919800000001", password="secret")
+
+    def setUp(self):
+        cache.clear()
+        # A leftover per-process entry would hide the shared cache.
+        authentication._local_users.clear()
+        self.token = str(AccessToken.for_user(self.user))
+
+    def authenticate(self):
+        request = RequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        return authentication.CachedJWTAuthentication().authenticate(request)[0]
+
+    def search(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        return client.get(reverse("search_by_phone"), {"query": "+919800000002"})
+
+    def test_warm_cache_makes_no_queries(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate().pk, self.user.pk)
+        with self.assertNumQueries(0):
+            self.authenticate()
+        authentication._local_users.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate().username, "caller")
+
+    def test_deactivated_user_is_rejected(self):
+        self.assertEqual(self.search().status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        response = self.search()
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data["detail"], "User is inactive")
+
+    def test_password_change_invalidates_shared_entry(self):
+        _, fingerprint = authentication.get_cached_user(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password("changed")
+            self.user.save()
+        # As seen by another worker, which has no local copy.
+        authentication._local_users.clear()
+        with self.assertNumQueries(1):
+            _, new_fingerprint = authentication.get_cached_user(self.user.pk)
+        self.assertNotEqual(new_fingerprint, fingerprint)
+
+    def test_deleted_user_is_rejected(self):
+        self.assertEqual(self.search().status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(pk=self.user.pk).delete()
+        response = self.search()
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data["detail"], "User not found")
+
+    def test_save_committed_during_miss_leaves_no_valid_entry(self):
+        user_rows = authentication._user_rows
+
+        def rows_read_before_concurrent_save(user_id):
+            row = user_rows(user_id).first()
+            # Another request deactivates the user and commits right after
+            # this one read the row.
+            with self.captureOnCommitCallbacks(execute=True):
+                User.objects.filter(pk=user_id).update(is_active=False)
+                authentication.invalidate_cached_user(user_id)
+            return mock.Mock(first=mock.Mock(return_value=row))
+
+        with mock.patch.object(authentication, "_user_rows", rows_read_before_concurrent_save):
+            self.assertTrue(authentication.get_cached_user(self.user.pk)[0].is_active)
+        authentication._local_users.clear()
+        self.assertFalse(authentication.get_cached_user(self.user.pk)[0].is_active)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ImportJobTests(TestCase):
+    """
+    Background imports answer 202 with a job id whose progress only its
+    owner can poll, and jobs lost with a restarted worker end as failed.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username="owner", phone_number="+919800000001")
+        cls.other = User.objects.create_user(username="other", phone_number="+919800000002")
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def upload(self, content, run=True):
+        # Run queued jobs inline, inside the test transaction.
+        executor = mock.Mock(submit=lambda function, *args: function(*args) if run else None)
+        with mock.patch("base.jobs.get_executor", return_value=executor), \
+                mock.patch("base.jobs.close_old_connections"), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("import_contacts_csv"),
+                {"file": SimpleUploadedFile("contacts.csv", content), "background": "true"},
+                format="multipart",
+            )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data["status_url"], reverse("import_job_status", args=[response.data["job_id"]]))
+        return response.data["job_id"]
+
+    def status(self, job_id, user=None):
+        client = APIClient()
+        client.force_authenticate(user or self.owner)
+        return client.get(reverse("import_job_status", args=[job_id]))
+
+    def test_progress_and_completion(self):
+        rows = "".join(f"Contact {index},+9198000{index:05d}\n" for index in range(100, 2600))
+        progress = []
+        save_progress = jobs._save_progress
+
+        def record_progress(job, result):
+            save_progress(job, result)
+            progress.append(ImportJob.objects.get(id=job.id).rows_processed)
+
+        with mock.patch("base.jobs._save_progress", record_progress):
+            job_id = self.upload(f"Name,Phone Number\n{rows}Missing Number,\n".encode())
+        # Saved after every chunk of IMPORT_CHUNK_SIZE rows and at the end
+        self.assertEqual(progress[:2], [1000, 2000])
+        self.assertEqual(progress[-1], 2501)
+        data = self.status(job_id).data
+        self.assertEqual(data["status"], ImportJob.DONE)
+        self.assertEqual((data["rows_processed"], data["created"], data["skipped"]), (2501, 2500, 1))
+        self.assertEqual(data["errors"], [])
+        self.assertIsNotNone(data["finished_at"])
+        self.assertEqual(Contact.objects.filter(owner=self.owner).count(), 2500)
+
+    def test_unreadable_file_fails_with_errors(self):
+        data = self.status(self.upload(b"Name,Phone Number\n\xff\xfe,\n")).data
+        self.assertEqual(data["status"], ImportJob.FAILED)
+        self.assertTrue(data["errors"][0].startswith("Failed to read CSV file"))
+
+    def test_only_the_owner_sees_the_job(self):
+        job_id = self.upload(b"Name,Phone Number\nAlice,+919800000100\n")
+        self.assertEqual(self.status(job_id, user=self.other).status_code, 404)
+        self.assertEqual(self.status(job_id).status_code, 200)
+
+    def test_job_lost_with_its_worker_fails_when_polled(self):
+        job_id = self.upload(b"Name,Phone Number\nAlice,+919800000100\n", run=False)
+        self.assertEqual(self.status(job_id).data["status"], ImportJob.PENDING)
+        ImportJob.objects.filter(id=job_id).update(
+            updated_at=timezone.now() - datetime.timedelta(hours=1)
+        )
+        data = self.status(job_id).data
+        self.assertEqual(data["status"], ImportJob.FAILED)
+        self.assertEqual(len(data["errors"]), 1)
+        # A worker that picks the job up afterwards leaves it failed.
+        with mock.patch("base.jobs.close_old_connections"):
+            jobs.run_import_job(job_id)
+        self.assertEqual(ImportJob.objects.get(id=job_id).status, ImportJob.FAILED)
+        self.assertFalse(Contact.objects.filter(owner=self.owner).exists())
+
+
+class AsyncLookupTests(TestCase):
+    """
+    The ASGI lookup views authenticate, throttle and answer like their
+    DRF counterparts.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(
+            username="owner", phone_number="+919800000002", email="owner@example.com"
+        )
+        cls.friend = User.objects.create_user(username="friend", phone_number="+919800000001")
+        cls.stranger = User.objects.create_user(username="stranger", phone_number="+919800000003")
+        Contact.objects.create(owner=cls.owner, name="Friend", phone_number="+919800000001")
+        Contact.objects.create(owner=cls.owner, name="Plumber", phone_number="+919800000050")
+        report_spam(cls.friend, ["+919800000050"])
+
+    def setUp(self):
+        cache.clear()
+        authentication._local_users.clear()
+        bypass_reported_numbers(self)
+
+    def headers(self, user):
+        return {"Authorization": f"Bearer {AccessToken.for_user(user)}"}
+
+    def sync_get(self, name, user, *args, **params):
+        return APIClient().get(reverse(name, args=args), params, headers=self.headers(user))
+
+    async def async_get(self, name, user, *args, **params):
+        headers = self.headers(user) if user else {}
+        return await AsyncClient().get(reverse(name, args=args), params, headers=headers)
+
+    async def assert_same(self, name, user, *args, **params):
+        expected = await sync_to_async(self.sync_get)(name, user, *args, **params)
+        response = await self.async_get(f"{name}_async", user, *args, **params)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.json(), expected.json())
+        return response.json()
+
+    async def test_missing_or_invalid_token(self):
+        response = await self.async_get("search_by_phone_async", None, query="+919800000002")
+        self.assertEqual(response.status_code, 401)
+        self.assertIn("WWW-Authenticate", response)
+        response = await AsyncClient().get(
+            reverse("person_detail_async", args=["+919800000002"]), headers={"Authorization": "Bearer not-a-token"}
+        )
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()["code"], "token_not_valid")
+
+    @override_settings(ENDPOINT_THROTTLE_RATES={"search_by_phone_async": "2/minute"})
+    async def test_throttled(self):
+        for _ in range(2):
+            response = await self.async_get("search_by_phone_async", self.friend, query="+919800000002")
+            self.assertEqual(response.status_code, 200)
+        response = await self.async_get("search_by_phone_async", self.friend, query="+919800000002")
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(1 <= int(response["Retry-After"]) <= 60)
+
+    async def test_search_by_phone_matches_sync_view(self):
+        # The owner saved the friend, so only the friend sees the email.
+        data = await self.assert_same("search_by_phone", self.friend, query="+919800000002")
+        self.assertEqual(data["email"], "owner@example.com")
+        data = await self.assert_same("search_by_phone", self.stranger, query="+919800000002")
+        self.assertIsNone(data["email"])
+        data = await self.assert_same("search_by_phone", self.friend, query="09800000050")
+        self.assertEqual([entry["name"] for entry in data], ["Plumber"])
+        self.assertEqual(await self.assert_same("search_by_phone", self.friend, query="not a number"), [])
+        await self.assert_same("search_by_phone", self.friend, query="")
+
+    async def test_person_detail_matches_sync_view(self):
+        data = await self.assert_same("person_detail", self.friend, "+919800000002")
+        self.assertEqual(data["email"], "owner@example.com")
+        data = await self.assert_same("person_detail", self.stranger, "+919800000002")
+        self.assertIsNone(data["email"])
+        data = await self.assert_same("person_detail", self.friend, "09800000050")
+        self.assertEqual(data["name"], "Plumber")
+        for phone_number in ["+919800000099", "not a number"]:
+            data = await self.assert_same("person_detail", self.friend, phone_number)
+            self.assertIsNone(data["name"])
+
+    async def test_only_get(self):
+        response = await AsyncClient().post(reverse("search_by_phone_async"), headers=self.headers(self.friend))
+        self.assertEqual(response.status_code, 405)
+
+
+@override_settings(READ_REPLICA_DATABASES=["replica1"])
+class ReadReplicaTests(TransactionTestCase):
+    """
+    Heavy reads go to the replica, which mirrors the default database in
+    tests, except right after the user's own writes or when it fails.
+    """
+
+    databases = {"default", "replica1"}
+
+    def setUp(self):
+        cache.clear()
+        authentication._local_users.clear()
+        routers._unhealthy.clear()
+        self.addCleanup(routers._unhealthy.clear)
+        self.user = User.objects.create_user(username="user", phone_number="+919800000001")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_trends(self):
+        with CaptureQueriesContext(connections["default"]) as primary, \
+                CaptureQueriesContext(connections["replica1"]) as replica:
+            response = self.client.get(reverse("analytics_spam_trends"))
+        self.assertEqual(response.status_code, 200)
+        return len(primary), len(replica)
+
+    def test_read_after_write_is_pinned_to_primary(self):
+        self.assertEqual(self.get_trends()[0], 0)
+        response = self.client.post(
+            reverse("add_contact"), {"name": "Friend", "phone_number": "+919800000002"}
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(routers.is_pinned(self.user.pk))
+        primary, replica = self.get_trends()
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+        # Failed writes change nothing to read back.
+        cache.delete(routers.pin_key(self.user.pk))
+        response = self.client.post(reverse("add_contact"), {"name": "Nobody"})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(routers.is_pinned(self.user.pk))
+        self.assertEqual(self.get_trends()[0], 0)
+
+    def test_replica_failure_falls_back_to_primary(self):
+        def fail(execute, sql, params, many, context):
+            raise OperationalError("replica is down")
+
+        with connections["replica1"].execute_wrapper(fail):
+            primary, replica = self.get_trends()
+        self.assertGreater(primary, 0)
+        self.assertEqual(routers.healthy_replicas(), [])
+        # The failed replica is skipped until READ_REPLICA_RETRY_SECONDS pass.
+        primary, replica = self.get_trends()
+        self.assertEqual(replica, 0)
+
+    def test_get_or_compute_reads_primary(self):
+        def compute(depend):
+            return router.db_for_read(User)
+
+        with routers.reading_from("replica1"):
+            self.assertEqual(router.db_for_read(User), "replica1")
+            payload, version = get_or_compute("replica_test", [], compute)
+        self.assertEqual(payload, "default")
+
+    def test_no_migrations_on_replicas(self):
+        self.assertFalse(router.allow_migrate("replica1", "base", model_name="contact"))
+        self.assertTrue(router.allow_migrate("default", "base", model_name="contact"))
+
+
+class SpamTrendsTests(TestCase):
+    """
+    Spam reports roll up into hourly and daily rows that the trends
+    endpoint sums into the requested buckets.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username="alice", phone_number="+919800000001")
+        cls.bob = User.objects.create_user(username="bob", phone_number="+919800000002")
+        utc = datetime.timezone.utc
+        # Friday 30 January and Monday 2 February 2026
+        cls.report(cls.alice, ["+919812345678", "+14155550100"], datetime.datetime(2026, 1, 30, 10, 15, tzinfo=utc))
+        cls.report(cls.bob, ["+919812345678"], datetime.datetime(2026, 1, 30, 10, 45, tzinfo=utc))
+        cls.report(cls.alice, ["+919876500000"], datetime.datetime(2026, 1, 30, 11, 5, tzinfo=utc))
+        cls.report(cls.bob, ["+14155550100"], datetime.datetime(2026, 2, 2, 9, 0, tzinfo=utc))
+
+    @staticmethod
+    def report(reporter, phone_numbers, at):
+        with mock.patch("base.spam.timezone.now", return_value=at):
+            report_spam(reporter, phone_numbers)
+
+    def trends(self, **params):
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        response = client.get(reverse("analytics_spam_trends"), params)
+        self.assertEqual(response.status_code, 200)
+        return [(row["period"], row["report_count"]) for row in response.json()]
+
+    def test_buckets(self):
+        self.assertEqual(self.trends(bucket="hour"), [
+            ("2026-01-30T10:00:00Z", 3),
+            ("2026-01-30T11:00:00Z", 1),
+            ("2026-02-02T09:00:00Z", 1),
+        ])
+        self.assertEqual(self.trends(), [("2026-01-30T00:00:00Z", 4), ("2026-02-02T00:00:00Z", 1)])
+        self.assertEqual(self.trends(bucket="week"), [("2026-01-26T00:00:00Z", 4), ("2026-02-02T00:00:00Z", 1)])
+        self.assertEqual(self.trends(bucket="month"), [("2026-01-01T00:00:00Z", 4), ("2026-02-01T00:00:00Z", 1)])
+
+    def test_range(self):
+        self.assertEqual(self.trends(start="2026-01-31"), [("2026-02-02T00:00:00Z", 1)])
+        self.assertEqual(self.trends(end="2026-01-30"), [("2026-01-30T00:00:00Z", 4)])
+        self.assertEqual(self.trends(bucket="hour", start="2026-01-30", end="2026-01-30"), [
+            ("2026-01-30T10:00:00Z", 3),
+            ("2026-01-30T11:00:00Z", 1),
+        ])
+        self.assertEqual(self.trends(start="2026-02-03"), [])
+
+    def test_prefix(self):
+        self.assertEqual(self.trends(prefix="+9198"), [("2026-01-30T00:00:00Z", 3)])
+        # Shorter prefixes sum every stored prefix they start.
+        self.assertEqual(self.trends(prefix="+91"), [("2026-01-30T00:00:00Z", 3)])
+        self.assertEqual(self.trends(prefix="+1", bucket="month"), [
+            ("2026-01-01T00:00:00Z", 1),
+            ("2026-02-01T00:00:00Z", 1),
+        ])
+        self.assertEqual(self.trends(prefix="+44"), [])
+
+    def test_invalid_parameters(self):
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        for params in [{"bucket": "year"}, {"start": "30-01-2026"}, {"prefix": "+91981"}, {"prefix": "+91", "bucket": "hour"}]:
+            response = client.get(reverse("analytics_spam_trends"), params)
+            self.assertEqual(response.status_code, 400, params)
+
+    def test_rebuild_matches_incremental_rollups(self):
+        def rollups():
+            return Counter(SpamRollup.objects.values_list("granularity", "prefix", "period_start", "report_count"))
+
+        incremental = rollups()
+        self.assertEqual(rebuild_spam_rollups(), sum(incremental.values()))
+        self.assertEqual(rollups(), incremental)
+
+
+class ConditionalResponseTests(TestCase):
+    """
+    Lookups answer a current If-None-Match with an empty 304 and change
+    their ETag once a write affecting them commits.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user(username="viewer", phone_number="+919800000001")
+        cls.owner = User.objects.create_user(username="owner", phone_number="+919800000002")
+        Contact.objects.create(owner=cls.owner, name="Plumber Raj", phone_number="+919800000060")
+
+    def setUp(self):
+        cache.clear()
+        bypass_reported_numbers(self)
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def assert_revalidates(self, url, params, write):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.assertIn("no-cache", response["Cache-Control"])
+
+        response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["ETag"], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+        response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_person_detail(self):
+        self.assert_revalidates(
+            reverse("person_detail", args=["+919800000060"]), {},
+            lambda: Contact.objects.create(owner=self.viewer, name="Raj", phone_number="+919800000060"),
+        )
+
+    def test_search_by_phone(self):
+        def mark_spam():
+            response = self.client.post(reverse("mark_spam"), {"phone_number": "+919800000060"})
+            self.assertEqual(response.status_code, 201)
+
+        self.assert_revalidates(reverse("search_by_phone"), {"query": "+919800000060"}, mark_spam)
+        spam_leaderboard.flush()
+
+    def test_search_by_name(self):
+        self.assert_revalidates(
+            reverse("search_by_name"), {"query": "plumber"},
+            lambda: Contact.objects.create(owner=self.viewer, name="Plumber Ravi", phone_number="+919800000061"),
+        )
+
+
+@override_settings(COMPRESSION_MIN_LENGTH=1024)
+class CompressionTests(TestCase):
+    """
+    Large responses are compressed with the best coding the client
+    accepts; small and streaming ones are sent as they are.
+    """
+
+    body = b'{"name": "Plumber Raj"}' * 100
+
+    def respond(self, response, accept_encoding):
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def test_gzip(self):
+        response = self.respond(HttpResponse(self.body, headers={"ETag": '"v1"'}), "gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), self.body)
+        self.assertEqual(response["Content-Length"], str(len(response.content)))
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        # Compressed bytes only match the original weakly.
+        self.assertEqual(response["ETag"], 'W/"v1"')
+
+    def test_brotli_preferred(self):
+        fake_brotli = mock.Mock()
+        fake_brotli.compress.return_value = b"br" + self.body[:10]
+        with mock.patch.object(middleware, "brotli", fake_brotli):
+            response = self.respond(HttpResponse(self.body), "gzip, br")
+            self.assertEqual(response["Content-Encoding"], "br")
+            self.assertEqual(response.content, b"br" + self.body[:10])
+            # q=0 refuses a coding.
+            response = self.respond(HttpResponse(self.body), "br;q=0, gzip")
+            self.assertEqual(response["Content-Encoding"], "gzip")
+        with mock.patch.object(middleware, "brotli", None):
+            response = self.respond(HttpResponse(self.body), "br")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(response.content, self.body)
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+
+    def test_identity(self):
+        response = self.respond(HttpResponse(self.body), "")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(response.content, self.body)
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+
+    def test_small_and_streaming_responses(self):
+        response = self.respond(HttpResponse(self.body[:1000]), "gzip")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(response.content, self.body[:1000])
+        response = self.respond(StreamingHttpResponse([self.body]), "gzip")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(b"".join(response.streaming_content), self.body)
+
+    def test_api_response(self):
+        user = User.objects.create_user(username="viewer", phone_number="+919800000001")
+        for index in range(40):
+            Contact.objects.create(owner=user, name=f"Plumber {index}", phone_number=f"+9198000001{index:02}")
+        client = APIClient()
+        client.force_authenticate(user)
+        cache.clear()
+        response = client.get(reverse("search_by_name"), {"query": "plumber"}, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))), 40)
+
+
+class MetricsTests(TestCase):
+    """
+    Sampled requests show up in /metrics by route; unsampled ones leave
+    no trace, and METRICS_TOKEN guards the endpoint.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user(username="viewer", phone_number="+919800000001")
+        Contact.objects.create(owner=cls.viewer, name="Plumber Raj", phone_number="+919800000060")
+
+    def setUp(self):
+        cache.clear()
+        bypass_reported_numbers(self)
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def scrape(self, **headers):
+        response = self.client.get(reverse("metrics"), headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if not line.startswith("#"):
+                name, value = line.rsplit(" ", 1)
+                samples[name] = float(value)
+        return samples
+
+    @override_settings(METRICS_SAMPLE_RATE=1)
+    def test_sampled_requests_are_recorded(self):
+        for _ in range(2):
+            response = self.client.get(reverse("person_detail", args=["+919800000060"]))
+            self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse("person_detail_batch"))
+        self.assertEqual(response.status_code, 405)
+
+        samples = self.scrape()
+        self.assertEqual(samples["trustcall_metrics_sample_rate"], 1.0)
+        self.assertEqual(samples['trustcall_requests_total{route="person_detail",method="GET",status="200"}'], 2)
+        self.assertEqual(samples['trustcall_requests_total{route="person_detail_batch",method="GET",status="405"}'], 1)
+        self.assertEqual(samples['trustcall_request_duration_seconds_count{route="person_detail"}'], 2)
+        self.assertEqual(samples['trustcall_request_duration_seconds_bucket{route="person_detail",le="+Inf"}'], 2)
+        self.assertGreater(samples['trustcall_request_duration_seconds_sum{route="person_detail"}'], 0)
+        # person_detail resolves a number in one query.
+        self.assertEqual(samples['trustcall_db_queries_count{route="person_detail"}'], 2)
+        self.assertEqual(samples['trustcall_db_queries_sum{route="person_detail"}'], 2)
+        self.assertEqual(samples['trustcall_db_queries_bucket{route="person_detail",le="0"}'], 0)
+        self.assertEqual(samples['trustcall_db_queries_bucket{route="person_detail",le="1"}'], 2)
+        self.assertIn('trustcall_db_query_duration_seconds_total{route="person_detail"}', samples)
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_nothing_recorded_without_sampling(self):
+        response = self.client.get(reverse("person_detail", args=["+919800000060"]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.scrape(), {"trustcall_metrics_sample_rate": 0.0})
+
+    @override_settings(METRICS_TOKEN="s3cret")
+    def test_token_required(self):
+        for headers in [{}, {"Authorization": "Bearer wrong"}, {"Authorization": "s3cret"}]:
+            response = self.client.get(reverse("metrics"), headers=headers)
+            self.assertEqual(response.status_code, 401, headers)
+        self.assertIn("trustcall_metrics_sample_rate", self.scrape(Authorization="Bearer s3cret"))
+
+
+class ContactExportTests(TestCase):
+    """
+    Contact exports stream only the caller's contacts, in CSV, NDJSON or
+    gzipped form.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username="owner", phone_number="+919800000001")
+        cls.other = User.objects.create_user(username="other", phone_number="+919800000002")
+        cls.contacts = [("Raj, Plumber", "+919800000060"), ('Ann "Cabs"', "+919800000061"), ("Zoë", "+919800000062")]
+        for name, phone_number in cls.contacts:
+            Contact.objects.create(owner=cls.owner, name=name, phone_number=phone_number)
+        Contact.objects.create(owner=cls.other, name="Not Mine", phone_number="+919800000063")
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def export(self, **params):
+        response = self.client.get(reverse("export_contacts_csv"), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertFalse(response.has_header("Content-Encoding"))
+        return response, b"".join(response.streaming_content)
+
+    def test_csv(self):
+        response, content = self.export()
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="contacts.csv"')
+        rows = list(csv.reader(io.StringIO(content.decode("utf-8"))))
+        self.assertEqual(rows, [["Name", "Phone Number"], *map(list, self.contacts)])
+
+    def test_ndjson(self):
+        response, content = self.export(output="ndjson")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="contacts.ndjson"')
+        self.assertEqual(
+            [json.loads(line) for line in content.decode("utf-8").splitlines()],
+            [{"name": name, "phone_number": phone_number} for name, phone_number in self.contacts],
+        )
+
+    def test_gzip(self):
+        response, content = self.export(compress="gzip")
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="contacts.csv.gz"')
+        self.assertEqual(gzip.decompress(content), self.export()[1])
+        response, content = self.export(output="NDJSON", compress="gzip")
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="contacts.ndjson.gz"')
+        self.assertEqual(gzip.decompress(content), self.export(output="ndjson")[1])
+
+    def test_rows_span_chunks(self):
+        Contact.objects.bulk_create(
+            Contact(owner=self.owner, name=f"Bulk {index}", phone_number=f"+91970{index:07d}", phone_key=f"+91970{index:07d}")
+            for index in range(EXPORT_CHUNK_SIZE + 1)
+        )
+        response = self.client.get(reverse("export_contacts_csv"))
+        chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 1)
+        rows = list(csv.reader(io.StringIO(b"".join(chunks).decode("utf-8"))))
+        self.assertEqual(len(rows), 1 + len(self.contacts) + EXPORT_CHUNK_SIZE + 1)
+        self.assertEqual(rows[-1], [f"Bulk {EXPORT_CHUNK_SIZE}", f"+91970{EXPORT_CHUNK_SIZE:07d}"])
+        lines = self.export(output="ndjson", compress="gzip")[1]
+        self.assertEqual(len(gzip.decompress(lines).splitlines()), len(rows) - 1)
+
+    def test_invalid_parameters(self):
+        for params in [{"output": "xml"}, {"compress": "br"}]:
+            response = self.client.get(reverse("export_contacts_csv"), params)
+            self.assertEqual(response.status_code, 400, params)
+        response = APIClient().get(reverse("export_contacts_csv"))
+        self.assertEqual(response.status_code, 401)
@@ -0,0 +1,80 @@
+import time
+from django.conf import settings
+from rest_framework.throttling import UserRateThrottle
+from .metrics import record_throttle
+
+
+class SlidingWindowRateThrottle(UserRateThrottle):
+    """
+    Per-user sliding-window counter throttle.
+
+    DRF's SimpleRateThrottle keeps a list of request timestamps per user and
+    rewrites the whole list on every request, which is O(rate) and lets
+    concurrent requests from different workers overwrite each other. This
+    keeps one integer counter per user per fixed window, bumped with the
+    cache's atomic incr, and weights the previous window's count by how much
+    of it still overlaps the sliding window.
+
+    An endpoint listed by URL name in ENDPOINT_THROTTLE_RATES gets that rate
+    and its own counter; other endpoints share the counter of the scope.
+    """
+
+    def allow_request(self, request, view):
+        started = time.perf_counter()
+        allowed = self._allow_request(request, view)
+        record_throttle(self.scope, allowed, time.perf_counter() - started)
+        return allowed
+
+    def _allow_request(self, request, view):
+        endpoint = getattr(request.resolver_match, "url_name", None)
+        endpoint_rate = getattr(settings, "ENDPOINT_THROTTLE_RATES", {}).get(endpoint)
+        if endpoint_rate:
+            self.num_requests, self.duration = self.parse_rate(endpoint_rate)
+        if self.num_requests is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        if endpoint_rate:
+            self.key = f"{self.key}_{endpoint}"
+
+        self.now = self.timer()
+        window, elapsed = divmod(self.now, self.duration)
+        self.elapsed = elapsed
+        current_key = f"{self.key}_{int(window)}"
+        self.previous = self.cache.get(f"{self.key}_{int(window) - 1}", 0)
+        self.current = self._incr(current_key)
+
+        weight = 1 - elapsed / self.duration
+        if self.previous * weight + self.current > self.num_requests:
+            # Rejected requests do not use up the allowance.
+            self.cache.decr(current_key)
+            self.current -= 1
+            return self.throttle_failure()
+        return self.throttle_success()
+
+    def _incr(self, key):
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # Two windows' worth of lifetime keeps the counter around while it
+            # is the previous window.
+            if self.cache.add(key, 1, self.duration * 2):
+                return 1
+            return self.cache.incr(key)
+
+    def throttle_success(self):
+        return True
+
+    def wait(self):
+        """
+        Seconds until the sliding window has room for one more request.
+        """
+        remaining = self.duration - self.elapsed
+        available = self.num_requests - self.current - 1
+        if available < 0 or not self.previous:
+            return remaining
+        # Room opens once previous * (1 - elapsed / duration) <= available.
+        opens_at = (1 - available / self.previous) * self.duration
+        return max(0.0, min(remaining, opens_at - self.elapsed))
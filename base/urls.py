@@ -16,7 +16,7 @@ Including another URLconf
 """
 
 from django.urls import path
-from . import views
+from . import views, async_views
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 
@@ -29,14 +29,21 @@ urlpatterns = [
     path("add/contact/", views.add_contact, name="add_contact"),
     # Spam Reporting
     path("spam/", views.mark_spam, name="mark_spam"),
+    path("spam/bulk/", views.mark_spam_bulk, name="mark_spam_bulk"),
     # Search Functionality
     path("search/name/", views.search_by_name, name="search_by_name"),
     path("search/phone/", views.search_by_phone, name="search_by_phone"),
+    path("search/autocomplete/", views.autocomplete, name="autocomplete"),
     # Detail View for Phone Number
+    path("detail/batch/", views.person_detail_batch, name="person_detail_batch"),
     path("detail/<str:phone_number>/", views.person_detail, name="person_detail"),
+    # Native async lookups for ASGI deployments
+    path("async/search/phone/", async_views.search_by_phone, name="search_by_phone_async"),
+    path("async/detail/<str:phone_number>/", async_views.person_detail, name="person_detail_async"),
     # Import/Export Contacts
     path("download/contacts/", views.export_contacts_csv, name="export_contacts_csv"),
     path("upload/contacts/", views.import_contacts_csv, name="import_contacts_csv"),
+    path("upload/contacts/<uuid:job_id>/", views.import_job_status, name="import_job_status"),
     # Analytics
     path('analytics/top-spam-numbers/', views.analytics_top_spam_numbers, name='analytics_top_spam_numbers'),
     path('analytics/spam-trends/', views.analytics_spam_trends, name='analytics_spam_trends'),
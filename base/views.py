@@ -1,26 +1,71 @@
+import datetime
 from rest_framework import status, permissions
 from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.response import Response
-from django.core.cache import cache
-from .models import SpamReport, User, Contact
+from .models import SpamRollup, User, Contact, NameTrigram
+from .spam import report_spam, spam_likelihoods
+from .leaderboard import WINDOWS, spam_leaderboard
+from .search import filter_by_name
+from .autocomplete import prefix_index
+from .directory import ranked_names
+from .phones import is_dialable, normalize_phone_number
+from .lookups import (
+    person_detail_etag,
+    person_detail_payload,
+    person_detail_query,
+    resolve_phone_numbers,
+    saved_by,
+    with_visible_email,
+)
+from .caching import (
+    bump_generations_on_commit,
+    get_or_compute,
+    name_generation_keys,
+    not_modified,
+    phone_generation_key,
+    search_name_cache_key,
+    weak_etag,
+    with_etag,
+)
 from .serializers import UserSerializer, ContactSerializer
-from rest_framework.throttling import UserRateThrottle
-from django.db.models import Case, When, IntegerField, Q
-from django.db.models.functions import TruncDay
-from django.db.models import Count
+from .throttling import SlidingWindowRateThrottle
+from .routers import use_read_replica
+from .metrics import render as render_metrics
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+from django.db.models import Case, When, IntegerField
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.db.models import F, Sum
 
 # Custom Throttling class
-class CustomUserRateThrottle(UserRateThrottle):
-    rate = "10/minute"
+class CustomUserRateThrottle(SlidingWindowRateThrottle):
+    scope = "user"
+
+
+class AutocompleteRateThrottle(SlidingWindowRateThrottle):
+    scope = "autocomplete"
+
+
+# Maximum number of phone numbers accepted by person_detail_batch
+PERSON_DETAIL_BATCH_LIMIT = 2000
+
+# Maximum number of phone numbers accepted by mark_spam_bulk
+SPAM_BULK_LIMIT = 500
+
+# Matches SpamReport.phone_number
+SPAM_PHONE_NUMBER_MAX_LENGTH = 15
+
+# Maximum limit accepted by analytics_top_spam_numbers
+TOP_SPAM_NUMBERS_LIMIT = 100
+
+# Results of a name search whose numbers' spam reports invalidate it; the
+# likelihoods of further results may lag by up to SEARCH_CACHE_TIMEOUT.
+SEARCH_NAME_PHONE_DEPENDENCIES = 50
 
 
 def calculate_spam_likelihood(phone_number):
-    spam_count = SpamReport.objects.filter(phone_number=phone_number).count()
-    total_reports = SpamReport.objects.count()
-    if total_reports == 0:
-        return 0
-    likelihood = (spam_count / total_reports) * 100
-    return min(100, round(likelihood, 2))
+    phone_key = normalize_phone_number(phone_number)
+    return spam_likelihoods([phone_key])[phone_key]
 
 
 # User Registration
@@ -66,21 +111,85 @@ def mark_spam(request):
             {"error": "phone_number is required."}, status=status.HTTP_400_BAD_REQUEST
         )
 
-    # Avoid duplicate spam reports by same user
-    if SpamReport.objects.filter(
-        reporter=request.user, phone_number=phone_number
-    ).exists():
+    if not isinstance(phone_number, str):
         return Response(
-            {"error": "You have already reported this number as spam."},
+            {"error": "phone_number must be a string."}, status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if len(phone_number) > SPAM_PHONE_NUMBER_MAX_LENGTH:
+        return Response(
+            {"error": f"phone_number must be at most {SPAM_PHONE_NUMBER_MAX_LENGTH} characters."},
             status=status.HTTP_400_BAD_REQUEST,
         )
 
-    SpamReport.objects.create(reporter=request.user, phone_number=phone_number)
+    phone_key = normalize_phone_number(phone_number)
+    if not is_dialable(phone_key):
+        return Response(
+            {"error": "phone_number must contain digits."}, status=status.HTTP_400_BAD_REQUEST
+        )
+
+    # Duplicate reports by the same user are ignored by the insert itself
+    if not report_spam(request.user, [phone_number]):
+        return Response(
+            {"error": "You have already reported this number as spam."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    bump_generations_on_commit([phone_generation_key(phone_key)])
     return Response(
         {"message": "Spam reported successfully."}, status=status.HTTP_201_CREATED
     )
 
 
+# Bulk Mark Spam
+@api_view(["POST"])
+@permission_classes([permissions.IsAuthenticated])
+@throttle_classes([CustomUserRateThrottle])
+def mark_spam_bulk(request):
+    """
+    Report a list of phone numbers as spam, e.g. from a call log. Returns
+    which numbers were newly reported and which were already reported by
+    this user.
+    """
+    phone_numbers = request.data.get("phone_numbers")
+    if not isinstance(phone_numbers, list) or not phone_numbers:
+        return Response(
+            {"error": "phone_numbers must be a non-empty list."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if len(phone_numbers) > SPAM_BULK_LIMIT:
+        return Response(
+            {"error": f"At most {SPAM_BULK_LIMIT} phone numbers per request."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if not all(
+        isinstance(phone_number, str)
+        and len(phone_number) <= SPAM_PHONE_NUMBER_MAX_LENGTH
+        and is_dialable(normalize_phone_number(phone_number))
+        for phone_number in phone_numbers
+    ):
+        return Response(
+            {"error": f"phone_numbers must contain strings with digits, of at most {SPAM_PHONE_NUMBER_MAX_LENGTH} characters."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    created = report_spam(request.user, phone_numbers)
+    bump_generations_on_commit([phone_generation_key(phone_key) for phone_key in created])
+
+    # A number listed twice in one request counts as new only the first time.
+    reported, duplicates = [], []
+    for phone_number in phone_numbers:
+        phone_key = normalize_phone_number(phone_number)
+        if phone_key in created:
+            created.discard(phone_key)
+            reported.append(phone_number)
+        else:
+            duplicates.append(phone_number)
+    return Response(
+        {"reported": reported, "duplicates": duplicates},
+        status=status.HTTP_201_CREATED if reported else status.HTTP_200_OK,
+    )
+
+
 # Search by Name View (Global Phonebook: Users + Contacts)
 @api_view(["GET"])
 @permission_classes([permissions.IsAuthenticated])
@@ -90,53 +199,81 @@ def search_by_name(request):
     if not query:
         return Response({"error": "Query parameter is required."}, status=status.HTTP_400_BAD_REQUEST)
     
-    cache_key = f"search_name_{query.lower()}"
-    cached_data = cache.get(cache_key)
-    if cached_data:
-        return Response(cached_data)
-    
-    
-    user_qs = User.objects.filter(Q(username__icontains=query))
-    user_qs = user_qs.annotate(
-        priority=Case(
-            When(username__istartswith=query, then=0),
-            default=1,
-            output_field=IntegerField(),
-        )
-    ).order_by('priority', 'username')
-    
-    contact_qs = Contact.objects.filter(Q(name__icontains=query))
-    contact_qs = contact_qs.annotate(
-        priority=Case(
-            When(name__istartswith=query, then=0),
-            default=1,
-            output_field=IntegerField(),
-        )
-    ).order_by('priority', 'name')
-    
-    # Serialize results
-    results = []
-    
-    for user in user_qs:
-        results.append({
-            "name": user.username,
-            "phone_number": user.phone_number,
-            "spam_likelihood": calculate_spam_likelihood(user.phone_number),
-            "is_registered_user": True,
+    def compute(depend):
+        user_qs = filter_by_name(User.objects.all(), "username", NameTrigram.USER, query)
+        user_qs = user_qs.annotate(
+            priority=Case(
+                When(username__istartswith=query, then=0),
+                default=1,
+                output_field=IntegerField(),
+            )
+        ).order_by('priority', 'username')
+
+        contact_qs = filter_by_name(Contact.objects.all(), "name", NameTrigram.CONTACT, query)
+        contact_qs = contact_qs.annotate(
+            priority=Case(
+                When(name__istartswith=query, then=0),
+                default=1,
+                output_field=IntegerField(),
+            )
+        ).order_by('priority', 'name')
+
+        users = list(user_qs)
+        contacts = list(contact_qs)
+        phone_keys = [user.phone_key for user in users] + [contact.phone_key for contact in contacts]
+        depend({
+            phone_generation_key(phone_key)
+            for phone_key in phone_keys[:SEARCH_NAME_PHONE_DEPENDENCIES]
         })
-    
-    for contact in contact_qs:
-        results.append({
-            "name": contact.name,
-            "phone_number": contact.phone_number,
-            "spam_likelihood": calculate_spam_likelihood(contact.phone_number),
-            "is_registered_user": False,
-        })
-    
-    # Optionally apply pagination here
-    cache.set(cache_key, results, timeout=300)
-    return Response(results)
+        likelihoods = spam_likelihoods(phone_keys)
 
+        # Serialize results
+        results = []
+
+        for user in users:
+            results.append({
+                "name": user.username,
+                "phone_number": user.phone_number,
+                "spam_likelihood": likelihoods[user.phone_key],
+                "is_registered_user": True,
+            })
+
+        for contact in contacts:
+            results.append({
+                "name": contact.name,
+                "phone_number": contact.phone_number,
+                "spam_likelihood": likelihoods[contact.phone_key],
+                "is_registered_user": False,
+            })
+
+        # Optionally apply pagination here
+        return results
+
+    cache_key = search_name_cache_key(query)
+    results, version = get_or_compute(cache_key, name_generation_keys(query), compute)
+    etag = weak_etag(cache_key, version)
+    return not_modified(request, etag) or with_etag(Response(results), etag)
+
+
+
+# Typeahead Autocomplete (Global Phonebook: Users + Contacts)
+@api_view(["GET"])
+@permission_classes([permissions.IsAuthenticated])
+@throttle_classes([AutocompleteRateThrottle])
+def autocomplete(request):
+    """
+    Return the top name prefix matches from the in-process prefix index.
+    """
+    query = request.GET.get("query", "").strip()
+    if not query:
+        return Response({"error": "Query parameter is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        limit = min(int(request.GET.get("limit", 10)), 50)
+    except ValueError:
+        limit = 10
+
+    return Response(prefix_index.search(query, limit=max(limit, 1)))
 
 
 # Search by Phone Number View (Global Phonebook: Users + Contacts)
@@ -151,51 +288,49 @@ def search_by_phone(request):
             status=status.HTTP_400_BAD_REQUEST,
         )
 
-    cache_key = f"search_phone_{phone_query}"
-    cached_data = cache.get(cache_key)
-    if cached_data:
-        return Response(cached_data)
-
-    user = User.objects.filter(phone_number=phone_query).first()
-
-    if user:
-        data = {
-            "name": user.username,
-            "phone_number": user.phone_number,
-            "spam_likelihood": calculate_spam_likelihood(user.phone_number),
-            "email": None,
-            "is_registered_user": True,
-        }
-        # Email visible only if searching user is in user's contacts
-        if Contact.objects.filter(
-            owner=user, phone_number=request.user.phone_number
-        ).exists():
-            data["email"] = user.email
-
-        cache.set(cache_key, data, timeout=300)
-        return Response(data)
-
-    # If no registered user found, look into contacts globally
-    contacts = Contact.objects.filter(phone_number=phone_query).distinct(
-        "name", "phone_number"
-    )
-
-    results = []
-
-    for contact in contacts:
-        results.append(
-            {
-                "name": contact.name,
-                "phone_number": contact.phone_number,
-                "spam_likelihood": calculate_spam_likelihood(contact.phone_number),
-                "email": None,
-                "is_registered_user": False,
+    phone_key = normalize_phone_number(phone_query)
+
+    def compute(depend):
+        user = User.objects.filter(phone_key=phone_key).first()
+
+        if user:
+            # Shared by all callers; with_visible_email drops the email for
+            # callers the user has not saved.
+            return {
+                "user_id": user.pk,
+                "name": user.username,
+                "phone_number": user.phone_number,
+                "spam_likelihood": spam_likelihoods([phone_key])[phone_key],
+                "email": user.email,
+                "is_registered_user": True,
             }
-        )
-
-    cache.set(cache_key, results, timeout=300)
 
-    return Response(results)
+        # If no registered user found, list the names the number is saved
+        # under, most saved first
+        results = []
+        spam_likelihood = spam_likelihoods([phone_key])[phone_key]
+
+        for name in ranked_names(phone_key):
+            results.append(
+                {
+                    "name": name,
+                    "phone_number": phone_key,
+                    "spam_likelihood": spam_likelihood,
+                    "email": None,
+                    "is_registered_user": False,
+                }
+            )
+        return results
+
+    cache_key = f"search_phone_{phone_key}"
+    data, version = get_or_compute(cache_key, [phone_generation_key(phone_key)], compute)
+    saved_by_version = None
+    if isinstance(data, dict):
+        # Email visible only if searching user is in user's contacts
+        owner_ids, saved_by_version = saved_by(request.user.phone_key)
+        data = with_visible_email(data, owner_ids)
+    etag = weak_etag(cache_key, version, request.user.pk, saved_by_version)
+    return not_modified(request, etag) or with_etag(Response(data), etag)
 
 
 # Detail view for a specific phone number (optional but recommended)
@@ -203,100 +338,159 @@ def search_by_phone(request):
 @permission_classes([permissions.IsAuthenticated])
 @throttle_classes([CustomUserRateThrottle])
 def person_detail(request, phone_number):
+    """
+    Resolve one phone number for the caller-ID screen in a single query,
+    or in none when the client's If-None-Match is still current.
+    """
+    phone_key = normalize_phone_number(phone_number)
+    etag = person_detail_etag(phone_key, request.user)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    row = person_detail_query(phone_key, request.user).first()
+    return with_etag(Response(person_detail_payload(phone_number, phone_key, row)), etag)
+
+# Batch caller-ID lookup
+@api_view(["POST"])
+@permission_classes([permissions.IsAuthenticated])
+@throttle_classes([CustomUserRateThrottle])
+def person_detail_batch(request):
+    """
+    Resolve many phone numbers at once, e.g. a call log. Returns one
+    person_detail payload per number, in request order.
+    """
+    phone_numbers = request.data.get("phone_numbers")
+    if not isinstance(phone_numbers, list) or not phone_numbers:
+        return Response(
+            {"error": "phone_numbers must be a non-empty list."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if len(phone_numbers) > PERSON_DETAIL_BATCH_LIMIT:
+        return Response(
+            {"error": f"At most {PERSON_DETAIL_BATCH_LIMIT} phone numbers per request."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if not all(isinstance(phone_number, str) and phone_number.strip() for phone_number in phone_numbers):
+        return Response(
+            {"error": "phone_numbers must contain non-empty strings."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
-    user = User.objects.filter(phone_number=phone_number).first()
-
-    data = {
-        "name": None,
-        "phone_number": phone_number,
-        "spam_likelihood": calculate_spam_likelihood(phone_number),
-        "email": None,
-        "is_registered_user": False,
+    # Duplicates are resolved once and repeated in the response.
+    resolved = {
+        entry["phone_number"]: entry
+        for entry in resolve_phone_numbers(list(dict.fromkeys(phone_numbers)), request.user)
     }
+    return Response([resolved[phone_number] for phone_number in phone_numbers])
 
-    if user:
-        data["name"] = user.username
-        data["is_registered_user"] = True
-
-        # Email visible only if searching user is in user's contacts
-        if Contact.objects.filter(
-            owner=user, phone_number=request.user.phone_number
-        ).exists():
-            data["email"] = user.email
-
-    else:
-        contact_entry = Contact.objects.filter(phone_number=phone_number).first()
-        if contact_entry:
-            data["name"] = contact_entry.name
-
-    return Response(data)
-
-from django.http import HttpResponse
-import csv
+from django.db import router
+from django.http import HttpResponse, StreamingHttpResponse
+from .exports import EXPORT_CHUNK_SIZE, csv_chunks, ndjson_chunks, gzip_chunks
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 @throttle_classes([CustomUserRateThrottle])
+@use_read_replica
 def export_contacts_csv(request):
     """
-    Exports the authenticated user's contacts as a CSV file.
+    Streams the authenticated user's contacts as a CSV file.
+    Pass output=ndjson for newline-delimited JSON and compress=gzip for a
+    gzipped download.
     """
-    contacts = request.user.contacts.all()  # Assuming a related name 'contacts'
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="contacts.csv"'
-    
-    writer = csv.writer(response)
-    # Write header row
-    writer.writerow(['Name', 'Phone Number'])
-    
-    # Write data rows
-    for contact in contacts:
-        writer.writerow([contact.name, contact.phone_number])
-    
+    output = request.GET.get('output', 'csv').lower()
+    compress = request.GET.get('compress', '').lower()
+    if output not in ('csv', 'ndjson'):
+        return Response({'error': 'output must be csv or ndjson.'}, status=status.HTTP_400_BAD_REQUEST)
+    if compress not in ('', 'gzip'):
+        return Response({'error': 'compress must be gzip.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Streaming runs after the view returns, so bind the replica now.
+    rows = (
+        request.user.contacts
+        .using(router.db_for_read(Contact))
+        .order_by('pk')
+        .values_list('name', 'phone_number')
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    if output == 'ndjson':
+        chunks, content_type, filename = ndjson_chunks(rows), 'application/x-ndjson', 'contacts.ndjson'
+    else:
+        chunks, content_type, filename = csv_chunks(rows), 'text/csv', 'contacts.csv'
+    if compress == 'gzip':
+        chunks, content_type, filename = gzip_chunks(chunks), 'application/gzip', f'{filename}.gz'
+
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
     return response
 
 
 from rest_framework.parsers import MultiPartParser
 from rest_framework.decorators import api_view, permission_classes, parser_classes
-import io
+from .imports import import_contacts, iter_csv_rows, ContactImportError
+from .jobs import fail_stale_jobs, submit_import_job
+from .models import ImportJob
+from django.urls import reverse
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 @parser_classes([MultiPartParser])
 def import_contacts_csv(request):
     """
-    Imports contacts from a CSV file uploaded by the user.
-    CSV file should have headers: Name, Phone Number, Email.
+    Imports contacts from a CSV file uploaded by the user in chunked bulk
+    upserts. CSV file should have headers: Name, Phone Number, Email.
+    With background=true the file is queued and a job id is returned.
     """
     file_obj = request.FILES.get('file', None)
     if not file_obj:
         return Response({'error': 'No file uploaded.'}, status=status.HTTP_400_BAD_REQUEST)
-    
+
+    background = request.data.get('background', request.GET.get('background', ''))
+    if str(background).lower() in ('1', 'true', 'yes'):
+        job = submit_import_job(request.user, file_obj)
+        return Response(
+            {
+                'job_id': str(job.id),
+                'status': job.status,
+                'status_url': reverse('import_job_status', args=[job.id]),
+            },
+            status=status.HTTP_202_ACCEPTED,
+        )
+
     try:
-        decoded_file = file_obj.read().decode('utf-8')
-        io_string = io.StringIO(decoded_file)
-        reader = csv.DictReader(io_string)
-    except Exception as e:
-        return Response({'error': 'Failed to read CSV file.'}, status=status.HTTP_400_BAD_REQUEST)
-    
-    contacts_created = 0
-    for row in reader:
-        name = row.get('Name')
-        phone_number = row.get('Phone Number')
-
-        if not name or not phone_number:
-            continue  # Skip invalid rows
-        
-        # Create or update the contact
-        contact, created = Contact.objects.update_or_create(
-            owner=request.user,
-            phone_number=phone_number,
-            defaults={'name': name},
+        result = import_contacts(request.user, iter_csv_rows(file_obj))
+    except ContactImportError as e:
+        return Response(
+            {'error': 'Failed to read CSV file.', **e.result},
+            status=status.HTTP_400_BAD_REQUEST,
         )
-        if created:
-            contacts_created += 1
 
-    return Response({'message': f'{contacts_created} contacts imported successfully.'})
+    return Response({'message': f"{result['created']} contacts imported successfully.", **result})
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def import_job_status(request, job_id):
+    """
+    Report the progress of one of the user's background contact imports.
+    """
+    jobs = ImportJob.objects.filter(id=job_id, owner=request.user)
+    fail_stale_jobs(jobs)
+    job = jobs.first()
+    if job is None:
+        return Response({'error': 'Import job not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+    return Response({
+        'job_id': str(job.id),
+        'status': job.status,
+        'rows_processed': job.rows_processed,
+        'created': job.created_count,
+        'updated': job.updated_count,
+        'skipped': job.skipped_count,
+        'errors': job.errors,
+        'rows_per_second': job.throughput,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+    })
 
 
 
@@ -304,40 +498,118 @@ def import_contacts_csv(request):
 
 @api_view(["GET"])
 @permission_classes([permissions.IsAuthenticated])
+@use_read_replica
 def analytics_top_spam_numbers(request):
     """
-    Return the top spam reported numbers based on the count of reports.
+    Return the top spam reported numbers over the last hour, day, week or
+    all time, from the streaming leaderboard. Counts are estimates that may
+    run high for numbers near the bottom of a long list.
     """
     limit = request.GET.get('limit', 10)
     try:
         limit = int(limit)
     except ValueError:
         limit = 10
+    limit = max(1, min(limit, TOP_SPAM_NUMBERS_LIMIT))
 
-    # Aggregate spam reports by phone number and annotate with the report count.
-    spam_data = (
-        SpamReport.objects
-        .values('phone_number')
-        .annotate(report_count=Count('phone_number'))
-        .order_by('-report_count')[:limit]
-    )
+    window = request.GET.get('window', 'all')
+    if window not in WINDOWS:
+        return Response(
+            {"error": f"window must be one of {', '.join(WINDOWS)}."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
+    spam_data = [
+        {'phone_number': phone_key, 'report_count': report_count}
+        for phone_key, report_count, _ in spam_leaderboard.top(window, limit)
+    ]
     return Response(spam_data, status=status.HTTP_200_OK)
 
 
+# Trend buckets and the rollup rows each one is summed from
+SPAM_TREND_BUCKETS = {
+    "hour": (SpamRollup.HOUR, None),
+    "day": (SpamRollup.DAY, None),
+    "week": (SpamRollup.DAY, TruncWeek),
+    "month": (SpamRollup.DAY, TruncMonth),
+}
 
 
 @api_view(["GET"])
 @permission_classes([permissions.IsAuthenticated])
+@use_read_replica
 def analytics_spam_trends(request):
     """
-    Return daily spam report counts for trend analysis.
+    Return spam report counts per hour, day, week or month for trend
+    analysis, read from the SpamRollup table. Optional start and end dates
+    (YYYY-MM-DD, inclusive) limit the range, and prefix limits it to phone
+    numbers starting with up to five characters, e.g. +9198.
     """
-    trend_data = (
-        SpamReport.objects
-        .annotate(day=TruncDay('created_at'))
-        .values('day')
-        .annotate(report_count=Count('id'))
-        .order_by('day')
+    bucket = request.GET.get("bucket", "day")
+    if bucket not in SPAM_TREND_BUCKETS:
+        return Response(
+            {"error": f"bucket must be one of {', '.join(SPAM_TREND_BUCKETS)}."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    granularity, truncate = SPAM_TREND_BUCKETS[bucket]
+
+    dates = {}
+    for param in ("start", "end"):
+        value = request.GET.get(param)
+        if value:
+            try:
+                dates[param] = datetime.date.fromisoformat(value)
+            except ValueError:
+                return Response(
+                    {"error": f"{param} must be a date (YYYY-MM-DD)."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+    prefix = request.GET.get("prefix", "").strip()
+    if len(prefix) > SpamRollup.PREFIX_LENGTH:
+        return Response(
+            {"error": f"prefix must be at most {SpamRollup.PREFIX_LENGTH} characters."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if prefix and granularity == SpamRollup.HOUR:
+        return Response(
+            {"error": "prefix is not supported with bucket=hour."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    rollups = SpamRollup.objects.filter(granularity=granularity)
+    # Shorter prefixes sum the daily rows of every full-length prefix they start.
+    rollups = rollups.filter(prefix__startswith=prefix) if prefix else rollups.filter(prefix="")
+    utc = datetime.timezone.utc
+    if "start" in dates:
+        rollups = rollups.filter(
+            period_start__gte=datetime.datetime.combine(dates["start"], datetime.time.min, tzinfo=utc)
+        )
+    if "end" in dates:
+        rollups = rollups.filter(
+            period_start__lt=datetime.datetime.combine(
+                dates["end"] + datetime.timedelta(days=1), datetime.time.min, tzinfo=utc
+            )
+        )
+
+    period = truncate("period_start", tzinfo=utc) if truncate else F("period_start")
+    # Evaluated here: the response renders after the view leaves the replica.
+    trend_data = list(
+        rollups.annotate(period=period)
+        .values("period")
+        .annotate(report_count=Sum("report_count"))
+        .order_by("period")
     )
     return Response(trend_data, status=status.HTTP_200_OK)
+
+
+# Prometheus metrics (plain Django view: no JWT, throttling or metrics of its own)
+def metrics_endpoint(request):
+    """
+    Expose this worker's request metrics in the Prometheus text format.
+    Requires "Authorization: Bearer <METRICS_TOKEN>" when METRICS_TOKEN is set.
+    """
+    token = getattr(settings, "METRICS_TOKEN", "")
+    if token and not constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -10,10 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 from datetime import timedelta
 import environ
-from urllib.parse import urlparse
 
 # Initialise environment variables
 env = environ.Env()
@@ -51,10 +52,85 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "base.authentication.CachedJWTAuthentication",
     ],
+    "DEFAULT_THROTTLE_RATES": {
+        "user": "10/minute",
+        "autocomplete": "120/minute",
+    },
 }
 
+# Per-endpoint throttle rates keyed by URL name, e.g. {"search_by_name": "30/minute"}.
+# A listed endpoint gets its own per-user counter; the others share the
+# counter and rate of their throttle's scope above.
+ENDPOINT_THROTTLE_RATES = {}
+
+
+
+# Shared cache for search results and their generations, throttle counters
+# and cached users. It must be shared by all workers (Redis or memcached):
+# with a per-process cache, e.g. locmemcache://, writes only invalidate the
+# searches cached by the worker that made them and every worker enforces
+# its own rate limits.
+CACHES = {
+    "default": env.cache_url("CACHE_URL", default="redis://127.0.0.1:6379/1"),
+}
+
+# The test suite runs in one process and must not need a Redis server, so
+# without CACHE_URL it gets a per-process cache.
+if sys.argv[1:2] == ["test"] and "CACHE_URL" not in os.environ:
+    CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    }
+
+# Region used to read phone numbers entered without a country code
+PHONE_NUMBER_DEFAULT_REGION = "IN"
+
+# Lifetime of cached search results. Writes invalidate them through
+# per-phone-number and per-name-trigram generations, so this can be long.
+SEARCH_CACHE_TIMEOUT = 6 * 60 * 60
+
+# Lifetime of cached "no match" results, e.g. unknown phone numbers
+SEARCH_NEGATIVE_CACHE_TIMEOUT = 60 * 60
+
+# In-memory filter of reported numbers used to skip spam lookups for numbers
+# nobody has reported: how often each worker pulls other workers' reports,
+# how many seconds of recent reports each pull rereads to catch reports
+# that committed out of id order, how often the filter is rebuilt from
+# scratch, and the filter's target false-positive rate
+REPORTED_NUMBERS_REFRESH_SECONDS = 5
+REPORTED_NUMBERS_REFRESH_OVERLAP = 60
+REPORTED_NUMBERS_REBUILD_SECONDS = 60 * 60
+REPORTED_NUMBERS_ERROR_RATE = 0.01
+
+# Lifetime of cached users for JWT authentication, shared and per process.
+# Saving a user invalidates the shared copy at once; other workers' own
+# copies can lag by up to AUTH_USER_LOCAL_CACHE_TIMEOUT.
+AUTH_USER_CACHE_TIMEOUT = 5 * 60
+AUTH_USER_LOCAL_CACHE_TIMEOUT = 5
+
+# Streaming top spam numbers: numbers tracked per time bucket, how long and
+# how many reports each worker buffers before merging them into the shared
+# buckets, and how long a computed leaderboard is cached
+SPAM_LEADERBOARD_CAPACITY = 1000
+SPAM_LEADERBOARD_FLUSH_SECONDS = 10
+SPAM_LEADERBOARD_FLUSH_SIZE = 1000
+SPAM_LEADERBOARD_CACHE_SECONDS = 10
+
+# Fraction of requests whose latency, SQL queries, cache lookups and
+# throttle checks are recorded for /metrics (0 turns recording off), and an
+# optional bearer token required to read /metrics
+METRICS_SAMPLE_RATE = env.float("METRICS_SAMPLE_RATE", default=0.0)
+METRICS_TOKEN = env("METRICS_TOKEN", default="")
+
+# Responses of at least this many bytes are sent Brotli- (if the brotli
+# package is installed) or gzip-compressed to clients that accept it
+COMPRESSION_MIN_LENGTH = 1024
+
+# Seconds before a worker rebuilds its in-memory autocomplete prefix index,
+# and the number of user names and of contact names it holds at most
+AUTOCOMPLETE_INDEX_MAX_AGE = 300
+AUTOCOMPLETE_INDEX_MAX_NAMES = 200_000
 
 
 # JWT settings
@@ -66,6 +142,9 @@ SIMPLE_JWT = {
 }
 
 MIDDLEWARE = [
+    "base.middleware.MetricsMiddleware",
+    "base.middleware.CompressionMiddleware",
+    "base.middleware.ReadYourWritesMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -101,19 +180,40 @@ WSGI_APPLICATION = "trustcall.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-tmpPostgres = urlparse(env("DATABASE_URL"))
+# Connections are kept for DATABASE_CONN_MAX_AGE seconds and checked before
+# reuse in a new request, on every alias
+DATABASE_CONNECTION = {
+    "CONN_MAX_AGE": env.int("DATABASE_CONN_MAX_AGE", default=60),
+    "CONN_HEALTH_CHECKS": True,
+}
 
 DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.postgresql",
-        "NAME": tmpPostgres.path.replace("/", ""),
-        "USER": tmpPostgres.username,
-        "PASSWORD": tmpPostgres.password,
-        "HOST": tmpPostgres.hostname,
-        "PORT": 5432,
-    }
+    "default": {**env.db_url_config(env("DATABASE_URL")), **DATABASE_CONNECTION},
 }
 
+# Read replicas of the default database (comma-separated database URLs,
+# e.g. postgres://... or sqlite:////path/to/copy.sqlite3). Heavy read
+# endpoints query a random healthy replica unless the user wrote within
+# READ_REPLICA_PIN_SECONDS; a replica that fails to connect is skipped for
+# READ_REPLICA_RETRY_SECONDS.
+READ_REPLICA_DATABASES = []
+for index, url in enumerate(env.list("DATABASE_REPLICA_URLS", default=[]), start=1):
+    DATABASES[f"replica{index}"] = {
+        **env.db_url_config(url),
+        **DATABASE_CONNECTION,
+        # Tests read what they wrote through the default connection.
+        "TEST": {"MIRROR": "default"},
+    }
+    READ_REPLICA_DATABASES.append(f"replica{index}")
+# Without configured replicas the test suite gets one mirroring the default
+# database, unused unless a test routes reads to it.
+if sys.argv[1:2] == ["test"] and not READ_REPLICA_DATABASES:
+    DATABASES["replica1"] = {**DATABASES["default"], "TEST": {"MIRROR": "default"}}
+READ_REPLICA_PIN_SECONDS = 5
+READ_REPLICA_RETRY_SECONDS = 30
+
+DATABASE_ROUTERS = ["base.routers.ReadReplicaRouter"]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -152,6 +252,18 @@ USE_TZ = True
 STATIC_URL = "static/"
 
 
+# Uploaded files (background contact imports)
+
+MEDIA_ROOT = BASE_DIR / "media"
+
+# Size of the in-process thread pool running background contact imports
+IMPORT_JOB_WORKERS = 2
+
+# Pending or running imports without progress for this long are marked
+# failed when polled: the worker that ran them was restarted.
+IMPORT_JOB_STALE_SECONDS = 15 * 60
+
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
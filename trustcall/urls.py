@@ -19,6 +19,7 @@ from django.contrib import admin
 from django.urls import path
 from django.urls import include
 from .views import members
+from base.views import metrics_endpoint
 
 from django.conf import settings
 from django.conf.urls.static import static
@@ -27,5 +28,6 @@ urlpatterns = [
     path("", members),
     path("admin/", admin.site.urls),
     path("api/", include("base.urls")),
+    path("metrics", metrics_endpoint, name="metrics"),
 ]
 